@@ -1,5 +1,6 @@
 -- Database Schema for Fintech App Analytics
--- This file documents the structure required for Task 3
+-- This file documents the structure required for Task 3.
+-- It matches what src/database.py creates (ensure_schema) and loads.
 
 -- Table 1: Banks (Dimension Table)
 CREATE TABLE IF NOT EXISTS banks (
@@ -11,16 +12,49 @@ CREATE TABLE IF NOT EXISTS banks (
 -- Table 2: Reviews (Fact Table)
 CREATE TABLE IF NOT EXISTS reviews (
     review_id SERIAL PRIMARY KEY,
-    bank_name VARCHAR(100), -- Foreign key logic handled in app or via join
-    content TEXT,
-    score INT,
-    at TIMESTAMP,
+    bank_id INTEGER REFERENCES banks(bank_id),
+    review_text TEXT,
+    rating INTEGER,
+    review_date TIMESTAMP NOT NULL, -- part of the natural key; undated reviews are not loaded
     sentiment_label VARCHAR(50),
     sentiment_score FLOAT,
     theme VARCHAR(100),
-    source VARCHAR(50) DEFAULT 'Google Play'
+    source VARCHAR(50) DEFAULT 'Google Play',
+    content_hash CHAR(32) -- md5(review_text)
 );
 
--- Index for faster querying by bank and date
-CREATE INDEX idx_reviews_bank ON reviews(bank_name);
-CREATE INDEX idx_reviews_date ON reviews(at);
\ No newline at end of file
+-- A review is the same review if bank, text and timestamp match (the loader upserts on this)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_reviews_natural_key ON reviews (bank_id, content_hash, review_date);
+
+-- Indexes for the real query patterns: per bank by date, and per bank by sentiment
+CREATE INDEX IF NOT EXISTS idx_reviews_bank_date ON reviews (bank_id, review_date);
+CREATE INDEX IF NOT EXISTS idx_reviews_bank_sentiment ON reviews (bank_id, sentiment_label);
+
+-- Daily per-bank rollups (Summary Tables)
+-- Maintained by src/database.py: each load rebuilds only the (bank_id, day) pairs it touched.
+-- NULL labels/themes/ratings are counted as 'UNKNOWN' / 'Unknown' / 0.
+-- Every review has a date, so the rollups add up to the reviews table's totals.
+CREATE TABLE IF NOT EXISTS daily_sentiment (
+    bank_id INTEGER NOT NULL REFERENCES banks(bank_id),
+    day DATE NOT NULL,
+    sentiment_label VARCHAR(50) NOT NULL,
+    review_count INTEGER NOT NULL,
+    PRIMARY KEY (bank_id, day, sentiment_label)
+);
+
+CREATE TABLE IF NOT EXISTS daily_theme (
+    bank_id INTEGER NOT NULL REFERENCES banks(bank_id),
+    day DATE NOT NULL,
+    sentiment_label VARCHAR(50) NOT NULL,
+    theme VARCHAR(100) NOT NULL,
+    review_count INTEGER NOT NULL,
+    PRIMARY KEY (bank_id, day, sentiment_label, theme)
+);
+
+CREATE TABLE IF NOT EXISTS daily_rating (
+    bank_id INTEGER NOT NULL REFERENCES banks(bank_id),
+    day DATE NOT NULL,
+    rating INTEGER NOT NULL,
+    review_count INTEGER NOT NULL,
+    PRIMARY KEY (bank_id, day, rating)
+);
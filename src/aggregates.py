@@ -0,0 +1,100 @@
+import glob
+import hashlib
+import os
+import pandas as pd
+
+from storage import read_reviews
+
+# One row per (bank, sentiment, theme, star rating) with its review count.
+# Every report table and figure is derived from this, never from raw rows.
+CUBE_DIMENSIONS = ['bank_name', 'sentiment_label', 'theme', 'score']
+# Bump when the cube definition changes, to invalidate cached cubes
+CUBE_VERSION = 1
+CACHE_DIR = 'data/cache'
+
+
+def build_cube(df):
+    """Single groupby pass over the reviews. NaN keys are kept so no row is lost."""
+    return (
+        df.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)
+        .size()
+        .rename('count')
+        .reset_index()
+    )
+
+
+def cube_source(path):
+    """Short id of the dataset path, so each dataset (or app shard) keeps its own cached cube."""
+    return hashlib.sha256(os.path.abspath(str(path)).encode()).hexdigest()[:8]
+
+
+def cube_key(path):
+    """
+    Invalidation key: the dataset's files (path, size, mtime) plus the cube definition.
+    """
+    path = os.path.abspath(str(path))
+    files = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, f) for root, _, names in os.walk(path) for f in names
+    )
+    digest = hashlib.sha256(f"v{CUBE_VERSION}|{','.join(CUBE_DIMENSIONS)}".encode())
+    for f in files:
+        stat = os.stat(f)
+        digest.update(f"|{f}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def load_cube(path, cache_dir=CACHE_DIR, refresh=False):
+    """
+    Returns the cube for a reviews dataset, from the disk cache when the dataset hasn't changed.
+    """
+    prefix = f"report_cube_{cube_source(path)}_"
+    cache_file = os.path.join(cache_dir, f"{prefix}{cube_key(path)}.csv")
+    if not refresh and os.path.exists(cache_file):
+        print(f"[INFO] Using cached aggregates: {cache_file}")
+        return pd.read_csv(cache_file)
+
+    cube = build_cube(read_reviews(path, columns=CUBE_DIMENSIONS))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Only older cubes of this same dataset are stale; other datasets' cubes stay valid
+    for stale in glob.glob(os.path.join(cache_dir, f"{prefix}*.csv")):
+        os.remove(stale)
+    cube.to_csv(cache_file, index=False)
+    return cube
+
+
+def sentiment_counts(cube):
+    """Reviews per (bank, sentiment), with the bank total and percentage."""
+    counts = (
+        cube.dropna(subset=['bank_name', 'sentiment_label'])
+        .groupby(['bank_name', 'sentiment_label'], observed=True)['count'].sum()
+        .reset_index()
+    )
+    counts['total'] = counts.groupby('bank_name', observed=True)['count'].transform('sum')
+    counts['percentage'] = counts['count'] / counts['total'] * 100
+    return counts
+
+
+def sentiment_pct_table(cube):
+    """bank x sentiment percentage table (what pd.crosstab(normalize='index') gave)."""
+    return (
+        sentiment_counts(cube)
+        .pivot(index='bank_name', columns='sentiment_label', values='percentage')
+        .fillna(0.0)
+    )
+
+
+def pain_point_counts(cube, sentiment='NEGATIVE'):
+    """Reviews per (bank, theme) for one sentiment, in long form for plotting."""
+    subset = cube[cube['sentiment_label'] == sentiment].dropna(subset=['bank_name', 'theme'])
+    return subset.groupby(['bank_name', 'theme'], observed=True)['count'].sum().reset_index()
+
+
+def pain_point_table(cube, sentiment='NEGATIVE'):
+    """bank x theme count table."""
+    return (
+        pain_point_counts(cube, sentiment)
+        .pivot(index='bank_name', columns='theme', values='count')
+        .fillna(0)
+        .astype(int)
+    )
@@ -1,125 +1,255 @@
 import pandas as pd
 import os
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords
-from transformers import pipeline
-from sklearn.feature_extraction.text import CountVectorizer
+import time
+import argparse
+from functools import lru_cache
 
 # Import from your corrected preprocess file
-from preprocess import clean_text, data_quality_report, clean_dataframe
-
-INPUT_FILE = 'data/raw/raw_reviews.csv'
-OUTPUT_FILE = 'data/processed/analyzed_reviews.csv'
-
-# --- NLTK SETUP (Stable Lemmatization) ---
-print("Setting up NLTK...")
-try:
-    nltk.data.find('corpora/wordnet')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    print("Downloading NLTK data...")
-    nltk.download('wordnet')
-    nltk.download('omw-1.4')
-    nltk.download('stopwords')
-
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words('english'))
-
-def load_and_clean_data():
-    if not os.path.exists(INPUT_FILE):
-        print(f"Error: {INPUT_FILE} not found.")
+from preprocess import clean_text, clean_text_series, data_quality_report, clean_dataframe
+from sentiment import score_texts, score_texts_cached, apply_neutral_band, DEFAULT_BATCH_SIZE, BACKENDS
+from tiered_sentiment import score_tiered
+from themes import assign_themes
+from streaming import iter_clean_chunks, external_sort_csv, DEFAULT_CHUNKSIZE
+from sentiment_cache import SentimentCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES
+from storage import dataset_path, read_reviews, write_reviews, is_parquet
+from registry import shard_key, shard_path
+# NLTK corpora (and the sentiment model) are loaded on first use, not at import
+from resources import get_lemmatizer, get_stopwords
+# Stage timers and counters, one JSON-lines record per run (see metrics.py)
+import metrics
+
+# CSV by default, Parquet datasets with REVIEWS_FORMAT=parquet (see storage.py)
+INPUT_FILE = dataset_path('raw')
+OUTPUT_FILE = dataset_path('processed')
+
+# Review vocabulary is small and repetitive, so each distinct token is
+# lemmatized once and served from a bounded memo afterwards
+LEMMA_CACHE_SIZE = 200_000
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_token(word):
+    return get_lemmatizer().lemmatize(word)
+
+def lemmatize_tokens(words):
+    # Lemmatize (run -> run, running -> run), skipping stopwords
+    stop_words = get_stopwords()
+    return [lemmatize_token(word) for word in words if word not in stop_words]
+
+def lemmatize_text(text):
+    if not isinstance(text, str): return ""
+    # Split text into words
+    return " ".join(lemmatize_tokens(text.split()))
+
+def add_text_features(df, as_tokens=False):
+    # 2. Basic Text Cleaning (vectorized, precompiled patterns)
+    with metrics.stage('clean_text'):
+        df['clean_content'] = clean_text_series(df['content'])
+    
+    # --- REQUIREMENT: DEEP PREPROCESSING (Lemmatization) ---
+    print("Applying NLTK Lemmatization...")
+    with metrics.stage('lemmatize'):
+        tokens = [lemmatize_tokens(words) for words in df['clean_content'].str.split()]
+
+        # We store this in a new column for the theme analysis
+        df['lemmatized_content'] = [" ".join(words) for words in tokens]
+        if as_tokens:
+            # Token arrays for consumers that would only split the string again
+            df['lemmatized_tokens'] = tokens
+    return df
+
+def load_and_clean_data(input_file=INPUT_FILE, as_tokens=False,
+                        near_dup_threshold=None, keep_most_upvoted=False):
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found.")
         return None
     
-    df = pd.read_csv(INPUT_FILE)
+    with metrics.stage('read_input'):
+        df = read_reviews(input_file)
     
     # 1. Use your strict cleaning function
-    df = clean_dataframe(df)
+    with metrics.stage('clean_dataframe'):
+        df = clean_dataframe(df, near_dup_threshold=near_dup_threshold, keep_most_upvoted=keep_most_upvoted)
     data_quality_report(df)
     
-    # 2. Basic Text Cleaning
-    df['clean_content'] = df['content'].apply(clean_text)
-    
-    # --- REQUIREMENT: DEEP PREPROCESSING (Lemmatization) ---
-    print("Applying NLTK Lemmatization...")
-    
-    def lemmatize_text(text):
-        if not isinstance(text, str): return ""
-        # Split text into words
-        words = text.split()
-        # Lemmatize (run -> run, running -> run)
-        lemmas = [lemmatizer.lemmatize(word) for word in words if word not in stop_words]
-        return " ".join(lemmas)
-
-    # We store this in a new column for the theme analysis
-    df['lemmatized_content'] = df['clean_content'].apply(lemmatize_text)
-    
-    return df
+    return add_text_features(df, as_tokens=as_tokens)
 
-def analyze_sentiment(df):
+def analyze_sentiment(df, batch_size=DEFAULT_BATCH_SIZE, cache=None, workers=1, tiered=False, neutral_band=0.0):
     print("Running Sentiment Analysis...")
     try:
-        sentiment_pipeline = pipeline(
-            "sentiment-analysis", 
-            model="distilbert-base-uncased-finetuned-sst-2-english"
-        )
-        
-        def get_sentiment(text):
-            try:
-                # Truncate to 512 tokens to prevent crashes
-                result = sentiment_pipeline(str(text)[:512])[0]
-                return result['label'], result['score']
-            except:
-                return "NEUTRAL", 0.5
-
-        df[['sentiment_label', 'sentiment_score']] = df['content'].apply(
-            lambda x: pd.Series(get_sentiment(x))
-        )
+        # Batched, length-bucketed inference (see sentiment.py)
+        # With a cache, only reviews not scored in a previous run reach the model
+        def score_model(texts):
+            if cache is not None:
+                return score_texts_cached(texts, cache, batch_size=batch_size, workers=workers)
+            return score_texts(texts, batch_size=batch_size, workers=workers)
+
+        start = time.perf_counter()
+        texts = df['content'].tolist()
+        if tiered:
+            # Lexicon + star rating decide the obvious reviews; the rest go to the model
+            labels, scores, routed = score_tiered(texts, df['score'], score_model)
+            print(f"{int(routed.sum())} of {len(df)} reviews ({routed.mean():.1%}) needed the model.")
+        else:
+            labels, scores = score_model(texts)
+        labels = apply_neutral_band(labels, scores, neutral_band)
+        elapsed = time.perf_counter() - start
+
+        # Vectorized write-back instead of one pd.Series per row
+        df['sentiment_label'] = labels
+        df['sentiment_score'] = scores
+
+        rate = len(df) / elapsed if elapsed > 0 else float('inf')
+        print(f"Scored {len(df)} reviews in {elapsed:.1f}s "
+              f"({rate:.1f} reviews/sec, batch size {batch_size}, {workers} worker(s))")
+        if cache is not None:
+            print(cache.summary())
     except Exception as e:
         print(f"Sentiment Model Error: {e}")
     return df
 
-def extract_keywords(df):
+def extract_keywords(df, multi_label=False):
     print("Extracting Themes...")
     
     # --- REQUIREMENT: RICHER CLUSTERING ---
-    # We use the LEMMATIZED column to group similar words together
-    def consistent_theme(text):
-        t = str(text).lower()
-        
-        # Authentication Cluster
-        if any(w in t for w in ['login', 'otp', 'sms', 'code', 'sign', 'account', 'password', 'verify', 'log']): 
-            return "Authentication"
-        
-        # Performance Cluster
-        if any(w in t for w in ['slow', 'stuck', 'load', 'wait', 'connect', 'lag', 'hang', 'freeze']): 
-            return "Performance"
-        
-        # Stability Cluster (Bug/Crash)
-        if any(w in t for w in ['crash', 'close', 'bug', 'error', 'fail', 'shut', 'glitch']): 
-            return "Stability"
-        
-        # Transactions Cluster
-        if any(w in t for w in ['trans', 'pay', 'send', 'telebirr', 'transfer', 'money', 'deposit']): 
-            return "Transactions"
-        
-        # UI/UX Cluster
-        if any(w in t for w in ['ui', 'design', 'interface', 'look', 'color', 'screen', 'easy', 'hard']): 
-            return "User Experience"
-            
-        return "General"
-    
-    df['theme'] = df['lemmatized_content'].apply(consistent_theme)
+    # We use the LEMMATIZED column to group similar words together.
+    # Keyword clusters live in config/themes.json, in priority order
+    # (Authentication > Performance > Stability > Transactions > User Experience > General).
+    df['theme'] = assign_themes(df['lemmatized_content'])
+    if multi_label:
+        # Every matching theme, not just the highest priority one
+        df['themes'] = assign_themes(df['lemmatized_content'], multi_label=True)
     return df
 
+def run_streaming(input_file=INPUT_FILE, output_file=OUTPUT_FILE, chunksize=DEFAULT_CHUNKSIZE,
+                  sort=True, batch_size=DEFAULT_BATCH_SIZE, cache=None, workers=1, multi_label=False,
+                  tiered=False, neutral_band=0.0):
+    """
+    Bounded-memory version of the full analysis.
+    Runs clean -> lemmatize -> sentiment -> theme one chunk at a time and
+    appends each chunk to the output, so memory depends on chunksize, not
+    on the corpus. With sort=True the output is then put in the same
+    newest-first order as the in-memory path with an external merge sort
+    (CSV output only; Parquet output is partitioned, not ordered).
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found.")
+        return None
+
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    sort = sort and not is_parquet(output_file)
+    target = output_file + '.unsorted' if sort else output_file
+
+    stats = {}
+    first = True
+    chunks = iter_clean_chunks(input_file, chunksize, stats)
+    while True:
+        with metrics.stage('read_and_clean'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        print(f"\n--- Chunk of {len(chunk)} reviews ({stats['raw']} read so far) ---")
+        chunk = add_text_features(chunk)
+        with metrics.stage('sentiment'):
+            chunk = analyze_sentiment(chunk, batch_size=batch_size, cache=cache, workers=workers,
+                                      tiered=tiered, neutral_band=neutral_band)
+        with metrics.stage('themes'):
+            chunk = extract_keywords(chunk, multi_label=multi_label)
+        with metrics.stage('write_output'):
+            write_reviews(chunk, target, append=not first)
+        first = False
+
+    print(f"\nRaw data count: {stats['raw']}")
+    print(f"Dropped {stats['missing']} rows with missing values.")
+    print(f"Dropped {stats['duplicates']} duplicate reviews.")
+    print(f"Final clean count: {stats['clean']}")
+
+    if first:
+        print("No reviews left after cleaning; nothing written.")
+        return stats
+
+    if sort:
+        print("Sorting output by date (external merge sort)...")
+        with metrics.stage('external_sort'):
+            external_sort_csv(target, output_file, key='at', descending=True, chunksize=chunksize)
+        os.remove(target)
+    return stats
+
 if __name__ == "__main__":
-    df = load_and_clean_data()
-    if df is not None:
-        df = analyze_sentiment(df)
-        df = extract_keywords(df)
-        
-        os.makedirs('data/processed', exist_ok=True)
-        
-        # Save the file
-        df.to_csv(OUTPUT_FILE, index=False)
-        print(f"Success! Data saved to {OUTPUT_FILE}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean, score and theme the raw reviews.")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Reviews per model forward pass")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Score batches in this many processes (1 = in-process)")
+    parser.add_argument('--multi-label-themes', action='store_true',
+                        help="Also write a 'themes' column with every matching theme")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help="Dataset format for input and output (default: REVIEWS_FORMAT or csv)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Process the raw CSV in chunks with bounded memory")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Rows per chunk in --stream mode")
+    parser.add_argument('--no-sort', action='store_true',
+                        help="In --stream mode, skip the final sort by date")
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                        help="Inference backend (default: SENTIMENT_BACKEND or torch)")
+    parser.add_argument('--offline', action='store_true',
+                        help="Fail fast instead of downloading NLTK data or model files")
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH,
+                        help="SQLite file holding previously scored reviews")
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Cache size cap; least recently used entries are evicted")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Score every review with the model")
+    parser.add_argument('--tiered', action='store_true',
+                        help="Label short, unambiguous reviews from a lexicon + star rating; only the rest reach the model")
+    parser.add_argument('--neutral-band', type=float, default=0.0,
+                        help="Label predictions with confidence below this NEUTRAL (e.g. 0.75; 0 = never)")
+    parser.add_argument('--near-dup-threshold', type=float, default=None,
+                        help="Also drop near-duplicate reviews at this similarity, e.g. 0.8 (not in --stream mode)")
+    parser.add_argument('--keep-most-upvoted', action='store_true',
+                        help="Keep the most upvoted review of each near-duplicate cluster instead of the first")
+    parser.add_argument('--app', default=None,
+                        help="Only this app, reading and writing its own shard (see registry.py)")
+    args = parser.parse_args()
+    try:
+        app = shard_key(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.offline:
+        os.environ['PIPELINE_OFFLINE'] = '1'
+    if args.backend:
+        os.environ['SENTIMENT_BACKEND'] = args.backend
+
+    cache = None if args.no_cache else SentimentCache(args.cache_path, args.cache_max_entries)
+    input_file = shard_path(dataset_path('raw', args.format), app)
+    output_file = shard_path(dataset_path('processed', args.format), app)
+
+    # Stage timings and counters are printed at the end and appended to data/metrics/runs.jsonl
+    with metrics.run('analysis'):
+        if args.stream:
+            if args.near_dup_threshold:
+                print("[WARNING] --near-dup-threshold needs the whole dataset in memory; ignored with --stream.")
+            stats = run_streaming(input_file, output_file, chunksize=args.chunksize, sort=not args.no_sort, batch_size=args.batch_size,
+                                  cache=cache, workers=args.workers, multi_label=args.multi_label_themes,
+                                  tiered=args.tiered, neutral_band=args.neutral_band)
+            if stats:
+                print(f"Success! Data saved to {output_file}")
+            df = None
+        else:
+            df = load_and_clean_data(input_file, near_dup_threshold=args.near_dup_threshold,
+                                     keep_most_upvoted=args.keep_most_upvoted)
+
+        if df is not None:
+            with metrics.stage('sentiment'):
+                df = analyze_sentiment(df, batch_size=args.batch_size, cache=cache, workers=args.workers,
+                                       tiered=args.tiered, neutral_band=args.neutral_band)
+            with metrics.stage('themes'):
+                df = extract_keywords(df, multi_label=args.multi_label_themes)
+
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+            # Save the file
+            with metrics.stage('write_output'):
+                write_reviews(df, output_file)
+            metrics.count('rows_written', len(df))
+            print(f"Success! Data saved to {output_file}")
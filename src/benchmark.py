@@ -0,0 +1,451 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from sentiment import score_texts, MODEL_NAME, DEFAULT_BATCH_SIZE, BACKENDS
+
+RAW_FILE = 'data/raw/raw_reviews.csv'
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmark suite: corpus sizes, where results go, and what counts as a regression
+SUITE_SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+SUITE_DIR = 'reports/benchmarks'
+REGRESSION_THRESHOLD = 0.20  # 20% slower than the baseline fails the run
+MIN_REGRESSION_SECONDS = 0.05  # ...unless the stage is this fast either way (timer noise)
+
+# What importing analysis.py used to do eagerly: pull in NLTK, transformers and
+# sklearn, verify the corpora and build the lemmatizer and stopword set
+EAGER_IMPORT = (
+    "import nltk, transformers, sklearn.feature_extraction.text; import analysis, resources; "
+    "resources.ensure_nltk_data(); resources.get_lemmatizer(); resources.get_stopwords()"
+)
+LAZY_IMPORT = "import analysis"
+
+
+def load_sample_texts(path=RAW_FILE, sample=None, seed=42):
+    """Review texts from the raw dataset, optionally sampled (with replacement past the file size)."""
+    texts = pd.read_csv(path)['content'].dropna().astype(str)
+    if sample:
+        texts = texts.sample(n=sample, replace=sample > len(texts), random_state=seed)
+    return texts.tolist()
+
+
+def bench_workers(args):
+    """
+    Scales sentiment scoring over 1/2/4/8 processes and compares every run with
+    the serial one: labels must match, scores may drift in the last float bits
+    (workers run torch with fewer threads), so the largest difference is shown.
+    """
+    texts = load_sample_texts(args.input, args.sample)
+    print(f"Scoring {len(texts)} reviews (batch size {args.batch_size}, {os.cpu_count()} CPUs)")
+    print(f"{'workers':>8} {'seconds':>9} {'reviews/s':>10} {'speedup':>8} {'labels':>7} {'max |dscore|':>13}")
+
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        labels, scores = score_texts(texts, model_name=args.model, batch_size=args.batch_size, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        if baseline is None:
+            baseline = (elapsed, labels, scores)
+        same_labels = bool((labels == baseline[1]).all())
+        drift = float(np.abs(scores - baseline[2]).max()) if len(scores) else 0.0
+        print(f"{workers:>8} {elapsed:>9.2f} {len(texts) / elapsed:>10.1f} "
+              f"{baseline[0] / elapsed:>7.2f}x {str(same_labels):>7} {drift:>13.2e}")
+
+
+def bench_tiered(args):
+    """Full model vs lexicon/rating fast path + model: model calls, time and agreement."""
+    from tiered_sentiment import score_tiered, agreement_report
+
+    df = pd.read_csv(args.input).dropna(subset=['content', 'score'])
+    if args.sample:
+        df = df.sample(n=args.sample, replace=args.sample > len(df), random_state=42)
+    texts, ratings = df['content'].astype(str).tolist(), df['score']
+
+    def model(batch):
+        return score_texts(batch, model_name=args.model, batch_size=args.batch_size)
+
+    model(texts[:args.batch_size])  # load the model before timing
+    start = time.perf_counter()
+    full_labels, _ = model(texts)
+    full_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    labels, _, routed = score_tiered(texts, ratings, model)
+    tiered_s = time.perf_counter() - start
+
+    report = agreement_report(labels, full_labels, routed)
+    print(f"Reviews: {report['rows']}")
+    print(f"full model   {full_s:>7.2f}s")
+    print(f"tiered       {tiered_s:>7.2f}s ({full_s / max(tiered_s, 1e-9):.1f}x), "
+          f"{report['model_fraction']:.1%} of reviews reached the model")
+    print(f"Agreement with the full model: {report['agreement']:.1%} overall, "
+          f"{report['fast_path_agreement']:.1%} on fast-path rows")
+    print(report['confusion'])
+
+
+def _run_backend(backend, texts, model_name, batch_size, latency_samples):
+    """One backend in a fresh process: load time, single-review latency, throughput, peak RSS."""
+    import resource
+    from sentiment import load_model
+
+    start = time.perf_counter()
+    load_model(model_name, backend=backend)
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:latency_samples]:
+        start = time.perf_counter()
+        score_texts([text], model_name=model_name, batch_size=1, backend=backend)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    labels, _ = score_texts(texts, model_name=model_name, batch_size=batch_size, backend=backend)
+    seconds = time.perf_counter() - start
+    return {
+        'load_s': load_s,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'reviews_per_s': len(texts) / seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KiB on Linux
+        'labels': labels,
+    }
+
+
+def bench_backends(args):
+    """Inference backends on the raw corpus; agreement is against the first backend listed."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    texts = load_sample_texts(args.input, args.sample)
+    print(f"Scoring {len(texts)} reviews per backend (batch size {args.batch_size}); "
+          f"latency is the single-review time over {args.latency_samples} reviews")
+    print(f"{'backend':<10} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'reviews/s':>10} "
+          f"{'peak MB':>8} {'agreement':>10}")
+
+    baseline = None
+    for backend in args.backends:
+        # A fresh process per backend, so load time and peak memory aren't shared
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(_run_backend, backend, texts, args.model, args.batch_size,
+                                 args.latency_samples).result()
+        if baseline is None:
+            baseline = result['labels']
+        agreement = float((result['labels'] == baseline).mean())
+        print(f"{backend:<10} {result['load_s']:>7.2f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['reviews_per_s']:>10.1f} {result['peak_rss_mb']:>8.0f} {agreement:>10.1%}")
+
+
+def stub_scorer(texts):
+    """Stand-in for the model: a cheap deterministic label per text, so the suite times the code around it."""
+    lengths = np.fromiter((len(t) for t in texts), count=len(texts), dtype=np.int64)
+    return np.where(lengths % 2 == 0, 'POSITIVE', 'NEGATIVE').astype(object), np.full(len(texts), 0.9)
+
+
+def _peak_rss_mb():
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def _suite_run(rows, seed, stub, sentiment_sample, model_name):
+    """Every stage on one synthetic corpus, in this (fresh) process. Returns {stage: metrics}."""
+    import tempfile
+    from sqlalchemy import create_engine
+    from synthetic import make_reviews
+    from preprocess import clean_dataframe, clean_text_series
+    from analysis import add_text_features, extract_keywords
+    from aggregates import build_cube, sentiment_pct_table, pain_point_table
+    from database import load_reviews
+    from storage import read_reviews, write_reviews
+
+    stages = {}
+
+    def run(stage, fn, n):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        seconds = time.perf_counter() - start
+        stages[stage] = {'rows': n, 'seconds': seconds, 'rows_per_s': n / seconds if seconds else None,
+                         'peak_rss_mb': _peak_rss_mb()}
+        return result
+
+    raw = run('generate', lambda: make_reviews(rows, seed), rows)
+    df = run('clean_dataframe', lambda: clean_dataframe(raw.copy()), rows)
+    run('clean_text', lambda: clean_text_series(df['content']), len(df))
+    try:
+        df = run('lemmatize', lambda: add_text_features(df), len(df))
+    except (LookupError, OSError, RuntimeError) as e:
+        # NLTK corpora missing (e.g. offline box): time the rest on the cleaned text
+        stages['lemmatize'] = {'skipped': str(e).strip().splitlines()[0]}
+        df['clean_content'] = clean_text_series(df['content'])
+        df['lemmatized_content'] = df['clean_content']
+    df = run('extract_keywords', lambda: extract_keywords(df), len(df))
+
+    texts = df['content'].astype(str).tolist()
+    if stub:
+        labels, scores = run('sentiment', lambda: stub_scorer(texts), len(texts))
+    else:
+        sample = texts[:sentiment_sample]
+        labels, scores = run('sentiment', lambda: score_texts(sample, model_name=model_name), len(sample))
+        labels, scores = np.resize(labels, len(df)), np.resize(scores, len(df))
+    df['sentiment_label'], df['sentiment_score'] = labels, scores
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'reviews.csv')
+        run('csv_write', lambda: write_reviews(df, path), len(df))
+        run('csv_read', lambda: read_reviews(path), len(df))
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'reviews.db')}")
+        run('db_load', lambda: load_reviews(engine, df.copy()), len(df))
+        engine.dispose()
+
+    def report():
+        cube = build_cube(df)
+        return sentiment_pct_table(cube), pain_point_table(cube)
+
+    run('report_aggregation', report, len(df))
+    return stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current, baseline, threshold=REGRESSION_THRESHOLD, min_seconds=MIN_REGRESSION_SECONDS):
+    """(size, stage, baseline s, current s) for every stage more than `threshold` slower than the baseline."""
+    regressions = []
+    for size, stages in current['results'].items():
+        for stage, metrics in stages.items():
+            before = baseline.get('results', {}).get(size, {}).get(stage, {})
+            if 'seconds' not in metrics or 'seconds' not in before:
+                continue
+            if metrics['seconds'] > before['seconds'] * (1 + threshold) and \
+                    metrics['seconds'] - before['seconds'] > min_seconds:
+                regressions.append((size, stage, before['seconds'], metrics['seconds']))
+    return regressions
+
+
+def bench_suite(args):
+    """Times every pipeline stage on synthetic corpora; writes JSON and fails on regressions."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    import platform
+
+    record = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'sentiment': 'stub' if args.stub_model else args.model,
+        'results': {},
+    }
+    for size in args.sizes:
+        print(f"\n=== {size} reviews ===")
+        # A fresh process per size, so peak RSS belongs to that corpus alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            stages = pool.submit(_suite_run, SUITE_SIZES[size], args.seed, args.stub_model,
+                                 args.sentiment_sample, args.model).result()
+        record['results'][size] = stages
+        for stage, m in stages.items():
+            if 'skipped' in m:
+                print(f"{stage:<20} skipped: {m['skipped']}")
+            else:
+                print(f"{stage:<20} {m['seconds']:>8.3f}s {m['rows_per_s'] or 0:>12,.0f} rows/s "
+                      f"{m['peak_rss_mb']:>8.0f} MB peak")
+
+    output = args.output or os.path.join(SUITE_DIR, f"suite_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(record, baseline, args.threshold)
+        for size, stage, before, now in regressions:
+            print(f"[REGRESSION] {size} {stage}: {before:.3f}s -> {now:.3f}s (+{(now / before - 1):.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage regressed more than {args.threshold:.0%} against {args.baseline} "
+              f"(commit {baseline.get('commit')}).")
+
+
+def make_fake_store(reviews_per_app=1000, latency=0.2, failure_rate=0.0, seed=0):
+    """
+    Local stand-in for google_play_scraper.reviews: newest-first pages with
+    simulated network latency and random transient failures.
+    """
+    import random
+    import threading
+    from datetime import datetime, timedelta
+
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    start = datetime(2025, 1, 1)
+
+    def fetch(app_id, lang='en', country='et', sort=None, count=200, continuation_token=None):
+        time.sleep(latency)
+        with lock:
+            failed = rng.random() < failure_rate
+        if failed:
+            raise ConnectionError("simulated transient failure")
+        offset = continuation_token or 0
+        page = [
+            {'reviewId': f"{app_id}-{i}", 'content': f"review {i}", 'score': i % 5 + 1,
+             'at': start - timedelta(minutes=i), 'thumbsUpCount': 0}
+            for i in range(offset, min(offset + count, reviews_per_app))
+        ]
+        return page, offset + len(page)
+
+    return fetch
+
+
+def bench_scrape(args):
+    """Sequential vs concurrent scraping against the fake store."""
+    from scraper import APP_PACKAGES, scrape_all
+
+    fetch = make_fake_store(args.reviews_per_app, args.latency, args.failure_rate)
+    for workers in (1, len(APP_PACKAGES)):
+        start = time.perf_counter()
+        results = scrape_all(APP_PACKAGES, target_count=args.reviews_per_app, fetch=fetch,
+                             workers=workers, rate=args.rate, base_delay=0.05)
+        elapsed = time.perf_counter() - start
+        total = sum(len(df) for df, _ in results.values())
+        print(f"[RESULT] {workers} worker(s): {total} reviews in {elapsed:.2f}s")
+
+
+def _dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def bench_storage(args):
+    """CSV vs partitioned Parquet: size, full load, and a projected NEGATIVE-only load."""
+    import tempfile
+    from storage import read_reviews, write_reviews
+
+    df = read_reviews(args.input)
+    if args.rows and args.rows > len(df):
+        df = df.sample(n=args.rows, replace=True, random_state=42).reset_index(drop=True)
+    print(f"Dataset: {len(df)} rows")
+
+    columns = ['bank_name', 'at', 'content', 'sentiment_label', 'theme']
+    negatives = [('sentiment_label', '==', 'NEGATIVE')]
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, path in (('csv', os.path.join(tmp, 'reviews.csv')),
+                          ('parquet', os.path.join(tmp, 'reviews_parquet'))):
+            start = time.perf_counter()
+            write_reviews(df, path)
+            write_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            full = read_reviews(path)
+            if fmt == 'csv':
+                full['at'] = pd.to_datetime(full['at'])  # Parquet already has typed timestamps
+            full_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            neg = read_reviews(path, columns=columns, filters=negatives)
+            neg_s = time.perf_counter() - start
+
+            print(f"{fmt:<8} size {_dir_size(path) / 1e6:>8.2f} MB | write {write_s:>6.2f}s | "
+                  f"full load {full_s:>6.2f}s | NEGATIVE projection {neg_s:>6.2f}s ({len(neg)} rows)")
+
+
+def time_import(statement, repeat):
+    """Best wall time of running `statement` in a fresh interpreter."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], cwd=SRC_DIR, check=True,
+                       stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_imports(args):
+    """Startup cost of `import analysis` now vs the old eager import-time setup."""
+    baseline = time_import("pass", args.repeat)
+    eager = time_import(EAGER_IMPORT, args.repeat)
+    lazy = time_import(LAZY_IMPORT, args.repeat)
+    print(f"{'interpreter only':<28} {baseline:>7.3f}s")
+    print(f"{'before (eager imports)':<28} {eager:>7.3f}s")
+    print(f"{'after (lazy imports)':<28} {lazy:>7.3f}s")
+    print(f"Import is {eager / lazy:.1f}x faster "
+          f"({(eager - baseline) / max(lazy - baseline, 1e-9):.1f}x excluding interpreter start)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline micro-benchmarks.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('workers', help="Multi-process sentiment scaling")
+    p.add_argument('--input', default=RAW_FILE)
+    p.add_argument('--sample', type=int, default=2000)
+    p.add_argument('--model', default=MODEL_NAME)
+    p.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    p.set_defaults(func=bench_workers)
+
+    p = sub.add_parser('suite', help="Every pipeline stage on synthetic 1k/100k/1M corpora, JSON output")
+    p.add_argument('--sizes', nargs='+', choices=list(SUITE_SIZES), default=list(SUITE_SIZES))
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--stub-model', action='store_true', help="Replace the sentiment model with a stub")
+    p.add_argument('--sentiment-sample', type=int, default=2000,
+                   help="Reviews scored by the real model (it is too slow for the full corpora)")
+    p.add_argument('--model', default=MODEL_NAME)
+    p.add_argument('--output', default=None, help=f"JSON results path (default: {SUITE_DIR}/suite_<time>.json)")
+    p.add_argument('--baseline', default=None, help="Earlier results JSON to compare against")
+    p.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                   help="Fail if a stage is this much slower than the baseline (0.2 = 20%%)")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser('backends', help="torch vs int8 quantized vs ONNX Runtime inference")
+    p.add_argument('--input', default=RAW_FILE)
+    p.add_argument('--sample', type=int, default=None)
+    p.add_argument('--model', default=MODEL_NAME)
+    p.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    p.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    p.add_argument('--latency-samples', type=int, default=50)
+    p.set_defaults(func=bench_backends)
+
+    p = sub.add_parser('tiered', help="Lexicon/rating fast path vs the full model")
+    p.add_argument('--input', default=RAW_FILE)
+    p.add_argument('--sample', type=int, default=None)
+    p.add_argument('--model', default=MODEL_NAME)
+    p.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    p.set_defaults(func=bench_tiered)
+
+    p = sub.add_parser('storage', help="CSV vs Parquet load time and file size")
+    p.add_argument('--input', default='data/processed/analyzed_reviews.csv')
+    p.add_argument('--rows', type=int, default=500_000, help="Resample the input up to this many rows")
+    p.set_defaults(func=bench_storage)
+
+    p = sub.add_parser('imports', help="Import-time cost of analysis.py")
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_imports)
+
+    p = sub.add_parser('scrape', help="Concurrent scraping against a local fake store")
+    p.add_argument('--reviews-per-app', type=int, default=1000)
+    p.add_argument('--latency', type=float, default=0.2, help="Seconds per simulated request")
+    p.add_argument('--failure-rate', type=float, default=0.1)
+    p.add_argument('--rate', type=float, default=10.0, help="Requests per second, per app")
+    p.set_defaults(func=bench_scrape)
+
+    args = parser.parse_args()
+    args.func(args)
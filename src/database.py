@@ -1,116 +1,479 @@
+import argparse
+import hashlib
+import io
+import json
+import time
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import inspect, text, types
 import os
 import logging
-from dotenv import load_dotenv
-
-# 1. SETUP LOGGING
-# We use encoding='utf-8' for the file to handle special characters safely
-# We removed emojis from the console output to prevent Windows crashes
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("pipeline.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-
-# 2. LOAD CONFIGURATION
-load_dotenv()
-
-DB_USER = os.getenv('DB_USER')
-DB_PASS = os.getenv('DB_PASS')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-
-# Check if password loaded correctly
-if not DB_PASS:
-    logging.error("[CRITICAL] DB_PASS not found. Please make sure the .env file is SAVED.")
-    exit()
-
-# 3. CONNECT TO DATABASE
-try:
-    connection_str = f'postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-    engine = create_engine(connection_str)
-    logging.info("[INFO] Database connection established.")
-except Exception as e:
-    logging.critical(f"[CRITICAL] Failed to connect to DB: {e}")
-    exit()
-
-# 4. LOAD DATA
+
+from db import get_engine
+import metrics
+from registry import banks_frame, canonical_banks, shard_key, shard_path
+from storage import dataset_path, read_reviews
+
 current_dir = os.path.dirname(os.path.abspath(__file__))
-csv_path = os.path.join(current_dir, '..', 'data', 'processed', 'analyzed_reviews.csv')
-
-if not os.path.exists(csv_path):
-    csv_path = 'data/processed/analyzed_reviews.csv'
-
-try:
-    df = pd.read_csv(csv_path)
-    logging.info(f"[INFO] Loaded {len(df)} rows from CSV.")
-except FileNotFoundError:
-    logging.error(f"[ERROR] Could not find file at: {csv_path}")
-    exit()
-
-# 5. INSERT BANKS (Dimension Table)
-banks_data = pd.DataFrame({
-    'bank_name': ['Commercial Bank of Ethiopia', 'Bank of Abyssinia', 'Dashen Bank'],
-    'app_name': ['CBE Mobile', 'BoA Mobile', 'Amole'] 
-})
-
-try:
-    banks_data.to_sql('banks', engine, if_exists='append', index=False)
-    logging.info("[SUCCESS] Banks table populated (or already existed).")
-except Exception as e:
-    logging.warning(f"[INFO] Banks table skip: {e}")
-
-# 6. SMART MAPPING LOGIC
-existing_banks = pd.read_sql("SELECT * FROM banks", engine)
-db_map = dict(zip(existing_banks['bank_name'], existing_banks['bank_id']))
-
-custom_map = {
-    'CBE': 'Commercial Bank of Ethiopia',
-    'Commercial Bank of Ethiopia Mobile': 'Commercial Bank of Ethiopia',
-    'CBE Mobile': 'Commercial Bank of Ethiopia',
-    'BOA': 'Bank of Abyssinia',
-    'BoA': 'Bank of Abyssinia',
-    'Bank of Abyssinia Mobile': 'Bank of Abyssinia',
-    'Dashen': 'Dashen Bank',
-    'Amole': 'Dashen Bank',
-    'Dashen Bank Sc': 'Dashen Bank'
+# CSV file or Parquet dataset, depending on REVIEWS_FORMAT
+CSV_PATH = os.path.join(current_dir, '..', dataset_path('processed'))
+
+# Banks dimension rows (bank_name, app_name) from config/apps.json
+BANKS_DATA = banks_frame()
+
+# Columns written to the reviews fact table
+REVIEW_COLUMNS = ['bank_id', 'review_text', 'rating', 'review_date',
+                  'sentiment_label', 'sentiment_score', 'theme', 'source', 'content_hash']
+# A review is the same review if bank, text and timestamp match
+NATURAL_KEY = ['bank_id', 'content_hash', 'review_date']
+# Columns a rerun may refresh on an existing review (e.g. after a model change)
+UPDATABLE_COLUMNS = ['rating', 'sentiment_label', 'sentiment_score', 'theme', 'source']
+# Composite indexes for the (bank, date) and (bank, sentiment) filters reports use
+REVIEW_INDEXES = {
+    'idx_reviews_bank_date': ['bank_id', 'review_date'],
+    'idx_reviews_bank_sentiment': ['bank_id', 'sentiment_label'],
 }
 
-def get_bank_id(row_val):
-    if row_val in db_map:
-        return db_map[row_val]
-    if row_val in custom_map:
-        clean_name = custom_map[row_val]
-        return db_map.get(clean_name)
-    return None
-
-logging.info("[INFO] Mapping bank names...")
-
-if 'bank_name' in df.columns:
-    df['bank_id'] = df['bank_name'].apply(get_bank_id)
-else:
-    logging.error("[CRITICAL] 'bank_name' column missing.")
-    exit()
-
-# 7. CLEAN AND INSERT REVIEWS (Fact Table)
-df = df.rename(columns={
-    'content': 'review_text',  
-    'at': 'review_date',      
-    'score': 'rating'         
-})
-
-df_final = df.dropna(subset=['bank_id'])
-
-cols_to_push = ['bank_id', 'review_text', 'rating', 'review_date', 'sentiment_label', 'sentiment_score', 'source']
-df_final = df_final[[c for c in cols_to_push if c in df_final.columns]]
-
-try:
-    df_final.to_sql('reviews', engine, if_exists='append', index=False)
-    logging.info(f"[SUCCESS] Inserted {len(df_final)} reviews into PostgreSQL.")
-except Exception as e:
-    logging.error(f"[ERROR] Insert Failed: {e}")
\ No newline at end of file
+# Daily per-bank rollups: table -> grouping columns (besides bank_id and day).
+# Reports read these instead of scanning reviews.
+ROLLUPS = {
+    'daily_sentiment': ['sentiment_label'],
+    'daily_theme': ['sentiment_label', 'theme'],
+    'daily_rating': ['rating'],
+}
+# Column type and the value NULLs are counted under
+ROLLUP_DIMENSIONS = {
+    'sentiment_label': ('VARCHAR(50)', "'UNKNOWN'"),
+    'theme': ('VARCHAR(100)', "'Unknown'"),
+    'rating': ('INTEGER', '0'),
+}
+
+COPY_CHUNK_ROWS = 100_000
+# Written after a successful load with the review count it left in the database;
+# `--check` compares it with the live count so the pipeline notices a wiped database
+LOAD_MARKER = os.path.join(current_dir, '..', 'data', 'cache', 'db_load.json')
+
+
+def setup_logging():
+    # We use encoding='utf-8' for the file to handle special characters safely
+    # We removed emojis from the console output to prevent Windows crashes
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("pipeline.log", encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def content_hash(texts):
+    """md5 hex digest of each review text (same value as PostgreSQL's md5())."""
+    return [hashlib.md5(str(t).encode('utf-8')).hexdigest() for t in texts]
+
+
+def _is_postgres(conn):
+    return conn.dialect.name == 'postgresql'
+
+
+def _distinct(conn, left, right):
+    # NULL-safe "values differ" in each dialect
+    if _is_postgres(conn):
+        return f"{left} IS DISTINCT FROM {right}"
+    return f"{left} IS NOT {right}"
+
+
+def ensure_schema(conn):
+    """
+    Creates banks/reviews if needed and the unique natural key the upsert relies on.
+    Tables from older runs (no content_hash) are backfilled and deduplicated first,
+    and undated reviews they hold are removed.
+    """
+    id_type = "SERIAL PRIMARY KEY" if _is_postgres(conn) else "INTEGER PRIMARY KEY"
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS banks (
+            bank_id {id_type},
+            bank_name VARCHAR(100) UNIQUE NOT NULL,
+            app_name VARCHAR(100)
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS reviews (
+            review_id {id_type},
+            bank_id INTEGER REFERENCES banks(bank_id),
+            review_text TEXT,
+            rating INTEGER,
+            review_date TIMESTAMP NOT NULL,
+            sentiment_label VARCHAR(50),
+            sentiment_score FLOAT,
+            theme VARCHAR(100),
+            source VARCHAR(50) DEFAULT 'Google Play',
+            content_hash CHAR(32)
+        )
+    """))
+
+    column_types = {c['name']: c['type'] for c in inspect(conn).get_columns('reviews')}
+    columns = set(column_types)
+    if _is_postgres(conn) and not isinstance(column_types.get('review_date'), types.DateTime):
+        # Tables written by the old pandas to_sql loader keep dates as TEXT, which
+        # PostgreSQL won't compare with the DATE bounds of the rollup refresh
+        logging.info("[INFO] Migrating reviews table: converting review_date to TIMESTAMP...")
+        conn.execute(text(
+            "ALTER TABLE reviews ALTER COLUMN review_date TYPE TIMESTAMP USING review_date::timestamp"
+        ))
+    if 'theme' not in columns:
+        conn.execute(text("ALTER TABLE reviews ADD COLUMN theme VARCHAR(100)"))
+    if 'content_hash' not in columns:
+        logging.info("[INFO] Migrating reviews table: adding content_hash and removing duplicates...")
+        conn.execute(text("ALTER TABLE reviews ADD COLUMN content_hash CHAR(32)"))
+        if _is_postgres(conn):
+            conn.execute(text("UPDATE reviews SET content_hash = md5(review_text)"))
+            conn.execute(text("""
+                DELETE FROM reviews a USING reviews b
+                WHERE a.ctid > b.ctid
+                  AND a.bank_id = b.bank_id
+                  AND a.content_hash = b.content_hash
+                  AND a.review_date IS NOT DISTINCT FROM b.review_date
+            """))
+        else:
+            rows = conn.execute(text("SELECT rowid, review_text FROM reviews")).fetchall()
+            conn.execute(
+                text("UPDATE reviews SET content_hash = :h WHERE rowid = :r"),
+                [{'h': h, 'r': r} for (r, _), h in zip(rows, content_hash(t for _, t in rows))]
+            )
+            conn.execute(text("""
+                DELETE FROM reviews WHERE rowid NOT IN (
+                    SELECT MIN(rowid) FROM reviews GROUP BY bank_id, content_hash, review_date
+                )
+            """))
+
+    # Older loads let undated reviews in (one extra copy per rerun). The rollups have no
+    # day to count them under, so they would make report totals disagree with reviews
+    undated = conn.execute(text("DELETE FROM reviews WHERE review_date IS NULL")).rowcount
+    if undated > 0:
+        logging.info(f"[INFO] Migrating reviews table: removed {undated} reviews without a date.")
+
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_reviews_natural_key ON reviews ({', '.join(NATURAL_KEY)})"
+    ))
+    for name, cols in REVIEW_INDEXES.items():
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON reviews ({', '.join(cols)})"))
+
+    # Rollups created now are built from whatever reviews already exist
+    new_rollups = [t for t in ROLLUPS if not inspect(conn).has_table(t)]
+    for table, dims in ROLLUPS.items():
+        dim_cols = ''.join(f"{d} {ROLLUP_DIMENSIONS[d][0]} NOT NULL, " for d in dims)
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bank_id INTEGER NOT NULL REFERENCES banks(bank_id),
+                day DATE NOT NULL,
+                {dim_cols}review_count INTEGER NOT NULL,
+                PRIMARY KEY (bank_id, day, {', '.join(dims)})
+            )
+        """))
+    if new_rollups:
+        refresh_rollups(conn, tables=new_rollups)
+
+
+def _day(conn, column):
+    # Calendar day of a timestamp, and the day after it
+    if _is_postgres(conn):
+        return f"CAST({column} AS DATE)", f"CAST({column} AS DATE) + 1"
+    return f"DATE({column})", f"DATE({column}, '+1 day')"
+
+
+def refresh_rollups(conn, days_table=None, tables=None):
+    """
+    Recomputes the daily rollups from reviews.
+    With `days_table` (a table of bank_id, day, next_day) only those bank-days are
+    deleted and rebuilt, using the (bank_id, review_date) index; otherwise everything is.
+    """
+    day, _ = _day(conn, 'r.review_date')
+    scope = ''
+    if days_table:
+        scope = (f"JOIN {days_table} t ON t.bank_id = r.bank_id "
+                 f"AND r.review_date >= t.day AND r.review_date < t.next_day")
+
+    for table in tables or ROLLUPS:
+        dims = ROLLUPS[table]
+        if days_table:
+            conn.execute(text(f"""
+                DELETE FROM {table} WHERE EXISTS (
+                    SELECT 1 FROM {days_table} t WHERE t.bank_id = {table}.bank_id AND t.day = {table}.day
+                )
+            """))
+        else:
+            conn.execute(text(f"DELETE FROM {table}"))
+
+        values = ', '.join(f"COALESCE(r.{d}, {ROLLUP_DIMENSIONS[d][1]})" for d in dims)
+        positions = ', '.join(str(i) for i in range(1, len(dims) + 3))
+        conn.execute(text(f"""
+            INSERT INTO {table} (bank_id, day, {', '.join(dims)}, review_count)
+            SELECT r.bank_id, {day}, {values}, COUNT(*)
+            FROM reviews r {scope}
+            WHERE r.review_date IS NOT NULL
+            GROUP BY {positions}
+        """))
+
+
+def collect_touched_days(conn):
+    """
+    Records in rollup_days the (bank_id, day) pairs of the staged reviews the
+    merge will insert or change. Must run before the merge: afterwards staged
+    and stored rows are the same. Rows that are already loaded unchanged
+    don't touch any rollup, so rerunning on the same file refreshes nothing.
+    """
+    day, next_day = _day(conn, 's.review_date')
+    key_match = ' AND '.join(f"r.{c} = s.{c}" for c in NATURAL_KEY)
+    changed = ' OR '.join(_distinct(conn, f"r.{c}", f"s.{c}") for c in UPDATABLE_COLUMNS)
+    select = (f"SELECT DISTINCT s.bank_id, {day} AS day, {next_day} AS next_day "
+              f"FROM reviews_staging s LEFT JOIN reviews r ON {key_match} "
+              f"WHERE s.review_date IS NOT NULL AND (r.bank_id IS NULL OR {changed})")
+    if _is_postgres(conn):
+        conn.execute(text(f"CREATE TEMP TABLE rollup_days ON COMMIT DROP AS {select}"))
+    else:
+        conn.execute(text("DROP TABLE IF EXISTS temp.rollup_days"))
+        conn.execute(text(f"CREATE TEMP TABLE rollup_days AS {select}"))
+
+    return conn.execute(text("SELECT COUNT(*) FROM rollup_days")).scalar()
+
+
+def refresh_touched_rollups(conn):
+    """Rebuilds the rollups for the bank-days recorded by collect_touched_days."""
+    refresh_rollups(conn, days_table='rollup_days')
+    if not _is_postgres(conn):
+        conn.execute(text("DROP TABLE temp.rollup_days"))
+
+
+def upsert_banks(conn, banks_data=BANKS_DATA):
+    """Inserts missing banks; existing ones are left alone, so reruns don't fail or duplicate."""
+    conn.execute(
+        text("INSERT INTO banks (bank_name, app_name) VALUES (:bank_name, :app_name) "
+             "ON CONFLICT (bank_name) DO NOTHING"),
+        banks_data.to_dict('records')
+    )
+
+
+def map_bank_ids(df, conn):
+    """
+    bank_id of each review: names already in the banks table match directly,
+    keys and aliases (CBE, Amole, ...) through the app registry.
+    """
+    existing_banks = pd.read_sql(text("SELECT bank_id, bank_name FROM banks"), conn)
+    db_map = dict(zip(existing_banks['bank_name'], existing_banks['bank_id']))
+    df['bank_id'] = canonical_banks(df['bank_name']).map(db_map)
+    return df
+
+
+def prepare_reviews(df):
+    """Renames CSV columns to the fact table's and adds the content hash. Drops rows without a valid date."""
+    df = df.rename(columns={
+        'content': 'review_text',
+        'at': 'review_date',
+        'score': 'rating'
+    })
+    df = df.dropna(subset=['bank_id']).copy()
+    df['bank_id'] = df['bank_id'].astype(int)
+    # NULLs never collide in the unique natural key, so an undated review would be
+    # inserted again on every rerun; those rows are left out (load_reviews reports them)
+    df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce')
+    df = df[df['review_date'].notna()].copy()
+    df['review_date'] = df['review_date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['content_hash'] = content_hash(df['review_text'])
+    for col in REVIEW_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return df[REVIEW_COLUMNS]
+
+
+def _stage_rows(conn, df):
+    """Fills reviews_staging: COPY FROM STDIN on PostgreSQL, executemany elsewhere."""
+    cols = ', '.join(REVIEW_COLUMNS)
+    if _is_postgres(conn):
+        conn.execute(text(
+            f"CREATE TEMP TABLE reviews_staging ON COMMIT DROP AS SELECT {cols} FROM reviews WITH NO DATA"
+        ))
+        cursor = conn.connection.cursor()
+        for start in range(0, len(df), COPY_CHUNK_ROWS):
+            buffer = io.StringIO()
+            df.iloc[start:start + COPY_CHUNK_ROWS].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY reviews_staging ({cols}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        conn.execute(text("DROP TABLE IF EXISTS temp.reviews_staging"))
+        conn.execute(text(f"CREATE TEMP TABLE reviews_staging AS SELECT {cols} FROM reviews WHERE 0"))
+        marks = ', '.join(f':{c}' for c in REVIEW_COLUMNS)
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+        conn.execute(text(f"INSERT INTO reviews_staging ({cols}) VALUES ({marks})"), records)
+
+
+def bulk_load_reviews(conn, df):
+    """
+    Loads prepared reviews in one transaction: stage them, then merge into reviews
+    with INSERT ... ON CONFLICT on the natural key. Returns inserted/updated/skipped counts.
+    """
+    start = time.perf_counter()
+    staged = df.drop_duplicates(subset=NATURAL_KEY)
+    stats = {'rows': len(df), 'inserted': 0, 'updated': 0, 'skipped': len(df) - len(staged)}
+
+    _stage_rows(conn, staged)
+
+    key_match = ' AND '.join(f"r.{c} = s.{c}" for c in NATURAL_KEY)
+    changed = ' OR '.join(_distinct(conn, f"r.{c}", f"s.{c}") for c in UPDATABLE_COLUMNS)
+    matched, differing = conn.execute(text(f"""
+        SELECT COUNT(*), COALESCE(SUM(CASE WHEN {changed} THEN 1 ELSE 0 END), 0)
+        FROM reviews_staging s JOIN reviews r ON {key_match}
+    """)).one()
+
+    stats['days_refreshed'] = collect_touched_days(conn)
+
+    cols = ', '.join(REVIEW_COLUMNS)
+    updates = ', '.join(f"{c} = excluded.{c}" for c in UPDATABLE_COLUMNS)
+    changed = ' OR '.join(_distinct(conn, f"reviews.{c}", f"excluded.{c}") for c in UPDATABLE_COLUMNS)
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as part of the SELECT
+    conn.execute(text(f"""
+        INSERT INTO reviews ({cols})
+        SELECT {cols} FROM reviews_staging WHERE true
+        ON CONFLICT ({', '.join(NATURAL_KEY)}) DO UPDATE SET {updates}
+        WHERE {changed}
+    """))
+    refresh_touched_rollups(conn)
+    if not _is_postgres(conn):
+        conn.execute(text("DROP TABLE temp.reviews_staging"))
+
+    stats['inserted'] = len(staged) - matched
+    stats['updated'] = int(differing)
+    stats['skipped'] += matched - int(differing)
+    stats['seconds'] = time.perf_counter() - start
+    for key in ('inserted', 'updated', 'skipped'):
+        metrics.count(f'db.rows_{key}', stats[key])
+    return stats
+
+
+def load_reviews(engine, df, banks_data=BANKS_DATA):
+    """Schema, banks, mapping and the bulk merge, all in a single transaction."""
+    with engine.begin() as conn:
+        ensure_schema(conn)
+        upsert_banks(conn, banks_data)
+        logging.info("[SUCCESS] Banks table populated (or already existed).")
+
+        logging.info("[INFO] Mapping bank names...")
+        df = map_bank_ids(df, conn)
+        unmapped = df['bank_id'].isna().sum()
+        if unmapped:
+            logging.warning(f"[WARNING] {unmapped} reviews have an unknown bank and were not loaded.")
+
+        prepared = prepare_reviews(df)
+        undated = int(df['bank_id'].notna().sum()) - len(prepared)
+        if undated:
+            logging.warning(f"[WARNING] {undated} reviews have no valid date and were not loaded.")
+            metrics.count('db.rows_undated', undated)
+
+        return bulk_load_reviews(conn, prepared)
+
+
+def loaded_review_count(conn, bank_names):
+    """Reviews the database holds for these banks (0 if the tables don't exist)."""
+    names = list(bank_names)
+    found = inspect(conn)
+    if not names or not (found.has_table('reviews') and found.has_table('banks')):
+        return 0
+    marks = ', '.join(f':b{i}' for i in range(len(names)))
+    return conn.execute(text(f"""
+        SELECT COUNT(*) FROM reviews r JOIN banks b ON r.bank_id = b.bank_id
+        WHERE b.bank_name IN ({marks})
+    """), {f'b{i}': name for i, name in enumerate(names)}).scalar()
+
+
+def write_load_marker(engine, bank_names, path=LOAD_MARKER):
+    """Records how many reviews the database holds for these banks after a load."""
+    with engine.connect() as conn:
+        reviews = loaded_review_count(conn, bank_names)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'reviews': reviews, 'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S')}, f)
+    return reviews
+
+
+def load_is_current(engine, bank_names, path=LOAD_MARKER):
+    """True if the database still holds the reviews the last load recorded in the marker."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            marker = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    with engine.connect() as conn:
+        return loaded_review_count(conn, bank_names) == marker.get('reviews')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load analyzed reviews into the database.")
+    parser.add_argument('--input', default=CSV_PATH, help="Processed reviews (CSV file or Parquet dataset)")
+    parser.add_argument('--db-url', default=None,
+                        help="SQLAlchemy URL (default: DATABASE_URL, then the DB_* settings in .env)")
+    parser.add_argument('--app', default=None,
+                        help="Only load this app's shard of the processed data (see registry.py)")
+    parser.add_argument('--check', action='store_true',
+                        help="Load nothing; exit 0 if the database still holds the last load, 1 if not")
+    args = parser.parse_args()
+    try:
+        app = shard_key(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    banks = banks_frame([app] if app else None)
+    marker = shard_path(LOAD_MARKER, app)
+
+    if args.check:
+        try:
+            current = load_is_current(get_engine(args.db_url), banks['bank_name'], marker)
+        except Exception as e:
+            print(f"[WARNING] Could not check the database: {e}")
+            current = False
+        print(f"[INFO] Database {'matches' if current else 'does not match'} the last load.")
+        exit(0 if current else 1)
+
+    # 1. SETUP LOGGING
+    setup_logging()
+
+    # 2. CONNECT TO DATABASE
+    try:
+        engine = get_engine(args.db_url)
+        logging.info("[INFO] Database connection established.")
+    except Exception as e:
+        logging.critical(f"[CRITICAL] Failed to connect to DB: {e}")
+        exit(1)
+
+    # 3. LOAD DATA
+    csv_path = shard_path(args.input, app)
+    if not os.path.exists(csv_path):
+        csv_path = shard_path(dataset_path('processed'), app)
+    try:
+        df = read_reviews(csv_path)
+        logging.info(f"[INFO] Loaded {len(df)} rows from {csv_path}.")
+    except FileNotFoundError:
+        logging.error(f"[ERROR] Could not find file at: {csv_path}")
+        exit(1)
+
+    if 'bank_name' not in df.columns:
+        logging.error("[CRITICAL] 'bank_name' column missing.")
+        exit(1)
+
+    # 4. BANKS + REVIEWS (one transaction)
+    try:
+        with metrics.stage('db_load'):
+            stats = load_reviews(engine, df, banks)
+    except Exception as e:
+        logging.error(f"[ERROR] Load Failed (rolled back): {e}")
+        exit(1)
+    write_load_marker(engine, banks['bank_name'], marker)
+
+    rate = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+    logging.info(
+        f"[SUCCESS] Reviews: {stats['inserted']} inserted, {stats['updated']} updated, "
+        f"{stats['skipped']} skipped ({stats['rows']} rows in {stats['seconds']:.2f}s, {rate:.0f} rows/s), "
+        f"{stats['days_refreshed']} bank-days of rollups refreshed."
+    )
+
+
+if __name__ == "__main__":
+    with metrics.run('database'):
+        main()
@@ -0,0 +1,92 @@
+import os
+import threading
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+# Pool settings, overridable from the environment / .env
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 1800  # seconds
+DEFAULT_STATEMENT_TIMEOUT_MS = 0  # 0 = no timeout
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    return value.strip().lower() in ('1', 'true', 'yes') if value not in (None, '') else default
+
+
+def database_url(db_url=None):
+    """
+    db_url, else DATABASE_URL, else PostgreSQL from the DB_* settings in .env.
+    A sqlite:/// URL works for local runs and tests.
+    """
+    load_dotenv()
+    db_url = db_url or os.getenv('DATABASE_URL')
+    if db_url:
+        return db_url
+    if not os.getenv('DB_PASS'):
+        raise RuntimeError("DB_PASS not found. Please make sure the .env file is SAVED.")
+    return (f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASS')}@"
+            f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}")
+
+
+def engine_options(db_url):
+    """
+    create_engine keyword arguments from DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS. SQLite keeps SQLAlchemy's own pool.
+    """
+    options = {'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True)}
+    if db_url.startswith('sqlite'):
+        return options
+
+    options.update(
+        pool_size=_env_int('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+        max_overflow=_env_int('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+        pool_recycle=_env_int('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE),
+    )
+    timeout_ms = _env_int('DB_STATEMENT_TIMEOUT_MS', DEFAULT_STATEMENT_TIMEOUT_MS)
+    if timeout_ms and db_url.startswith('postgresql'):
+        options['connect_args'] = {'options': f"-c statement_timeout={timeout_ms}"}
+    return options
+
+
+def get_engine(db_url=None):
+    """
+    Shared pooled engine for a database URL, created on first use.
+    Every stage (and thread) asking for the same URL gets the same engine and pool.
+    """
+    url = database_url(db_url)
+    engine = _engines.get(url)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(url)
+            if engine is None:
+                engine = _engines[url] = create_engine(url, **engine_options(url))
+    return engine
+
+
+def dispose_engines():
+    """Closes every pooled connection (e.g. at shutdown, or between tests)."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def _reset_pools_in_child():
+    # A forked worker must not reuse the parent's sockets; drop the inherited
+    # connections without closing them and let the child open its own
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_in_child)
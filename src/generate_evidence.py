@@ -1,19 +1,23 @@
-import pandas as pd
+import argparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 
+from aggregates import load_cube, sentiment_counts, sentiment_pct_table, pain_point_counts, pain_point_table
+from storage import dataset_path
+
 # CONFIGURATION
-INPUT_FILE = 'data/processed/analyzed_reviews.csv'
+INPUT_FILE = dataset_path('processed')
 OUTPUT_DIR = 'reports/figures'
 
-def generate_evidence():
+def generate_evidence(input_file=INPUT_FILE, refresh=False):
     # 1. Load Data
-    if not os.path.exists(INPUT_FILE):
-        print(f"ERROR: {INPUT_FILE} not found. Please run 'python src/analysis.py' first.")
+    if not os.path.exists(input_file):
+        print(f"ERROR: {input_file} not found. Please run 'python src/analysis.py' first.")
         return
 
-    df = pd.read_csv(INPUT_FILE)
+    # One aggregation pass (or the cached cube); nothing below touches raw rows
+    cube = load_cube(input_file, refresh=refresh)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     print("\n" + "="*50)
@@ -23,7 +27,7 @@ def generate_evidence():
     # --- TABLE 1: SENTIMENT DISTRIBUTION ---
     print("\n>>> TABLE 1: Sentiment Distribution (%)")
     # Calculate percentages
-    sentiment_pct = pd.crosstab(df['bank_name'], df['sentiment_label'], normalize='index') * 100
+    sentiment_pct = sentiment_pct_table(cube)
     sentiment_pct = sentiment_pct.round(1) # Round to 1 decimal place
     print(sentiment_pct)
 
@@ -31,14 +35,8 @@ def generate_evidence():
     # FIX: Safer calculation method to avoid "ValueError"
     plt.figure(figsize=(8, 5))
     
-    # 1. Count sentiments per bank
-    counts = df.groupby(['bank_name', 'sentiment_label']).size().reset_index(name='count')
-    # 2. Count total reviews per bank
-    totals = df.groupby('bank_name').size().reset_index(name='total')
-    # 3. Merge and calculate percentage
-    df_chart = counts.merge(totals, on='bank_name')
-    df_chart['percentage'] = (df_chart['count'] / df_chart['total']) * 100
-    
+    df_chart = sentiment_counts(cube)
+
     sns.barplot(x='bank_name', y='percentage', hue='sentiment_label', data=df_chart, 
                 palette={'POSITIVE': 'green', 'NEUTRAL': 'gray', 'NEGATIVE': 'red'})
     plt.title('Sentiment Distribution by Bank')
@@ -49,16 +47,15 @@ def generate_evidence():
 
     # --- TABLE 2: TOP PAIN POINTS (Thematic Analysis) ---
     print("\n>>> TABLE 2: Top Pain Points (Negative Reviews Only)")
-    neg_df = df[df['sentiment_label'] == 'NEGATIVE']
-    
-    if not neg_df.empty:
+    neg_counts = pain_point_counts(cube)
+
+    if not neg_counts.empty:
         # Count specific themes per bank
-        pain_points = neg_df.groupby(['bank_name', 'theme']).size().unstack(fill_value=0)
-        print(pain_points)
+        print(pain_point_table(cube))
 
         # --- FIGURE 2: PAIN POINTS CHART ---
         plt.figure(figsize=(10, 6))
-        sns.countplot(x='theme', hue='bank_name', data=neg_df, palette='magma')
+        sns.barplot(x='theme', y='count', hue='bank_name', data=neg_counts, palette='magma')
         plt.title('Key Pain Points (Count of Negative Reviews)')
         plt.xlabel('Theme')
         plt.ylabel('Number of Complaints')
@@ -72,4 +69,9 @@ def generate_evidence():
     print("="*50 + "\n")
 
 if __name__ == "__main__":
-    generate_evidence()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Print report tables and save report figures.")
+    parser.add_argument('--input', default=INPUT_FILE, help="Processed reviews dataset")
+    parser.add_argument('--refresh', action='store_true', help="Rebuild the cached aggregates")
+    args = parser.parse_args()
+
+    generate_evidence(args.input, refresh=args.refresh)
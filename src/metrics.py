@@ -0,0 +1,213 @@
+import argparse
+import functools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# One JSON line per pipeline run (see RunMetrics.record)
+METRICS_FILE = os.getenv('PIPELINE_METRICS_FILE', 'data/metrics/runs.jsonl')
+PROFILE_DIR = 'data/metrics/profiles'
+
+# Stages to run under cProfile: PIPELINE_PROFILE=sentiment,db_load (or "all")
+PROFILE_ENV = 'PIPELINE_PROFILE'
+
+_lock = threading.Lock()
+_active = []  # stack of RunMetrics; stages and counters go to the innermost run
+
+
+def _key(name, labels):
+    # "scrape.pages{bank=CBE}" - labels let one counter be broken down by bank
+    if not labels:
+        return name
+    return name + '{' + ','.join(f"{k}={v}" for k, v in sorted(labels.items())) + '}'
+
+
+class RunMetrics:
+    """
+    Stage timings and counters of one pipeline run, written as a JSON line when it ends.
+    """
+
+    def __init__(self, name, path=METRICS_FILE):
+        self.name = name
+        self.path = path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.status = 'running'
+
+    def add_time(self, stage, seconds):
+        with _lock:
+            entry = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += seconds
+            entry['calls'] += 1
+
+    def count(self, name, n=1, **labels):
+        key = _key(name, labels)
+        with _lock:
+            self.counters[key] = self.counters.get(key, 0) + int(n)
+
+    def record(self):
+        return {
+            'run_id': self.run_id,
+            'name': self.name,
+            'status': self.status,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': round(time.time() - self.started, 4),
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'argv': sys.argv,
+            'stages': {k: {'seconds': round(v['seconds'], 4), 'calls': v['calls']} for k, v in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        line = json.dumps(self.record())
+        with _lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    def report(self):
+        """Prints how long each stage took and its share of the run, then the counters."""
+        total = sum(v['seconds'] for v in self.stages.values())
+        print("\n=== STAGE TIMINGS ===")
+        for stage, entry in self.stages.items():
+            share = (entry['seconds'] / total * 100) if total else 0.0
+            print(f"{stage:<28} {entry['seconds']:>8.2f}s {share:>5.1f}%")
+        print(f"{'total':<28} {total:>8.2f}s")
+        if self.counters:
+            print("--- counters ---")
+            for key, value in sorted(self.counters.items()):
+                print(f"{key:<40} {value:>10}")
+        print("=====================\n")
+
+
+@contextmanager
+def run(name, path=METRICS_FILE, report=True):
+    """
+    Collects the metrics of everything inside the block and appends the run
+    record to `path` at the end (status 'failed' if the block raised).
+    """
+    metrics = RunMetrics(name, path)
+    _active.append(metrics)
+    try:
+        yield metrics
+        metrics.status = 'ok'
+    except BaseException:
+        metrics.status = 'failed'
+        raise
+    finally:
+        _active.remove(metrics)
+        metrics.write()
+        if report:
+            metrics.report()
+
+
+def current_run():
+    """The innermost active run, or None (stages and counters are then no-ops)."""
+    return _active[-1] if _active else None
+
+
+def count(name, n=1, **labels):
+    """Adds n to a counter of the current run, e.g. count('scrape.pages', bank='CBE')."""
+    metrics = current_run()
+    if metrics is not None:
+        metrics.count(name, n, **labels)
+
+
+def _profiling(stage):
+    wanted = os.getenv(PROFILE_ENV, '')
+    return wanted == 'all' or stage in wanted.split(',')
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Times the block as one call of a stage of the current run.
+    If the stage is listed in PIPELINE_PROFILE, it also runs under cProfile and
+    the stats are dumped to data/metrics/profiles/<run_id>_<stage>.prof
+    (for pstats/snakeviz; py-spy can attach to the pid in the run record instead).
+    """
+    key = _key(name, labels)
+    profiler = None
+    if _profiling(name):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        metrics = current_run()
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            run_id = metrics.run_id if metrics else 'norun'
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{run_id}_{key}.prof"))
+        if metrics is not None:
+            metrics.add_time(key, seconds)
+
+
+def timed_stage(name):
+    """Decorator form of stage()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def load_runs(path=METRICS_FILE, last=10, name=None):
+    """The last `last` run records (optionally only runs called `name`), oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    if name:
+        runs = [r for r in runs if r['name'] == name]
+    return runs[-last:]
+
+
+def print_breakdown(runs):
+    """Per-stage seconds (and counters) of each run side by side, one column per run."""
+    if not runs:
+        print("No runs recorded.")
+        return
+    header = f"{'':<32}" + ''.join(f"{r['run_id'][:8]:>12}" for r in runs)
+    print(header)
+    print(f"{'run':<32}" + ''.join(f"{r['name'][:11]:>12}" for r in runs))
+    print(f"{'started':<32}" + ''.join(f"{r['started'][5:16].replace('T', ' '):>12}" for r in runs))
+    print(f"{'status':<32}" + ''.join(f"{r['status']:>12}" for r in runs))
+    print(f"{'total seconds':<32}" + ''.join(f"{r['seconds']:>12.2f}" for r in runs))
+
+    for section, fmt in (('stages', '{:>12.2f}'), ('counters', '{:>12}')):
+        keys = list(dict.fromkeys(k for r in runs for k in r[section]))
+        if keys:
+            print(f"--- {section} ---")
+        for key in keys:
+            cells = []
+            for r in runs:
+                value = r[section].get(key)
+                if section == 'stages' and value is not None:
+                    value = value['seconds']
+                cells.append(fmt.format(value) if value is not None else f"{'-':>12}")
+            print(f"{key[:32]:<32}" + ''.join(cells))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage breakdown of recent pipeline runs.")
+    parser.add_argument('--last', type=int, default=5, help="How many runs to show")
+    parser.add_argument('--name', default=None, help="Only runs of this script (e.g. analysis, scraper)")
+    parser.add_argument('--path', default=METRICS_FILE, help="Metrics JSON-lines file")
+    args = parser.parse_args()
+
+    print_breakdown(load_runs(args.path, args.last, args.name))
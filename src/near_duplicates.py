@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+from preprocess import clean_text_series
+
+SHINGLE_SIZE = 5  # characters per shingle
+NUM_PERM = 64  # MinHash permutations (signature length)
+DEFAULT_THRESHOLD = 0.8  # estimated Jaccard similarity of shingle sets
+MIN_RECALL = 0.99  # chance a pair right at the threshold shares at least one LSH bucket
+CHUNK_DOCS = 20_000  # reviews hashed per chunk, bounds the shingle arrays in memory
+SEED = 42
+
+
+def _shingles(texts, k):
+    """
+    Every character k-gram of every text, packed into one uint64 each (k <= 8),
+    plus the index in that array where each text's k-grams start.
+    clean_text output is plain ASCII, so a text is just its bytes.
+    """
+    lengths = np.array([len(t) for t in texts], dtype=np.int64)
+    data = np.frombuffer(''.join(texts).encode('ascii'), dtype=np.uint8).astype(np.uint64)
+    grams = np.zeros(len(data) - k + 1, dtype=np.uint64)
+    for j in range(k):
+        grams |= data[j:len(data) - k + 1 + j] << np.uint64(8 * j)
+
+    # Keep only the k-grams that start and end inside the same text
+    counts = lengths - k + 1
+    bounds = np.cumsum(counts) - counts
+    text_starts = np.cumsum(lengths) - lengths
+    positions = np.arange(counts.sum()) - np.repeat(bounds - text_starts, counts)
+    return grams[positions], bounds
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, k=SHINGLE_SIZE, seed=SEED, chunk_docs=CHUNK_DOCS):
+    """
+    (len(texts), num_perm) uint32 MinHash signatures over character k-gram sets.
+    Texts shorter than k are padded to one k-gram; texts should be non-empty.
+    Each permutation is a multiply-shift hash; the per-text minimum is one
+    np.minimum.reduceat over the chunk's k-grams.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    shift = np.uint64(32)
+
+    texts = [t.ljust(k) for t in texts]
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), chunk_docs):
+        grams, bounds = _shingles(texts[start:start + chunk_docs], k)
+        for p in range(num_perm):
+            hashed = ((grams * a[p] + b[p]) >> shift).astype(np.uint32)
+            signatures[start:start + len(bounds), p] = np.minimum.reduceat(hashed, bounds)
+    return signatures
+
+
+def lsh_bands(threshold, num_perm=NUM_PERM, min_recall=MIN_RECALL):
+    """
+    (bands, rows) splitting the signature for LSH. A pair with similarity s
+    shares a bucket in at least one band with probability 1 - (1 - s**rows)**bands;
+    this picks the most selective banding that still gives pairs at the
+    threshold that chance of min_recall (16 x 4 for 0.8 with 64 permutations,
+    about 99.98%). Pairs below the threshold are found less often.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if num_perm % rows == 0 and 1 - (1 - threshold ** rows) ** bands >= min_recall:
+            best = (bands, rows)
+    return best
+
+
+def near_duplicate_clusters(texts, groups=None, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM,
+                            k=SHINGLE_SIZE, seed=SEED, priority=None):
+    """
+    Cluster id per text (-1 for empty texts, which are never matched).
+    Texts in the same bucket of any LSH band (and the same group, e.g. bank)
+    become candidates, and candidates whose estimated similarity reaches the
+    threshold are linked. Linked texts are not simply chained together: each
+    cluster's representative is its member with the lowest priority (frame
+    order by default) and only texts similar to the representative itself
+    stay in the cluster. The rest are clustered again in the next round, so
+    A~B and B~C never put A and C in one cluster unless A~C.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    texts = np.asarray(texts, dtype=object)
+    n = len(texts)
+    labels = np.full(n, -1, dtype=np.int64)
+    idx = np.flatnonzero(np.array([len(t) > 0 for t in texts], dtype=bool))
+    if len(idx) == 0:
+        return labels
+
+    # Identical texts ("good app") are hashed once and share a signature
+    codes, uniques = pd.factorize(texts[idx])
+    sig = minhash_signatures(list(uniques), num_perm, k, seed)[codes]
+    group_codes = np.zeros(len(idx), dtype=np.int64) if groups is None else \
+        pd.factorize(np.asarray(groups, dtype=object)[idx])[0]
+    rank = np.arange(n) if priority is None else np.asarray(priority)
+    rank = rank[idx]
+
+    bands, rows = lsh_bands(threshold, num_perm)
+    mult = np.uint64(0x9E3779B97F4A7C15)
+    src, dst = [], []
+    for band in range(bands):
+        # One 64-bit bucket key per (group, band slice); collisions only add
+        # candidates, which the similarity check below filters out
+        keys = group_codes.astype(np.uint64)
+        for col in range(band * rows, (band + 1) * rows):
+            keys = keys * mult + sig[:, col]
+        # Star edges: every member of a bucket to the bucket's first member
+        order = np.argsort(keys, kind='stable')
+        first = np.r_[True, keys[order][1:] != keys[order][:-1]]
+        leaders = order[first][np.cumsum(first) - 1]
+        pair = leaders != order
+        src.append(leaders[pair])
+        dst.append(order[pair])
+
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    similar = (sig[src] == sig[dst]).mean(axis=1) >= threshold
+    src, dst = src[similar], dst[similar]
+
+    # Components of the similarity graph, split so every member is similar to
+    # the representative; members that are not go back for another round
+    local = np.full(len(idx), -1, dtype=np.int64)
+    remaining = np.ones(len(idx), dtype=bool)
+    next_label = 0
+    while remaining.any():
+        live = remaining[src] & remaining[dst]
+        graph = coo_matrix((np.ones(live.sum(), dtype=np.int8), (src[live], dst[live])),
+                           shape=(len(idx), len(idx)))
+        _, components = connected_components(graph, directed=False)
+        nodes = np.flatnonzero(remaining)
+        nodes = nodes[np.lexsort((rank[nodes], components[nodes]))]
+        comp = components[nodes]
+        first = np.r_[True, comp[1:] != comp[:-1]]
+        reps = nodes[first][np.cumsum(first) - 1]
+        accepted = (sig[nodes] == sig[reps]).mean(axis=1) >= threshold
+        local[nodes[accepted]] = next_label + np.cumsum(first)[accepted] - 1
+        remaining[nodes[accepted]] = False
+        next_label += first.sum()
+    labels[idx] = local
+    return labels
+
+
+def near_duplicate_mask(df, threshold=DEFAULT_THRESHOLD, keep_most_upvoted=False,
+                        text_column='content', group_column='bank_name'):
+    """
+    Boolean mask of the rows to keep (one representative per near-duplicate
+    cluster, per bank) and a report of the clusters that lose rows.
+    The representative is the first row in frame order, or with
+    keep_most_upvoted the row with the highest thumbsUpCount.
+    """
+    texts = clean_text_series(df[text_column]).tolist()
+    groups = df[group_column].astype(object).to_numpy() if group_column in df.columns else None
+
+    # Rank rows by how good a representative they make: best first
+    upvotes = np.zeros(len(df))
+    if keep_most_upvoted and 'thumbsUpCount' in df.columns:
+        upvotes = pd.to_numeric(df['thumbsUpCount'], errors='coerce').fillna(0).to_numpy()
+    priority = np.empty(len(df), dtype=np.int64)
+    priority[np.lexsort((np.arange(len(df)), -upvotes))] = np.arange(len(df))
+    labels = near_duplicate_clusters(texts, groups, threshold, priority=priority)
+
+    order = np.lexsort((priority, labels))
+    is_first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+    keep = np.ones(len(df), dtype=bool)
+    keep[order[~is_first & (labels[order] >= 0)]] = False
+
+    clustered = pd.DataFrame({'cluster': labels, 'text': df[text_column].to_numpy()})
+    removed = clustered[~keep].groupby('cluster')['text']
+    report = pd.DataFrame({
+        'size': removed.size() + 1,
+        'kept_text': clustered[keep & (labels >= 0)].groupby('cluster')['text'].first(),
+        'example_removed': removed.first(),
+    }).dropna(subset=['example_removed'])
+    report['size'] = report['size'].astype(int)
+    report = report.sort_values('size', ascending=False, kind='stable').reset_index(drop=True)
+    return keep, report
@@ -2,6 +2,16 @@ import re
 import pandas as pd
 import numpy as np
 
+import metrics
+
+# Python's \s spelled out, so the vectorized path matches exactly the same
+# characters whether pandas runs it through `re` or pyarrow (RE2)
+WHITESPACE_CHARS = '\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000'
+
+# Compiled once instead of on every call
+NON_LETTERS = re.compile(f'[^a-z{WHITESPACE_CHARS}]')
+WHITESPACE = re.compile(f'[{WHITESPACE_CHARS}]+')
+
 def clean_text(text):
     """
     Standardizes text for keyword extraction.
@@ -10,14 +20,25 @@ def clean_text(text):
         return ""
     
     text = str(text).lower()
-    text = re.sub(r'[^a-z\s]', '', text) # Keep only letters
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = NON_LETTERS.sub('', text) # Keep only letters
+    text = WHITESPACE.sub(' ', text).strip()
     return text
 
-def clean_dataframe(df):
+def clean_text_series(texts):
+    """
+    Vectorized clean_text for a whole column (same output, no per-row Python call).
+    """
+    texts = texts.where(texts.notna(), '').astype(str).str.lower()
+    texts = texts.str.replace(NON_LETTERS.pattern, '', regex=True)
+    # Whitespace is collapsed to single spaces first, so stripping ' ' is enough
+    return texts.str.replace(WHITESPACE.pattern, ' ', regex=True).str.strip(' ')
+
+def clean_dataframe(df, near_dup_threshold=None, keep_most_upvoted=False):
     """
     Performs strict data cleaning (Deduplication, Missingness, Dates).
     Addressed Feedback: Explicit cleaning steps.
+    With near_dup_threshold set, near-identical reviews of the same bank
+    ("good app" / "Good app!!") are also collapsed; see near_duplicates.py.
     """
     initial_count = len(df)
     print(f"Raw data count: {initial_count}")
@@ -26,12 +47,27 @@ def clean_dataframe(df):
     # Drop rows where critical info is missing
     df = df.dropna(subset=['content', 'score', 'at'])
     print(f"Dropped {initial_count - len(df)} rows with missing values.")
+    metrics.count('clean.dropped_missing', initial_count - len(df))
 
     # 2. DEDUPLICATION
     # Drop exact duplicates
     before_dedup = len(df)
     df = df.drop_duplicates(subset=['content', 'bank_name'], keep='first')
     print(f"Dropped {before_dedup - len(df)} duplicate reviews.")
+    metrics.count('clean.dropped_duplicates', before_dedup - len(df))
+
+    # Near duplicates (MinHash + LSH over clean_text shingles)
+    if near_dup_threshold:
+        from near_duplicates import near_duplicate_mask
+
+        keep, clusters = near_duplicate_mask(df, near_dup_threshold, keep_most_upvoted)
+        df = df[keep]
+        metrics.count('clean.dropped_near_duplicates', (~keep).sum())
+        print(f"Dropped {(~keep).sum()} near-duplicate reviews in {len(clusters)} clusters "
+              f"(similarity >= {near_dup_threshold}).")
+        if not clusters.empty:
+            print("Largest near-duplicate clusters:")
+            print(clusters.head(10).to_string(index=False))
 
     # 3. STRICT DATE NORMALIZATION
     # Convert 'at' to datetime objects
@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import re
+from functools import lru_cache
+
+from storage import dataset_path, iter_reviews, write_reviews
+
+APPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'apps.json')
+APP_FIELDS = ['key', 'app_id', 'bank', 'app_name']
+# Per-app copies of datasets, caches and reports live under <dir>/apps/<key>/
+SHARD_DIR = 'apps'
+
+
+@lru_cache(maxsize=None)
+def load_apps(path=APPS_FILE):
+    """
+    Loads the app registry: one entry per tracked app with its short key (the
+    bank_name used in the review data), Play Store id, canonical bank name,
+    app name and any other names the bank shows up under.
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    apps, keys = [], set()
+    for app in config['apps']:
+        missing = [field for field in APP_FIELDS if not app.get(field)]
+        if missing:
+            raise ValueError(f"App entry {app} in {path} is missing {', '.join(missing)}")
+        if app['key'] in keys:
+            raise ValueError(f"Duplicate app key '{app['key']}' in {path}")
+        keys.add(app['key'])
+        apps.append(dict(app, aliases=tuple(app.get('aliases', []))))
+    return tuple(apps)
+
+
+@lru_cache(maxsize=None)
+def alias_map(path=APPS_FILE):
+    """{lowercased name: registry entry} for every key, bank, app name, app id and alias."""
+    lookup = {}
+    for app in load_apps(path):
+        for name in (app['key'], app['bank'], app['app_name'], app['app_id']) + app['aliases']:
+            lookup.setdefault(name.strip().lower(), app)
+    return lookup
+
+
+@lru_cache(maxsize=None)
+def name_terms(path=APPS_FILE):
+    """Lowercased words of every key, bank, app name and alias (e.g. for text-mining stopwords)."""
+    words = set()
+    for app in load_apps(path):
+        for name in (app['key'], app['bank'], app['app_name']) + app['aliases']:
+            words.update(re.findall(r'\w\w+', name.lower()))
+    return tuple(sorted(words))
+
+
+def select_apps(keys=None, path=APPS_FILE):
+    """Registry keys for the given keys/aliases (all apps when empty); unknown names raise ValueError."""
+    if not keys:
+        return [app['key'] for app in load_apps(path)]
+    lookup = alias_map(path)
+    unknown = [k for k in keys if k.strip().lower() not in lookup]
+    if unknown:
+        choices = ', '.join(app['key'] for app in load_apps(path))
+        raise ValueError(f"Unknown app '{', '.join(unknown)}'. Choose from: {choices}")
+    return list(dict.fromkeys(lookup[k.strip().lower()]['key'] for k in keys))
+
+
+def shard_key(name):
+    """Registry key for a stage's --app value (None stays None); unknown names raise ValueError."""
+    return select_apps([name])[0] if name else None
+
+
+def app_packages(keys=None, path=APPS_FILE):
+    """{key: Play Store app id}, the scraper's work list."""
+    selected = select_apps(keys, path)
+    return {app['key']: app['app_id'] for app in load_apps(path) if app['key'] in selected}
+
+
+def banks_frame(keys=None, path=APPS_FILE):
+    """Rows for the banks dimension table: bank_name, app_name."""
+    import pandas as pd
+
+    selected = select_apps(keys, path)
+    return pd.DataFrame([{'bank_name': app['bank'], 'app_name': app['app_name']}
+                         for app in load_apps(path) if app['key'] in selected],
+                        columns=['bank_name', 'app_name'])
+
+
+def resolve(names, field='bank', path=APPS_FILE):
+    """
+    Maps a column of bank names (keys, aliases, ...) to a registry field, e.g.
+    'bank' for the canonical bank name or 'key' for the app shard.
+    Each distinct name is looked up once and the result broadcast back with
+    the factorized codes, so the cost is in the number of distinct names.
+    Unknown names (and NaN) come back unchanged.
+    """
+    import numpy as np
+    import pandas as pd
+
+    names = pd.Series(names)
+    codes, uniques = pd.factorize(names)
+    lookup = alias_map(path)
+    mapped = np.array([lookup[u.strip().lower()][field] if isinstance(u, str) and u.strip().lower() in lookup
+                       else u for u in uniques], dtype=object)
+    values = names.to_numpy(dtype=object).copy()
+    known = codes >= 0
+    values[known] = mapped[codes[known]]
+    return pd.Series(values, index=names.index, name=names.name, dtype=object)
+
+
+def canonical_banks(names, path=APPS_FILE):
+    """Canonical bank name of each row (the value stored in the banks table)."""
+    return resolve(names, 'bank', path)
+
+
+def shard_path(path, app=None):
+    """
+    Where the per-app shard of a dataset, cache or report lives, e.g.
+    data/raw/raw_reviews.csv -> data/raw/apps/CBE/raw_reviews.csv.
+    Without an app, the shared path itself.
+    """
+    if not app:
+        return path
+    path = str(path).rstrip('/\\')
+    return os.path.join(os.path.dirname(path), SHARD_DIR, app, os.path.basename(path))
+
+
+def split_dataset(stage='raw', keys=None, chunksize=100_000, path=APPS_FILE):
+    """
+    Copies the shared `stage` dataset into per-app shards, so existing data
+    can be processed per app. Returns {key: rows written}.
+    """
+    selected = select_apps(keys, path)
+    source = dataset_path(stage)
+    written = {key: 0 for key in selected}
+    for chunk in iter_reviews(source, chunksize):
+        apps = resolve(chunk['bank_name'].astype(object), 'key', path).to_numpy()
+        for key in selected:
+            rows = chunk[apps == key]
+            if len(rows):
+                write_reviews(rows, shard_path(source, key), append=written[key] > 0)
+                written[key] += len(rows)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the tracked apps or split a dataset into per-app shards.")
+    parser.add_argument('--split', choices=['raw', 'processed'], default=None,
+                        help="Write a shard of this dataset per app (for running stages with --app)")
+    parser.add_argument('--app', action='append', default=None, help="Only these apps (repeatable)")
+    args = parser.parse_args()
+
+    try:
+        keys = select_apps(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.split:
+        for key, rows in split_dataset(args.split, keys).items():
+            print(f"{key:<10} {rows:>8} rows -> {shard_path(dataset_path(args.split), key)}")
+    else:
+        for app in load_apps():
+            if app['key'] in keys:
+                print(f"{app['key']:<10} {app['app_id']:<35} {app['bank']} ({', '.join(app['aliases'])})")
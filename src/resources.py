@@ -0,0 +1,61 @@
+import os
+from functools import lru_cache
+
+# NLTK data the lemmatization step needs: {resource path: download name}
+NLTK_RESOURCES = {
+    'corpora/wordnet': 'wordnet',
+    'corpora/stopwords': 'stopwords',
+}
+# Downloaded alongside wordnet, as before
+NLTK_EXTRA_DOWNLOADS = ['omw-1.4']
+
+
+def offline_mode():
+    """
+    True when PIPELINE_OFFLINE (or HF_HUB_OFFLINE) is set.
+    In offline mode missing NLTK data or model files raise instead of being downloaded.
+    """
+    return any(
+        os.getenv(var, '').strip().lower() in ('1', 'true', 'yes')
+        for var in ('PIPELINE_OFFLINE', 'HF_HUB_OFFLINE')
+    )
+
+
+@lru_cache(maxsize=None)
+def ensure_nltk_data():
+    """Verifies (and if allowed, downloads) the NLTK corpora once per process."""
+    import nltk
+
+    missing = []
+    for path, package in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(package)
+
+    if missing:
+        if offline_mode():
+            raise RuntimeError(
+                f"NLTK data not found: {', '.join(missing)}. "
+                "Offline mode is on; install it with nltk.download() first."
+            )
+        print("Downloading NLTK data...")
+        for package in missing + NLTK_EXTRA_DOWNLOADS:
+            nltk.download(package)
+    return True
+
+
+@lru_cache(maxsize=None)
+def get_lemmatizer():
+    ensure_nltk_data()
+    from nltk.stem import WordNetLemmatizer
+
+    return WordNetLemmatizer()
+
+
+@lru_cache(maxsize=None)
+def get_stopwords():
+    ensure_nltk_data()
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words('english'))
@@ -0,0 +1,458 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+from registry import shard_key, shard_path
+from storage import dataset_path, read_reviews
+import metrics
+
+INDEX_DIR = 'data/index'
+INDEX_VERSION = 1
+# Columns kept next to the postings so filters never touch the dataset
+CATEGORY_COLUMNS = ['bank_name', 'sentiment_label', 'theme']
+INDEX_COLUMNS = ['review_id', 'lemmatized_content', 'at', 'score'] + CATEGORY_COLUMNS
+# Every add() writes a new postings segment; past this many they are merged into one
+MAX_SEGMENTS = 8
+
+# Phrases, parentheses, a leading '-' (NOT) and words
+QUERY_TOKENS = re.compile(r'"[^"]*"|\(|\)|-(?=\S)|[^\s()"]+')
+
+
+def vbyte_encode(values):
+    """
+    Variable-byte encoding of non-negative integers: 7 bits per byte, least
+    significant group first, high bit set on the last byte of each value.
+    Returns (bytes, bytes per value).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    owner = np.repeat(np.arange(len(values)), nbytes)
+    group = np.arange(nbytes.sum()) - np.repeat(np.cumsum(nbytes) - nbytes, nbytes)
+    out = ((values[owner] >> (7 * group).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    out[group == nbytes[owner] - 1] |= 0x80
+    return out, nbytes
+
+
+def vbyte_decode(data):
+    """Inverse of vbyte_encode, for a run of whole values."""
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data & 0x80)
+    lengths = np.diff(np.r_[-1, ends])
+    values = (data[ends] & 0x7F).astype(np.int64)
+    # Most deltas are one byte; fold in the lower 7-bit groups of the longer ones
+    for k in range(1, lengths.max(initial=1)):
+        longer = lengths > k
+        values[longer] = (values[longer] << 7) | (data[ends[longer] - k] & 0x7F)
+    return values
+
+
+def encode_postings(terms, docs):
+    """
+    One postings segment from (term id, doc id) pairs: each term's sorted doc
+    ids, delta encoded (first id absolute) and vbyte compressed into one blob.
+    """
+    order = np.lexsort((docs, terms))
+    terms, docs = terms[order], docs[order]
+    first = np.r_[True, (terms[1:] != terms[:-1]) | (docs[1:] != docs[:-1])] if len(terms) else np.zeros(0, bool)
+    terms, docs = terms[first], docs[first]
+
+    term_start = np.r_[True, terms[1:] != terms[:-1]] if len(terms) else np.zeros(0, bool)
+    deltas = np.where(term_start, docs, docs - np.r_[0, docs[:-1]])
+    blob, nbytes = vbyte_encode(deltas)
+    starts = np.flatnonzero(term_start)
+    sizes = np.add.reduceat(nbytes, starts) if len(starts) else np.zeros(0, dtype=np.int64)
+    return {
+        'terms': terms[starts].astype(np.int32),
+        'offsets': np.r_[0, np.cumsum(sizes)].astype(np.int64),
+        'blob': blob,
+    }
+
+
+def decode_segment(segment):
+    """All (term id, doc id) pairs of a segment, undoing encode_postings in one pass."""
+    blob, offsets = np.asarray(segment['blob']), np.asarray(segment['offsets'])
+    if not len(blob):
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+    deltas = vbyte_decode(blob)
+    stops = np.cumsum(blob & 0x80 > 0)
+    counts = np.diff(np.r_[0, stops[offsets[1:] - 1]])
+    terms = np.repeat(segment['terms'], counts)
+    # Cumulative sum restarted at every term
+    running = np.cumsum(deltas)
+    term_base = np.repeat(running[np.cumsum(counts) - counts] - deltas[np.cumsum(counts) - counts], counts)
+    return terms, running - term_base
+
+
+def _ranges(starts, lengths):
+    """Concatenated np.arange(start, start + length) for every pair."""
+    return np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+def normalize_terms(words):
+    """
+    Query words in the form lemmatized_content stores them (clean_text,
+    stopwords dropped, lemmatized). Falls back to the cleaned words when the
+    NLTK data isn't available.
+    """
+    from preprocess import clean_text
+
+    words = [w for w in (clean_text(word) for word in words) for w in w.split()]
+    try:
+        from analysis import lemmatize_tokens
+
+        return lemmatize_tokens(words)
+    except (LookupError, OSError, RuntimeError):
+        return words
+
+
+class ReviewIndex:
+    """
+    Inverted index over lemmatized_content with columnar side arrays.
+    - postings: token -> sorted review numbers, delta + vbyte compressed, in
+      segments (one per add(), merged past MAX_SEGMENTS)
+    - tokens / token_offsets: every review's token ids, for phrase checks
+    - side arrays (one entry per review): bank, sentiment and theme codes,
+      day number and star rating, used by the query filters
+    """
+
+    def __init__(self):
+        self.vocab = []
+        self.term_ids = {}
+        self.categories = {col: [] for col in CATEGORY_COLUMNS}
+        self.review_ids = np.zeros(0, dtype='S1')
+        self.columns = {col: np.zeros(0, dtype=np.int16) for col in CATEGORY_COLUMNS}
+        self.columns['day'] = np.zeros(0, dtype=np.int32)
+        self.columns['score'] = np.zeros(0, dtype=np.int8)
+        self.tokens = np.zeros(0, dtype=np.int32)
+        self.token_offsets = np.zeros(1, dtype=np.int64)
+        self.segments = []
+
+    def __len__(self):
+        return len(self.review_ids)
+
+    def _codes(self, col, values):
+        """Category codes for values, extending the category list with new ones (-1 = missing)."""
+        values = pd.Series(values, dtype=object)
+        known = self.categories[col]
+        seen = set(known)
+        known.extend(str(v) for v in pd.unique(values.dropna().astype(str)) if v not in seen)
+        values = values.where(values.isna(), values.astype(str))
+        return pd.Index(known).get_indexer(values).astype(np.int16)
+
+    def _side_columns(self, df):
+        days = pd.to_datetime(df['at'], errors='coerce') if 'at' in df.columns else pd.Series(pd.NaT, index=df.index)
+        day = (days.dt.normalize() - pd.Timestamp('1970-01-01')).dt.days
+        columns = {
+            'day': day.fillna(-1).to_numpy(dtype=np.int32),
+            'score': pd.to_numeric(df.get('score', pd.Series(0, index=df.index)), errors='coerce').fillna(0).to_numpy(dtype=np.int8),
+        }
+        for col in CATEGORY_COLUMNS:
+            columns[col] = self._codes(col, df[col] if col in df.columns else [None] * len(df))
+        return columns
+
+    def add(self, df):
+        """
+        Adds analyzed reviews. Reviews already in the index (same review_id)
+        only get their bank/date/sentiment/theme/rating refreshed; new ones are
+        tokenized and written to a new postings segment.
+        Returns (added, updated).
+        """
+        df = df.drop_duplicates(subset=['review_id'], keep='last')
+        ids = np.array([str(i).encode('utf-8') for i in df['review_id']], dtype=bytes)
+        existing = pd.Index(self.review_ids).get_indexer(ids) if len(self) else np.full(len(ids), -1)
+        side = self._side_columns(df)
+
+        old = existing >= 0
+        for col, values in side.items():
+            if old.any():
+                self.columns[col] = np.array(self.columns[col])
+                self.columns[col][existing[old]] = values[old]
+
+        new = ~old
+        if not new.any():
+            return 0, int(old.sum())
+        base = len(self)
+        texts = df['lemmatized_content'][new].fillna('').astype(str)
+        words = texts.str.split().tolist()
+        lengths = np.array([len(w) for w in words], dtype=np.int64)
+        flat = [w for doc in words for w in doc]
+
+        # Token ids, growing the vocabulary with unseen tokens
+        codes, uniques = pd.factorize(np.array(flat, dtype=object))
+        unique_ids = pd.Index(self.vocab).get_indexer(uniques) if self.vocab else np.full(len(uniques), -1)
+        unseen = unique_ids < 0
+        unique_ids[unseen] = len(self.vocab) + np.arange(unseen.sum())
+        for token in uniques[unseen]:
+            self.term_ids[token] = len(self.vocab)
+            self.vocab.append(token)
+        token_ids = unique_ids[codes].astype(np.int32) if len(flat) else np.zeros(0, dtype=np.int32)
+
+        docs = base + np.repeat(np.arange(new.sum()), lengths)
+        self.segments.append(encode_postings(token_ids, docs))
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+
+        self.tokens = np.concatenate([self.tokens, token_ids])
+        self.token_offsets = np.concatenate([self.token_offsets, self.token_offsets[-1] + np.cumsum(lengths)])
+        self.review_ids = np.concatenate([self.review_ids, ids[new]])
+        for col, values in side.items():
+            self.columns[col] = np.concatenate([self.columns[col], values[new]])
+        return int(new.sum()), int(old.sum())
+
+    def compact(self):
+        """Merges all postings segments into one."""
+        if len(self.segments) > 1:
+            pairs = [decode_segment(s) for s in self.segments]
+            self.segments = [encode_postings(np.concatenate([t for t, _ in pairs]),
+                                             np.concatenate([d for _, d in pairs]))]
+
+    # Set operations on sorted review numbers through a bitmap over all reviews:
+    # linear time, where np.union1d & co. sort or hash the inputs
+    def _bitmap(self, docs):
+        mask = np.zeros(len(self), dtype=bool)
+        mask[docs] = True
+        return mask
+
+    def _union(self, a, b):
+        mask = self._bitmap(a)
+        mask[b] = True
+        return np.flatnonzero(mask)
+
+    def _intersect(self, a, b):
+        return b[self._bitmap(a)[b]]
+
+    def _difference(self, a, b):
+        return a[~self._bitmap(b)[a]]
+
+    def postings(self, term):
+        """Sorted review numbers containing a (normalized) token."""
+        term_id = self.term_ids.get(term)
+        parts = []
+        if term_id is not None:
+            for segment in self.segments:
+                i = np.searchsorted(segment['terms'], term_id)
+                if i < len(segment['terms']) and segment['terms'][i] == term_id:
+                    start, end = segment['offsets'][i], segment['offsets'][i + 1]
+                    parts.append(np.cumsum(vbyte_decode(segment['blob'][start:end])))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def phrase(self, terms):
+        """Reviews containing the tokens consecutively, in order."""
+        if not terms:
+            return self.all_docs()
+        docs = self.postings(terms[0])
+        for term in terms[1:]:
+            docs = self._intersect(docs, self.postings(term))
+        if len(terms) < 2 or not len(docs):
+            return docs
+        # Check every token position of the candidate reviews only
+        starts, ends = self.token_offsets[docs], self.token_offsets[docs + 1]
+        lengths = ends - starts
+        positions = _ranges(starts, lengths)
+        limit = np.repeat(ends, lengths)
+        match = np.ones(len(positions), dtype=bool)
+        for k, term in enumerate(terms):
+            at = positions + k
+            match &= (at < limit) & (self.tokens[np.minimum(at, len(self.tokens) - 1)] == self.term_ids[term])
+        return np.unique(np.repeat(docs, lengths)[match])
+
+    def all_docs(self):
+        return np.arange(len(self), dtype=np.int64)
+
+    def _parse(self, tokens):
+        # expr := and_expr (OR and_expr)* ; and_expr := unary (AND? unary)* ;
+        # unary := (NOT | -) unary | ( expr ) | "phrase" | word
+        def expr():
+            docs = and_expr()
+            while tokens and tokens[0].upper() == 'OR':
+                tokens.pop(0)
+                docs = self._union(docs, and_expr())
+            return docs
+
+        def and_expr():
+            docs = unary()
+            while tokens and tokens[0] != ')' and tokens[0].upper() != 'OR':
+                if tokens[0].upper() == 'AND':
+                    tokens.pop(0)
+                docs = self._intersect(docs, unary())
+            return docs
+
+        def unary():
+            if not tokens:
+                raise ValueError("Query ends where a term was expected")
+            token = tokens.pop(0)
+            if token.upper() == 'NOT' or token == '-':
+                return self._difference(self.all_docs(), unary())
+            if token == '(':
+                docs = expr()
+                if not tokens or tokens.pop(0) != ')':
+                    raise ValueError("Missing ')' in query")
+                return docs
+            # Words that normalize to nothing (stopwords) don't constrain the match
+            return self.phrase(normalize_terms(token.strip('"').split()))
+
+        docs = expr()
+        if tokens:
+            raise ValueError(f"Unexpected '{tokens[0]}' in query")
+        return docs
+
+    def search(self, query='', bank=None, sentiment=None, theme=None, since=None, until=None,
+               days=None, min_score=None, max_score=None):
+        """
+        Review numbers matching a boolean query and filters, in index order.
+        Query syntax: words (implicit AND), AND, OR, NOT / -word, "exact phrase",
+        parentheses. bank / sentiment / theme take a value or a list; since and
+        until are dates; days keeps the reviews of the last `days` days (from today).
+        """
+        docs = self._parse(QUERY_TOKENS.findall(query)) if query.strip() else self.all_docs()
+
+        keep = np.ones(len(docs), dtype=bool)
+        for col, wanted in (('bank_name', bank), ('sentiment_label', sentiment), ('theme', theme)):
+            if wanted is not None:
+                wanted = [wanted] if isinstance(wanted, str) else list(wanted)
+                codes = np.array([i for i, value in enumerate(self.categories[col]) if value in wanted], dtype=np.int16)
+                keep &= np.isin(self.columns[col][docs], codes, kind='table') if len(codes) else False
+        if days is not None:
+            since = pd.Timestamp.today().normalize() - pd.Timedelta(days=days)
+        day = self.columns['day'][docs]
+        if since is not None:
+            keep &= day >= (pd.Timestamp(since) - pd.Timestamp('1970-01-01')).days
+        if until is not None:
+            keep &= (day >= 0) & (day <= (pd.Timestamp(until) - pd.Timestamp('1970-01-01')).days)
+        score = self.columns['score'][docs]
+        if min_score is not None:
+            keep &= score >= min_score
+        if max_score is not None:
+            keep &= score <= max_score
+        return docs[keep]
+
+    def frame(self, docs):
+        """The indexed fields of the given review numbers as a DataFrame."""
+        docs = np.asarray(docs, dtype=np.int64)
+        df = pd.DataFrame({'review_id': [i.decode('utf-8') for i in np.asarray(self.review_ids)[docs]]})
+        for col in CATEGORY_COLUMNS:
+            df[col] = pd.Categorical.from_codes(np.asarray(self.columns[col])[docs], categories=self.categories[col])
+        day = np.asarray(self.columns['day'])[docs]
+        df['date'] = pd.to_datetime(np.where(day >= 0, day, 0), unit='D').where(day >= 0)
+        df['score'] = np.asarray(self.columns['score'])[docs]
+        vocab = np.array(self.vocab, dtype=object)
+        df['lemmatized_content'] = [' '.join(vocab[self.tokens[self.token_offsets[d]:self.token_offsets[d + 1]]])
+                                    for d in docs]
+        return df
+
+    def save(self, path=INDEX_DIR):
+        """Writes the index as .npy arrays plus meta.json, replacing any index at path."""
+        self.compact()
+        segment = self.segments[0] if self.segments else encode_postings(np.zeros(0, np.int32), np.zeros(0, np.int64))
+        tmp_path = path.rstrip('/') + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = {'review_ids': self.review_ids, 'tokens': self.tokens, 'token_offsets': self.token_offsets,
+                  'terms': segment['terms'], 'offsets': segment['offsets'], 'blob': segment['blob'],
+                  **{f"col_{col}": values for col, values in self.columns.items()}}
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), np.asarray(values))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'reviews': len(self), 'vocab': self.vocab,
+                       'categories': self.categories}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_DIR):
+        """Opens a saved index; the large arrays are memory-mapped, not read."""
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Index at {path} has version {meta['version']}, expected {INDEX_VERSION}; rebuild it.")
+
+        def array(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        index = cls()
+        index.vocab = meta['vocab']
+        index.term_ids = {token: i for i, token in enumerate(index.vocab)}
+        index.categories = meta['categories']
+        index.review_ids = array('review_ids')
+        index.tokens = array('tokens')
+        index.token_offsets = array('token_offsets')
+        index.columns = {col: array(f"col_{col}") for col in CATEGORY_COLUMNS + ['day', 'score']}
+        index.segments = [{'terms': np.asarray(array('terms')), 'offsets': np.asarray(array('offsets')),
+                           'blob': array('blob')}]
+        return index
+
+
+def build_index(input_file=dataset_path('processed'), path=INDEX_DIR, rebuild=False):
+    """
+    Indexes the processed reviews. Without rebuild an existing index is
+    updated in place: only review_ids it hasn't seen are tokenized.
+    """
+    index = ReviewIndex() if rebuild or not os.path.exists(os.path.join(path, 'meta.json')) \
+        else ReviewIndex.load(path)
+    with metrics.stage('index_read'):
+        df = read_reviews(input_file)
+    df = df[[c for c in INDEX_COLUMNS if c in df.columns]]
+    with metrics.stage('index_add'):
+        added, updated = index.add(df)
+    with metrics.stage('index_save'):
+        index.save(path)
+    metrics.count('index.added', added)
+    print(f"Indexed {added} new reviews ({updated} refreshed); {len(index)} reviews, "
+          f"{len(index.vocab)} distinct tokens in {path}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the review index.")
+    parser.add_argument('--index-dir', default=INDEX_DIR)
+    parser.add_argument('--app', default=None,
+                        help="Only this app, reading and writing its own shard (see registry.py)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Add new reviews from the processed dataset to the index")
+    build.add_argument('--input', default=dataset_path('processed'))
+    build.add_argument('--rebuild', action='store_true', help="Start from an empty index")
+
+    query = commands.add_parser('query', help='Search, e.g. query "otp OR password" --bank CBE --sentiment NEGATIVE --days 30')
+    query.add_argument('query', nargs='?', default='')
+    query.add_argument('--bank', action='append', default=None)
+    query.add_argument('--sentiment', action='append', default=None)
+    query.add_argument('--theme', action='append', default=None)
+    query.add_argument('--since', default=None, help="YYYY-MM-DD")
+    query.add_argument('--until', default=None, help="YYYY-MM-DD")
+    query.add_argument('--days', type=int, default=None, help="Only the last N days")
+    query.add_argument('--min-score', type=int, default=None)
+    query.add_argument('--max-score', type=int, default=None)
+    query.add_argument('--limit', type=int, default=20, help="Rows to print")
+    args = parser.parse_args()
+    try:
+        app = shard_key(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    index_dir = shard_path(args.index_dir, app)
+
+    if args.command == 'build':
+        with metrics.run('index'):
+            build_index(shard_path(args.input, app), index_dir, args.rebuild)
+    else:
+        index = ReviewIndex.load(index_dir)
+        # Load the NLTK lemmatizer up front so the timing below is the query alone
+        normalize_terms(['reviews'])
+        start = time.perf_counter()
+        docs = index.search(args.query, bank=args.bank, sentiment=args.sentiment, theme=args.theme,
+                            since=args.since, until=args.until, days=args.days,
+                            min_score=args.min_score, max_score=args.max_score)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{len(docs)} of {len(index)} reviews match ({elapsed:.1f} ms)")
+        if len(docs) and args.limit:
+            with pd.option_context('display.max_colwidth', 80, 'display.width', 200):
+                print(index.frame(docs[:args.limit]).to_string(index=False))
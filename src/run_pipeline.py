@@ -0,0 +1,320 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import metrics
+from registry import shard_key, shard_path
+from storage import dataset_path
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_DIR = os.path.join(ROOT, 'src')
+# Last fingerprint of every stage, plus a stat -> sha256 memo for input files
+STATE_FILE = 'data/cache/pipeline_state.json'
+
+# Settings the scripts read from the environment; a change reruns the stages that use them
+CONFIG_ENV = ['REVIEWS_FORMAT', 'SENTIMENT_BACKEND', 'PIPELINE_OFFLINE']
+# Which database a stage talks to (DB_PASS is left out on purpose)
+DB_ENV = ['DATABASE_URL', 'DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER']
+
+# Stages in run order. 'raw' / 'processed' are resolved with storage.dataset_path;
+# other inputs and outputs are paths relative to the repo root.
+# volatile stages (the scraper) can't be fingerprinted and only run when asked for.
+# sharded stages take --app and can run for a single app on its own files (see shard_stages).
+# probe args re-run the script to ask whether outputs outside the repo (the database) are
+# still in place; a non-zero exit reruns the stage even if nothing else changed.
+STAGES = {
+    'scrape': {'script': 'scraper.py', 'args': ['--incremental'], 'deps': [],
+               'inputs': ['config/apps.json'], 'outputs': ['raw'], 'volatile': True, 'sharded': True},
+    'analyze': {'script': 'analysis.py', 'deps': ['scrape'],
+                'inputs': ['raw', 'config/themes.json', 'config/sentiment_lexicon.json'],
+                'outputs': ['processed'], 'sharded': True},
+    'load': {'script': 'database.py', 'deps': ['analyze'], 'inputs': ['processed', 'config/apps.json'],
+             'outputs': ['data/cache/db_load.json'], 'probe': ['--check'], 'env': DB_ENV, 'sharded': True},
+    'verify': {'script': 'verify_db.py', 'deps': ['load'], 'env': DB_ENV},
+    'evidence': {'script': 'generate_evidence.py', 'deps': ['analyze'], 'inputs': ['processed'],
+                 'outputs': ['reports/figures/figure1_sentiment.png']},
+    'index': {'script': 'review_index.py', 'args': ['build'], 'deps': ['analyze'], 'inputs': ['processed'],
+              'outputs': ['data/index'], 'sharded': True},
+    'trends': {'script': 'trends.py', 'deps': ['analyze'], 'inputs': ['processed'],
+               'outputs': ['reports/trend_alerts.csv', 'reports/figures/sentiment_trend.png'], 'sharded': True},
+    'topics': {'script': 'topics.py', 'deps': ['analyze'], 'inputs': ['processed', 'config/themes.json'],
+               'outputs': ['reports/topics.csv', 'reports/theme_suggestions.csv'], 'sharded': True},
+    'charts': {'script': 'visualize.py', 'deps': ['load'], 'env': DB_ENV,
+               'outputs': ['reports/figures/sentiment_distribution.png', 'reports/figures/avg_rating.png']},
+}
+
+
+def resolve(path):
+    if path in ('raw', 'processed'):
+        path = dataset_path(path)
+    return os.path.join(ROOT, path)
+
+
+def shard_stages(stages, app):
+    """
+    The sharded stages, rewritten to run for one app: '--app <key>' is passed
+    to the script and their datasets and outputs become that app's shard
+    (config inputs stay shared). Cross-bank stages (evidence, charts, ...) are left out.
+    """
+    sharded = {}
+    for name, spec in stages.items():
+        if not spec.get('sharded'):
+            continue
+        spec = dict(spec)
+        spec['args'] = ['--app', app] + spec.get('args', [])
+        if spec.get('probe'):
+            spec['probe'] = ['--app', app] + spec['probe']
+        spec['deps'] = [d for d in spec.get('deps', []) if stages[d].get('sharded')]
+        spec['inputs'] = [shard_path(dataset_path(p), app) if p in ('raw', 'processed') else p
+                          for p in spec.get('inputs', [])]
+        spec['outputs'] = [shard_path(dataset_path(p) if p in ('raw', 'processed') else p, app)
+                           for p in spec.get('outputs', [])]
+        sharded[name] = spec
+    return sharded
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_digest(path, memo):
+    """
+    sha256 of a file's content. The hash is kept in `memo` under the file's
+    size and mtime, so unchanged files are never read again.
+    """
+    st = os.stat(path)
+    cached = memo.get(path)
+    if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+        return cached[2]
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    memo[path] = [st.st_size, st.st_mtime_ns, sha.hexdigest()]
+    return memo[path][2]
+
+
+def path_digest(path, memo):
+    """Digest of a file, of every file under a directory (Parquet datasets), or 'missing'."""
+    if os.path.isfile(path):
+        return file_digest(path, memo)
+    if not os.path.isdir(path):
+        return 'missing'
+    sha = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full = os.path.join(dirpath, name)
+            sha.update(os.path.relpath(full, path).encode() + b'\0' + file_digest(full, memo).encode())
+    return sha.hexdigest()
+
+
+def local_modules(script, src_dir=SRC_DIR):
+    """The script plus every module of src/ it imports, directly or through other modules."""
+    seen, todo = set(), [os.path.splitext(script)[0]]
+    while todo:
+        name = todo.pop()
+        path = os.path.join(src_dir, name + '.py')
+        if name in seen or not os.path.exists(path):
+            continue
+        seen.add(name)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                todo.append(node.module.split('.')[0])
+    return sorted(seen)
+
+
+def stage_fingerprint(name, spec, state, memo, src_dir=SRC_DIR):
+    """
+    sha256 over everything a stage's result depends on: the code of its script
+    and the modules it imports, its arguments and environment settings, the
+    content of its input files and the fingerprints of its upstream stages
+    (which is how a database change reaches the stages reading the database).
+    """
+    parts = {
+        'code': {m: file_digest(os.path.join(src_dir, m + '.py'), memo) for m in local_modules(spec['script'], src_dir)},
+        'args': spec.get('args', []),
+        'env': {key: os.getenv(key) for key in CONFIG_ENV + spec.get('env', [])},
+        'inputs': {path: path_digest(resolve(path), memo) for path in spec.get('inputs', [])},
+        'deps': {dep: state['stages'].get(dep, {}).get('fingerprint') for dep in spec.get('deps', [])},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def downstream(stages, start):
+    """`start` and every stage that depends on it, directly or not."""
+    selected = {start}
+    for name, spec in stages.items():  # stages are declared in dependency order
+        if selected & set(spec.get('deps', [])):
+            selected.add(name)
+    return selected
+
+
+def select_stages(stages, only=None, start=None, include_volatile=False):
+    """Stage names to consider, in declaration order."""
+    for name in (only or []) + ([start] if start else []):
+        if name not in stages:
+            raise ValueError(f"Unknown stage '{name}'. Choose from: {', '.join(stages)}")
+    if only:
+        selected = set(only)
+    elif start:
+        selected = downstream(stages, start)
+    else:
+        selected = {name for name, spec in stages.items() if include_volatile or not spec.get('volatile')}
+    return [name for name in stages if name in selected]
+
+
+def run_script(name, spec):
+    """Runs one stage script from the repo root, streaming its output prefixed with the stage name."""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    cmd = [sys.executable, os.path.join(SRC_DIR, spec['script'])] + spec.get('args', [])
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, errors='replace')
+    for line in proc.stdout:
+        print(f"[{name}] {line}", end='', flush=True)
+    return proc.wait()
+
+
+def probe_script(name, spec):
+    """Runs a stage's probe (its script with the probe args) quietly; 0 means its outputs are in place."""
+    cmd = [sys.executable, os.path.join(SRC_DIR, spec['script'])] + spec['probe']
+    return subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, errors='replace').returncode
+
+
+def run_pipeline(stages=STAGES, selected=None, state_path=STATE_FILE, force=False, jobs=None,
+                 dry_run=False, runner=run_script, src_dir=SRC_DIR, prober=probe_script):
+    """
+    Runs the selected stages as a DAG: a stage starts as soon as the selected
+    stages it depends on have finished, independent stages run concurrently,
+    and a stage whose fingerprint matches its last successful run (and whose
+    outputs still exist, and whose probe, if any, passes) is skipped.
+    Returns {stage: 'ran' | 'skipped' | 'failed' | 'blocked'}.
+    """
+    selected = selected or select_stages(stages)
+    state = load_state(state_path)
+    memo = state.setdefault('files', {})
+    state.setdefault('stages', {})
+    lock = threading.Lock()
+    results = {}
+
+    def needs_run(name):
+        spec = stages[name]
+        fingerprint = stage_fingerprint(name, spec, state, memo, src_dir)
+        previous = state['stages'].get(name, {})
+        outputs_exist = all(os.path.exists(resolve(p)) for p in spec.get('outputs', []))
+        unchanged = previous.get('fingerprint') == fingerprint and outputs_exist
+        return force or spec.get('volatile') or not unchanged, fingerprint
+
+    def execute(name, fingerprint):
+        with metrics.stage(name):
+            code = runner(name, stages[name])
+        with lock:
+            # A failed stage has no valid result to reuse
+            if code == 0:
+                state['stages'][name] = {'fingerprint': fingerprint}
+            else:
+                state['stages'].pop(name, None)
+            save_state(state, state_path)
+        return code
+
+    pending = list(selected)
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs or len(selected) or 1) as executor:
+        while pending or running:
+            for name in list(pending):
+                deps = [d for d in stages[name].get('deps', []) if d in selected]
+                if any(results.get(d) in ('failed', 'blocked') for d in deps):
+                    results[name] = 'blocked'
+                    pending.remove(name)
+                    print(f"[{name}] not run: an upstream stage failed")
+                elif all(d in results for d in deps):
+                    pending.remove(name)
+                    with lock:
+                        run, fingerprint = needs_run(name)
+                    # A dry run can't know the new upstream outputs, so assume they change
+                    run = run or (dry_run and any(results[d] == 'ran' for d in deps))
+                    if not run and stages[name].get('probe') and prober(name, stages[name]) != 0:
+                        print(f"[{name}] outputs no longer in place")
+                        run = True
+                    if not run:
+                        results[name] = 'skipped'
+                        print(f"[{name}] up to date, skipped")
+                    elif dry_run:
+                        results[name] = 'ran'
+                        print(f"[{name}] would run")
+                    else:
+                        print(f"[{name}] running {stages[name]['script']}")
+                        running[executor.submit(execute, name, fingerprint)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = 'ran' if future.result() == 0 else 'failed'
+                if results[name] == 'failed':
+                    print(f"[{name}] FAILED")
+
+    for name, outcome in results.items():
+        metrics.count(f'pipeline.{outcome}', stage=name)
+    if not dry_run:
+        save_state(state, state_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the review pipeline, skipping stages whose inputs haven't changed.")
+    parser.add_argument('--only', default=None,
+                        help=f"Comma-separated stages to run, nothing else ({', '.join(STAGES)})")
+    parser.add_argument('--from', dest='start', default=None,
+                        help="Run this stage and everything downstream of it")
+    parser.add_argument('--scrape', action='store_true',
+                        help="Also scrape new reviews first (the scraper always runs when selected)")
+    parser.add_argument('--force', action='store_true',
+                        help="Run the selected stages even if their fingerprint is unchanged")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Stages run concurrently at most (default: as many as are ready)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only print which stages would run")
+    parser.add_argument('--app', default=None,
+                        help="Run the per-app stages for this app only, on its own shard "
+                             "(one worker per app can run in parallel)")
+    args = parser.parse_args()
+
+    # The stage scripts use paths relative to the repo root
+    os.chdir(ROOT)
+    try:
+        app = shard_key(args.app)
+        stages = shard_stages(STAGES, app) if app else STAGES
+        selected = select_stages(stages, args.only.split(',') if args.only else None, args.start, args.scrape)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with metrics.run('pipeline', report=False):
+        results = run_pipeline(stages, selected, state_path=shard_path(STATE_FILE, app), force=args.force,
+                               jobs=args.jobs, dry_run=args.dry_run)
+
+    summary = ', '.join(f"{name}: {outcome}" for name, outcome in results.items())
+    print(f"\n=== PIPELINE === {summary}")
+    if any(outcome in ('failed', 'blocked') for outcome in results.values()):
+        sys.exit(1)
@@ -1,64 +1,238 @@
 import pandas as pd
 from google_play_scraper import Sort, reviews
+import argparse
+import json
+import os
+import pickle
+import random
+import threading
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-# UPDATED APP IDs
-APP_PACKAGES = {
-    'CBE': 'com.combanketh.mobilebanking',
-    'BOA': 'com.boa.boaMobileBanking',
-    'Dashen': 'com.dashen.dashensuperapp'  # Updated to the new SuperApp
-}
+from registry import app_packages, shard_key, shard_path
+from storage import dataset_path, write_reviews
+import metrics
 
-def scrape_reviews(bank_name, app_id, target_count=400):
+# {bank key: Play Store app id} of every app in config/apps.json
+APP_PACKAGES = app_packages()
+
+RAW_FILE = dataset_path('raw')
+# High-water marks per app id: newest 'at' seen and the reviewIds at that timestamp
+STATE_FILE = 'data/raw/scrape_state.json'
+# Continuation tokens and reviews collected so far, so an interrupted run can resume
+CHECKPOINT_FILE = 'data/raw/scrape_checkpoint.pkl'
+
+PAGE_SIZE = 200
+REQUESTS_PER_SECOND = 1.0   # per app, same pace as the old fixed 1 second sleep
+MAX_RETRIES = 3
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` requests per second with bursts of `capacity`.
+    """
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve a token now; if the bucket was empty, wait until it has refilled
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+class ScrapeCheckpoint:
+    """
+    Per-app progress ({app_id: {'token', 'reviews', 'done'}}) kept as an
+    append-only log: every page adds one pickled record holding only that
+    page's reviews, the continuation token after it and the done flag, so
+    saving costs the same on page 1 and page 1000. Loading replays the log;
+    a record cut short by a crash is dropped together with its page.
+    """
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.apps = {}
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    record = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                if 'app_id' not in record:
+                    # Older checkpoints were one snapshot of every app
+                    self.apps = {app_id: dict(p, reviews=list(p['reviews'])) for app_id, p in record.items()}
+                    continue
+                progress = self.apps.setdefault(record['app_id'], {'token': None, 'reviews': [], 'done': False})
+                progress['reviews'].extend(record['reviews'])
+                progress['token'], progress['done'] = record['token'], record['done']
+
+    def get(self, app_id):
+        with self.lock:
+            return self.apps.get(app_id)
+
+    def update(self, app_id, token, page, done):
+        """Records one page: its new reviews and the token to continue from."""
+        with self.lock:
+            progress = self.apps.setdefault(app_id, {'token': None, 'reviews': [], 'done': False})
+            progress['reviews'].extend(page)
+            progress['token'], progress['done'] = token, done
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            record = pickle.dumps({'app_id': app_id, 'token': token, 'reviews': list(page), 'done': done})
+            with open(self.path, 'ab') as f:
+                f.write(record)
+                f.flush()
+
+    def clear(self):
+        with self.lock:
+            self.apps = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def new_high_water_mark(df, previous=None):
+    """
+    Newest timestamp in df and the ids of the reviews posted at exactly that time.
+    """
+    if df.empty:
+        return previous
+    at = pd.to_datetime(df['at'])
+    newest = at.max()
+    return {
+        'last_at': newest.isoformat(),
+        'last_review_id': df.loc[at.idxmax(), 'review_id'],
+        'boundary_ids': df.loc[at == newest, 'review_id'].tolist(),
+    }
+
+def split_new_reviews(batch, since):
+    """
+    Keeps the reviews of a NEWEST-sorted page that are newer than the high-water mark.
+    Returns (new reviews, reached_known) - reached_known means paging can stop.
+    """
+    if not since:
+        return batch, False
+    last_at = pd.Timestamp(since['last_at']).to_pydatetime()
+    known_ids = set(since.get('boundary_ids', [])) | {since.get('last_review_id')}
+
+    fresh = []
+    for review in batch:
+        if review.get('reviewId') in known_ids or review['at'] < last_at:
+            return fresh, True
+        fresh.append(review)
+    return fresh, False
+
+def fetch_page(fetch, app_id, continuation_token, limiter, max_retries=MAX_RETRIES,
+               base_delay=1.0, max_delay=30.0, bank_name=None):
+    """
+    One page of reviews, rate limited, retried with exponential backoff and full jitter.
+    `fetch` has the signature of google_play_scraper.reviews.
+    """
+    bank_name = bank_name or app_id
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return fetch(
+                app_id,
+                lang='en', 
+                country='et', 
+                sort=Sort.NEWEST, 
+                count=PAGE_SIZE, 
+                continuation_token=continuation_token
+            )
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            metrics.count('scrape.retries', bank=bank_name)
+            print(f"    ! {app_id}: {e} (retry {attempt + 1}/{max_retries} in {delay:.1f}s)")
+            time.sleep(delay)
+
+def scrape_reviews(bank_name, app_id, target_count=400, since=None, fetch=reviews,
+                   limiter=None, checkpoint=None, max_retries=MAX_RETRIES, base_delay=1.0):
+    """
+    Pages through the newest reviews of one app.
+    With `since` (a high-water mark from the state file) paging stops at the
+    first review that was already collected, so only the delta is downloaded;
+    target_count is ignored then, since stopping short of the old mark would
+    lose the reviews in between once the mark moves.
+    With a checkpoint, progress is saved after every page and picked up again
+    on the next call. Returns (df, complete); complete is False if paging gave
+    up after exhausting its retries.
+    """
     print(f"\n--- Starting scrape for {bank_name} ---")
     print(f"    App ID: {app_id}")
+    if since:
+        print(f"    Incremental: fetching reviews newer than {since['last_at']}")
     
+    limiter = limiter or TokenBucket()
     all_reviews = []
     continuation_token = None
+    done = False
+
+    saved = checkpoint.get(app_id) if checkpoint else None
+    if saved:
+        all_reviews, continuation_token, done = list(saved['reviews']), saved['token'], saved['done']
+        print(f"    Resuming from checkpoint ({len(all_reviews)} reviews already collected)")
     
-    # Retry logic
-    max_retries = 3
-    
-    while len(all_reviews) < target_count:
+    while not done and (since or len(all_reviews) < target_count):
+        print(f"    Fetching batch... (Current count: {len(all_reviews)})")
         try:
-            print(f"    Fetching batch... (Current count: {len(all_reviews)})")
-            result, continuation_token = reviews(
-                app_id,
-                lang='en', 
-                country='et', 
-                sort=Sort.NEWEST, 
-                count=200, 
-                continuation_token=continuation_token
+            result, continuation_token = fetch_page(
+                fetch, app_id, continuation_token, limiter, max_retries, base_delay, bank_name=bank_name
             )
+            metrics.count('scrape.pages', bank=bank_name)
+        except Exception as e:
+            print(f"    ! Error scraping {bank_name}, giving up for now: {e}")
+            metrics.count('scrape.failures', bank=bank_name)
+            return pd.DataFrame(), False
             
-            if not result:
-                print(f"    No more reviews found for {bank_name}.")
-                break
-                
+        if not result:
+            print(f"    No more reviews found for {bank_name}.")
+            done = True
+        else:
+            result, reached_known = split_new_reviews(result, since)
             all_reviews.extend(result)
-            
-            if len(all_reviews) >= target_count:
-                break
-            
-            # Show user we are waiting
-            print("    Waiting 1 second to avoid blocking...")
-            time.sleep(1)
-            
-        except Exception as e:
-            print(f"    ! Error scraping {bank_name}: {e}")
-            break
+            if reached_known:
+                print(f"    Reached already collected reviews for {bank_name}.")
+            done = reached_known or (not since and len(all_reviews) >= target_count)
+
+        if checkpoint:
+            checkpoint.update(app_id, continuation_token, result or [], done)
 
     # SAFETY CHECK: If 0 reviews, return empty
     if not all_reviews:
         print(f"    WARNING: No reviews found for {bank_name}!")
-        return pd.DataFrame()
+        return pd.DataFrame(), True
 
     # Convert to DataFrame
     df = pd.DataFrame(all_reviews)
     
     # Check for missing columns (The source of your previous KeyError)
-    required_cols = ['content', 'score', 'at', 'thumbsUpCount']
+    required_cols = ['content', 'score', 'at', 'thumbsUpCount', 'reviewId']
     available_cols = [c for c in required_cols if c in df.columns]
     
     if len(available_cols) < len(required_cols):
@@ -72,29 +246,108 @@ def scrape_reviews(bank_name, app_id, target_count=400):
     df = df[required_cols]
     df['bank_name'] = bank_name
     df['source'] = 'Google Play'
-    df['review_id'] = [f"{bank_name}_{i}" for i in range(len(df))]
+    # Stable ids from the store (positional ids only as a fallback)
+    positional = pd.Series([f"{bank_name}_{i}" for i in range(len(df))], index=df.index)
+    df['review_id'] = df.pop('reviewId').fillna(positional)
     
+    metrics.count('scrape.reviews', len(df), bank=bank_name)
     print(f"    >>> Success: Collected {len(df)} reviews for {bank_name}")
-    return df
+    return df, True
+
+def scrape_all(apps=APP_PACKAGES, target_count=500, state=None, fetch=reviews, workers=None,
+               rate=REQUESTS_PER_SECOND, checkpoint=None, max_retries=MAX_RETRIES, base_delay=1.0):
+    """
+    Scrapes every app concurrently, each with its own rate limiter.
+    `state` holds the high-water marks for incremental runs (None = full scrape).
+    Returns {bank: (df, complete)}.
+    """
+    def scrape_one(bank, app_id):
+        since = state.get(app_id) if state is not None else None
+        with metrics.stage('scrape', bank=bank):
+            return scrape_reviews(bank, app_id, target_count=target_count, since=since, fetch=fetch,
+                                  limiter=TokenBucket(rate), checkpoint=checkpoint,
+                                  max_retries=max_retries, base_delay=base_delay)
+
+    with ThreadPoolExecutor(max_workers=workers or max(1, len(apps))) as executor:
+        futures = {bank: executor.submit(scrape_one, bank, app_id) for bank, app_id in apps.items()}
+        return {bank: future.result() for bank, future in futures.items()}
+
+def append_reviews(df, path=RAW_FILE):
+    """
+    Appends new reviews to the raw dataset (CSV: matching the existing column order).
+    """
+    write_reviews(df, path, append=True)
 
 if __name__ == "__main__":
-    dfs = []
-    print("Initializing Scraper...")
+    parser = argparse.ArgumentParser(description="Scrape Google Play reviews for the bank apps.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only fetch reviews newer than the last run and append them")
+    parser.add_argument('--target-count', type=int, default=500,
+                        help="Max reviews per app (ignored with --incremental, which pages back to the last run)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Apps scraped in parallel (default: all of them)")
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND,
+                        help="Requests per second, per app")
+    parser.add_argument('--max-retries', type=int, default=MAX_RETRIES)
+    parser.add_argument('--fresh', action='store_true',
+                        help="Ignore any checkpoint left by an interrupted run")
+    parser.add_argument('--app', default=None,
+                        help="Only scrape this app, into its own shard (see registry.py)")
+    args = parser.parse_args()
+    try:
+        app = shard_key(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    # A shard has its own raw file, high-water marks and checkpoint, so apps can be
+    # scraped by separate workers without sharing (and racing on) any file
+    apps = app_packages([app]) if app else APP_PACKAGES
+    raw_file, state_file, checkpoint_file = (shard_path(p, app) for p in (RAW_FILE, STATE_FILE, CHECKPOINT_FILE))
+
+    # Pages, retries and reviews per bank go to data/metrics/runs.jsonl
+    with metrics.run('scraper'):
+        print("Initializing Scraper...")
+        # A new shard starts from the high-water marks of earlier unsharded runs
+        state = load_state(state_file if os.path.exists(state_file) else STATE_FILE)
+        checkpoint = ScrapeCheckpoint(checkpoint_file)
+        if args.fresh:
+            checkpoint.clear()
     
-    for bank, app_id in APP_PACKAGES.items():
-        df = scrape_reviews(bank, app_id, target_count=500)
-        if not df.empty:
-            dfs.append(df)
+        results = scrape_all(
+            apps, target_count=args.target_count, state=state if args.incremental else None,
+            workers=args.workers, rate=args.rate, checkpoint=checkpoint, max_retries=args.max_retries
+        )
+
+        incomplete = [bank for bank, (_, complete) in results.items() if not complete]
+        if incomplete:
+            # Nothing is written (and no high-water mark moves) until every app is complete;
+            # finished apps and partial progress stay in the checkpoint for the next run
+            print(f"\nINTERRUPTED: {', '.join(incomplete)} did not finish. Rerun to resume from the checkpoint.")
+            sys.exit(1)
+
+        dfs = []
+        for bank, (df, _) in results.items():
+            if not df.empty:
+                dfs.append(df)
+                app_id = apps[bank]
+                state[app_id] = new_high_water_mark(df, state.get(app_id))
     
-    if dfs:
-        final_df = pd.concat(dfs, ignore_index=True)
+        if dfs:
+            final_df = pd.concat(dfs, ignore_index=True)
         
-        # Ensure directory exists
-        import os
-        os.makedirs('data/raw', exist_ok=True)
+            # Ensure directory exists
+            os.makedirs(os.path.dirname(raw_file), exist_ok=True)
         
-        save_path = 'data/raw/raw_reviews.csv'
-        final_df.to_csv(save_path, index=False)
-        print(f"\nDONE! Saved {len(final_df)} total reviews to '{save_path}'")
-    else:
-        print("\nFAILED: No data collected from any bank.")
\ No newline at end of file
+            save_path = raw_file
+            if args.incremental:
+                append_reviews(final_df, save_path)
+                print(f"\nDONE! Appended {len(final_df)} new reviews to '{save_path}'")
+            else:
+                write_reviews(final_df, save_path)
+                print(f"\nDONE! Saved {len(final_df)} total reviews to '{save_path}'")
+            # Only move the high-water marks once the data is safely on disk
+            save_state(state, state_file)
+        elif args.incremental:
+            print("\nDONE! No new reviews since the last run.")
+        else:
+            print("\nFAILED: No data collected from any bank.")
+        checkpoint.clear()
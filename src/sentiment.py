@@ -0,0 +1,297 @@
+import logging
+import os
+import re
+import numpy as np
+
+from resources import offline_mode
+import metrics
+
+MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+MODEL_REVISION = "main"   # Pin to a commit hash for reproducible (and cacheable) scores
+MAX_LENGTH = 512          # DistilBERT position limit (in tokens, not characters)
+DEFAULT_BATCH_SIZE = 32
+
+# Inference backends, chosen with SENTIMENT_BACKEND (or --backend):
+#   torch      full-precision PyTorch (the baseline)
+#   quantized  PyTorch with dynamic int8 Linear layers
+#   onnx       ONNX Runtime session over a locally cached export
+BACKENDS = ('torch', 'quantized', 'onnx')
+ONNX_CACHE_DIR = os.path.join('data', 'cache', 'onnx')
+ONNX_OPSET = 17
+
+# Loaded tokenizers and models, keyed by (model name, revision[, backend])
+_TOKENIZERS = {}
+_MODELS = {}
+
+
+def sentiment_backend(backend=None):
+    backend = (backend or os.getenv('SENTIMENT_BACKEND', 'torch')).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    return backend
+
+
+def cache_model_id(model_name, backend=None):
+    """Model id for the score cache; non-baseline backends keep their own entries."""
+    backend = sentiment_backend(backend)
+    return model_name if backend == 'torch' else f"{model_name}+{backend}"
+
+
+def load_tokenizer(model_name=MODEL_NAME, revision=MODEL_REVISION):
+    """Loads the tokenizer once per process."""
+    if (model_name, revision) not in _TOKENIZERS:
+        from transformers import AutoTokenizer
+
+        _TOKENIZERS[(model_name, revision)] = AutoTokenizer.from_pretrained(
+            model_name, revision=revision, local_files_only=offline_mode()
+        )
+    return _TOKENIZERS[(model_name, revision)]
+
+
+class OnnxClassifier:
+    """ONNX Runtime session standing in for the transformers model in _score_batch."""
+
+    def __init__(self, path, config, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime") from e
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.config = config
+
+    def predict_proba(self, inputs):
+        feeds = {k: np.asarray(v, dtype=np.int64) for k, v in inputs.items() if k in self.input_names}
+        logits = self.session.run(['logits'], feeds)[0]
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def export_onnx(model_name=MODEL_NAME, revision=MODEL_REVISION, cache_dir=ONNX_CACHE_DIR):
+    """
+    Exports the classifier to ONNX once and returns the cached file's path.
+    The cache is per model and revision, so pinning a new revision re-exports.
+    """
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', f"{model_name}@{revision}").strip('_')
+    path = os.path.join(cache_dir, slug, 'model.onnx')
+    if os.path.exists(path):
+        return path
+
+    import torch
+
+    print(f"Exporting {model_name} to ONNX (once, cached at {path})...")
+    tokenizer, model = load_model(model_name, revision, backend='torch')
+    sample = tokenizer(["export sample"], return_tensors='pt')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    dynamic = {0: 'batch', 1: 'sequence'}
+    torch.onnx.export(
+        model, (sample['input_ids'], sample['attention_mask']), tmp_path,
+        input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+        dynamic_axes={'input_ids': dynamic, 'attention_mask': dynamic, 'logits': {0: 'batch'}},
+        opset_version=ONNX_OPSET, dynamo=False,
+    )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_model(model_name=MODEL_NAME, revision=MODEL_REVISION, backend=None, threads=None):
+    """
+    Loads the tokenizer and classifier once per process and backend, in eval mode.
+    """
+    backend = sentiment_backend(backend)
+    key = (model_name, revision, backend)
+    if key not in _MODELS:
+        if backend == 'onnx':
+            from transformers import AutoConfig
+
+            config = AutoConfig.from_pretrained(model_name, revision=revision, local_files_only=offline_mode())
+            _MODELS[key] = OnnxClassifier(export_onnx(model_name, revision), config, threads)
+        else:
+            from transformers import AutoModelForSequenceClassification
+
+            model = AutoModelForSequenceClassification.from_pretrained(
+                model_name, revision=revision, local_files_only=offline_mode()
+            )
+            model.eval()
+            if backend == 'quantized':
+                import torch
+
+                # int8 weights for every Linear layer; activations are quantized on the fly
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            _MODELS[key] = model
+    return load_tokenizer(model_name, revision), _MODELS[key]
+
+
+def plan_batches(lengths, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Sorts row positions by token length and cuts them into batches.
+    Each batch holds reviews of similar length, so padding stays minimal.
+    """
+    order = np.argsort(np.asarray(lengths), kind='stable')
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _batch_features(encoded, batch):
+    return [{key: encoded[key][i] for key in encoded.keys()} for i in batch]
+
+
+def _score_batch(tokenizer, model, features):
+    """Pads one batch of pre-tokenized reviews and returns (labels, scores)."""
+    if isinstance(model, OnnxClassifier):
+        probs = model.predict_proba(tokenizer.pad(features, return_tensors='np'))
+    else:
+        import torch
+
+        with torch.inference_mode():
+            inputs = tokenizer.pad(features, return_tensors='pt')
+            probs = torch.softmax(model(**inputs).logits, dim=-1).numpy()
+    best_id = probs.argmax(axis=-1)
+    return [model.config.id2label[i] for i in best_id.tolist()], probs.max(axis=-1)
+
+
+def _score_group(tokenizer, model, group):
+    """Scores a list of (positions, features) batches; failed batches come back as None."""
+    results = []
+    for positions, features in group:
+        try:
+            labels, scores = _score_batch(tokenizer, model, features)
+        except Exception as e:
+            # Same fallback as the old per-row path, but for the whole batch
+            logging.warning(f"[WARNING] Sentiment batch of {len(positions)} reviews failed, marking NEUTRAL: {e}")
+            metrics.count('sentiment.failed_rows', len(positions))
+            labels, scores = None, None
+        results.append((positions, labels, scores))
+    return results
+
+
+# --- MULTI-PROCESS SCORING ---
+# Each worker loads the model once (in its initializer) and scores whole batches.
+_WORKER_MODEL = {}
+
+
+def _init_worker(model_name, revision, threads, backend, loader=load_model):
+    # Split the cores between workers instead of letting each grab all of them
+    if backend != 'onnx':
+        import torch
+
+        torch.set_num_threads(threads)
+    _WORKER_MODEL['model'] = loader(model_name, revision, backend, threads)
+
+
+def _score_group_in_worker(group):
+    tokenizer, model = _WORKER_MODEL['model']
+    return _score_group(tokenizer, model, group)
+
+
+def _score_parallel(groups, model_name, revision, workers, backend, loader=load_model):
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # 'spawn' avoids forking a process that may already hold torch/tokenizer threads
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(model_name, revision, threads, backend, loader),
+    ) as executor:
+        for results in executor.map(_score_group_in_worker, groups):
+            yield from results
+
+
+def score_texts(texts, model_name=MODEL_NAME, revision=MODEL_REVISION,
+                batch_size=DEFAULT_BATCH_SIZE, max_length=MAX_LENGTH, workers=1, backend=None):
+    """
+    Scores a list of texts in length-bucketed batches.
+    Returns (labels, scores) as numpy arrays aligned with the input order.
+    With workers > 1 the batches are spread over a process pool. The batches
+    are the same as in the serial run, but each worker runs torch with a share
+    of the cores, and a different thread count can change the order of float
+    reductions: scores may differ in the last bits (labels only on exact ties).
+    `backend` defaults to SENTIMENT_BACKEND (see BACKENDS).
+    """
+    texts = [str(t) for t in texts]
+    backend = sentiment_backend(backend)
+
+    labels = np.full(len(texts), "NEUTRAL", dtype=object)
+    scores = np.full(len(texts), 0.5, dtype=np.float64)
+    if not texts:
+        return labels, scores
+
+    # Truncate at the tokenizer level instead of slicing characters
+    tokenizer = load_tokenizer(model_name, revision)
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encoded['input_ids']]
+    batches = plan_batches(lengths, batch_size)
+    metrics.count('sentiment.model_rows', len(texts))
+    metrics.count('sentiment.model_batches', len(batches))
+
+    if workers > 1:
+        # A few batches per task keeps IPC overhead low while still balancing load
+        per_task = max(1, min(8, len(batches) // (workers * 4)))
+        groups = [
+            [(batch, _batch_features(encoded, batch)) for batch in batches[i:i + per_task]]
+            for i in range(0, len(batches), per_task)
+        ]
+        results = _score_parallel(groups, model_name, revision, workers, backend)
+    else:
+        _, model = load_model(model_name, revision, backend)
+        results = _score_group(tokenizer, model, ((batch, _batch_features(encoded, batch)) for batch in batches))
+
+    for positions, batch_labels, batch_scores in results:
+        if batch_labels is not None:
+            labels[positions] = batch_labels
+            scores[positions] = batch_scores
+
+    return labels, scores
+
+
+def apply_neutral_band(labels, scores, neutral_band=0.0):
+    """
+    Relabels NEUTRAL every prediction whose confidence is below neutral_band.
+    The classifier is binary (confidence >= 0.5), so e.g. 0.75 turns its
+    coin-flip predictions into NEUTRAL; 0.0 leaves the labels as they are.
+    """
+    labels = np.array(labels, dtype=object)
+    labels[np.asarray(scores) < neutral_band] = "NEUTRAL"
+    return labels
+
+
+def score_texts_cached(texts, cache, model_name=MODEL_NAME, revision=MODEL_REVISION,
+                       batch_size=DEFAULT_BATCH_SIZE, max_length=MAX_LENGTH, workers=1, backend=None):
+    """
+    Same as score_texts, but looks every text up in a SentimentCache first.
+    Only unseen texts reach the model; their results are written back to the cache.
+    """
+    from sentiment_cache import cache_key
+
+    texts = [str(t) for t in texts]
+    model_id = cache_model_id(model_name, backend)
+    keys = [cache_key(t, model_id, revision) for t in texts]
+    found = cache.get_many(keys)
+    metrics.count('sentiment.cache_hits', sum(1 for key in keys if key in found))
+
+    # Score each missing key once, even if several rows share it
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    if missing:
+        new_labels, new_scores = score_texts(
+            list(missing.values()), model_name=model_name, revision=revision,
+            batch_size=batch_size, max_length=max_length, workers=workers, backend=backend
+        )
+        new_items = list(zip(missing.keys(), new_labels, new_scores))
+        # Don't persist the NEUTRAL/0.5 placeholder of a failed batch
+        cache.put_many([item for item in new_items if item[1:] != ("NEUTRAL", 0.5)])
+        found.update({key: (label, score) for key, label, score in new_items})
+
+    labels = np.array([found[key][0] for key in keys], dtype=object)
+    scores = np.array([found[key][1] for key in keys], dtype=np.float64)
+    return labels, scores
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import re
+import sqlite3
+
+DEFAULT_CACHE_PATH = 'data/cache/sentiment_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 500_000
+# Seconds a writer waits for another process's lock (e.g. per-app shards scoring in parallel)
+BUSY_TIMEOUT = 60
+
+# SQLite caps the number of bound parameters per statement
+_CHUNK = 500
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """
+    Normalizes review text for hashing.
+    The model is uncased and ignores whitespace runs, so these variants score the same.
+    """
+    return _WHITESPACE.sub(' ', str(text)).strip().lower()
+
+
+def cache_key(text, model_name, revision):
+    """Hash of the normalized text plus the model that scored it."""
+    payload = f"{model_name}\x00{revision}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SentimentCache:
+    """
+    Persistent (SQLite) cache of sentiment results with LRU eviction.
+    Keys come from cache_key(); values are (sentiment_label, sentiment_score).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        if path != ':memory:':
+            # WAL lets readers run alongside a writer; writers still queue on the busy timeout
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_cache (
+                key TEXT PRIMARY KEY,
+                sentiment_label TEXT NOT NULL,
+                sentiment_score REAL NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sentiment_cache_last_used ON sentiment_cache(last_used)"
+        )
+        self.conn.commit()
+        # Logical clock for LRU order (wall-clock time can tie on coarse timers)
+        self.clock = self.conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM sentiment_cache").fetchone()[0]
+
+    def _tick(self):
+        self.clock += 1
+        return self.clock
+
+    def get_many(self, keys):
+        """Returns {key: (label, score)} for the keys found, and bumps their LRU timestamp."""
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        for i in range(0, len(unique), _CHUNK):
+            chunk = unique[i:i + _CHUNK]
+            marks = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, sentiment_label, sentiment_score FROM sentiment_cache WHERE key IN ({marks})",
+                chunk
+            )
+            for key, label, score in rows:
+                found[key] = (label, score)
+
+        now = self._tick()
+        self.conn.executemany(
+            "UPDATE sentiment_cache SET last_used = ? WHERE key = ?",
+            [(now, key) for key in found]
+        )
+        self.conn.commit()
+
+        hit_count = sum(1 for key in keys if key in found)
+        self.hits += hit_count
+        self.misses += len(keys) - hit_count
+        return found
+
+    def put_many(self, items):
+        """Stores (key, label, score) tuples, then evicts the least recently used overflow."""
+        now = self._tick()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO sentiment_cache (key, sentiment_label, sentiment_score, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            [(key, label, float(score), now) for key, label, score in items]
+        )
+        self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        """Drops the oldest entries until the cache is back under max_entries."""
+        size = self.conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+        overflow = size - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM sentiment_cache WHERE key IN ("
+                "SELECT key FROM sentiment_cache ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+        return max(overflow, 0)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"Sentiment cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def close(self):
+        self.conn.close()
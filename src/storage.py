@@ -0,0 +1,169 @@
+import argparse
+import os
+import shutil
+import uuid
+
+# pandas is imported where it is used, so path helpers stay cheap to import
+# (run_pipeline.py resolves paths without loading it)
+
+# Dataset locations per stage and format. CSV stays the default; set
+# REVIEWS_FORMAT=parquet (or pass --format) to use the partitioned Parquet datasets.
+DATASETS = {
+    ('raw', 'csv'): 'data/raw/raw_reviews.csv',
+    ('raw', 'parquet'): 'data/raw/raw_reviews_parquet',
+    ('processed', 'csv'): 'data/processed/analyzed_reviews.csv',
+    ('processed', 'parquet'): 'data/processed/analyzed_reviews_parquet',
+}
+
+# Low-cardinality text columns stored dictionary-encoded (categorical)
+CATEGORICAL_COLUMNS = ['bank_name', 'sentiment_label', 'theme', 'source']
+PARTITION_COLUMNS = ['bank_name', 'month']
+
+_OPS = {
+    '==': lambda s, v: s == v,
+    '=': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v),
+    'not in': lambda s, v: ~s.isin(v),
+}
+
+
+def storage_format():
+    return os.getenv('REVIEWS_FORMAT', 'csv').lower()
+
+
+def dataset_path(stage, fmt=None):
+    """Path of the 'raw' or 'processed' reviews dataset in the configured format."""
+    return DATASETS[(stage, fmt or storage_format())]
+
+
+def is_parquet(path):
+    path = str(path)
+    return path.endswith('.parquet') or path.endswith('_parquet') or os.path.isdir(path)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Parquet storage needs pyarrow: pip install pyarrow") from e
+
+
+def to_typed(df):
+    """Typed timestamps and categorical low-cardinality columns, plus the 'month' partition key."""
+    import pandas as pd
+
+    df = df.copy()
+    if 'at' in df.columns:
+        df['at'] = pd.to_datetime(df['at'], errors='coerce')
+        df['month'] = df['at'].dt.strftime('%Y-%m').fillna('unknown')
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def write_reviews(df, path, append=False):
+    """
+    Writes a reviews frame as CSV or as Parquet partitioned by bank_name and month.
+    With append=True new rows are added next to the existing ones.
+    """
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(str(path)) or '.', exist_ok=True)
+    if not is_parquet(path):
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            columns = pd.read_csv(path, nrows=0).columns
+            df.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+        else:
+            df.to_csv(path, index=False)
+        return
+
+    _require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not append and os.path.exists(path):
+        shutil.rmtree(path)
+    typed = to_typed(df)
+    partitions = [c for c in PARTITION_COLUMNS if c in typed.columns]
+    for col in partitions:
+        # Partition values become directory names; keep them plain strings
+        typed[col] = typed[col].astype(str)
+    pq.write_to_dataset(
+        pa.Table.from_pandas(typed, preserve_index=False),
+        root_path=str(path),
+        partition_cols=partitions,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def _apply_filters(df, filters):
+    for col, op, value in filters or []:
+        df = df[_OPS[op](df[col], value)]
+    return df
+
+
+def read_reviews(path, columns=None, filters=None):
+    """
+    Loads a reviews dataset.
+    `columns` projects columns and `filters` is a list of (column, op, value)
+    predicates, e.g. [('sentiment_label', '==', 'NEGATIVE')]. On Parquet both
+    are pushed down, so partitions and columns that aren't needed are never read.
+    """
+    import pandas as pd
+
+    if not is_parquet(path):
+        usecols = None
+        if columns is not None:
+            usecols = list(dict.fromkeys(list(columns) + [c for c, _, _ in filters or []]))
+        df = _apply_filters(pd.read_csv(path, usecols=usecols), filters)
+        return df[list(columns)] if columns is not None else df
+
+    _require_pyarrow()
+    df = pd.read_parquet(path, columns=list(columns) if columns is not None else None,
+                         filters=[tuple(f) for f in filters] if filters else None)
+    for col in PARTITION_COLUMNS:
+        if col in df.columns and df[col].dtype.name == 'category':
+            df[col] = df[col].cat.remove_unused_categories()
+    if columns is None and 'month' in df.columns:
+        df = df.drop(columns='month')
+    return df
+
+
+def iter_reviews(path, chunksize):
+    """Yields the dataset in DataFrames of at most `chunksize` rows."""
+    import pandas as pd
+
+    if not is_parquet(path):
+        yield from pd.read_csv(path, chunksize=chunksize)
+        return
+
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(str(path), format='parquet', partitioning='hive')
+    for batch in dataset.to_batches(batch_size=chunksize):
+        if batch.num_rows:
+            df = batch.to_pandas()
+            yield df.drop(columns='month') if 'month' in df.columns else df
+
+
+def convert(src, dst):
+    """Copies a dataset between CSV and Parquet (either direction)."""
+    write_reviews(read_reviews(src), dst)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert review datasets between CSV and Parquet.")
+    parser.add_argument('src', help="Source dataset (.csv file or Parquet directory)")
+    parser.add_argument('dst', help="Destination dataset (.csv file or Parquet directory)")
+    args = parser.parse_args()
+
+    convert(args.src, args.dst)
+    print(f"Converted {args.src} -> {args.dst}")
@@ -0,0 +1,90 @@
+import csv
+import heapq
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+from storage import iter_reviews
+
+DEFAULT_CHUNKSIZE = 50_000
+DEDUP_COLUMNS = ['content', 'bank_name']
+
+
+def row_digests(df, columns=DEDUP_COLUMNS):
+    """64-bit hash of the dedup key of every row (vectorized, no per-row Python)."""
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def iter_clean_chunks(path, chunksize=DEFAULT_CHUNKSIZE, stats=None):
+    """
+    Streaming version of preprocess.clean_dataframe.
+    Reads the dataset (CSV or Parquet) in chunks and applies the same steps per chunk:
+    missingness, deduplication (across chunks, via a set of row digests)
+    and date normalization. Sorting is left to external_sort_csv.
+    """
+    stats = stats if stats is not None else {}
+    for key in ('raw', 'missing', 'duplicates', 'bad_dates', 'clean'):
+        stats.setdefault(key, 0)
+    seen = set()
+
+    for chunk in iter_reviews(path, chunksize):
+        stats['raw'] += len(chunk)
+
+        # 1. MISSINGNESS ENFORCEMENT
+        before = len(chunk)
+        chunk = chunk.dropna(subset=['content', 'score', 'at'])
+        stats['missing'] += before - len(chunk)
+
+        # 2. DEDUPLICATION (keep the first occurrence in file order)
+        digests = row_digests(chunk)
+        keep = ~pd.Series(digests).duplicated().to_numpy()
+        keep &= [d not in seen for d in digests]
+        seen.update(digests[keep].tolist())
+        stats['duplicates'] += int((~keep).sum())
+        chunk = chunk[keep].copy()
+
+        # 3. STRICT DATE NORMALIZATION
+        before = len(chunk)
+        chunk['at'] = pd.to_datetime(chunk['at'], errors='coerce')
+        chunk = chunk.dropna(subset=['at'])
+        stats['bad_dates'] += before - len(chunk)
+
+        stats['clean'] += len(chunk)
+        if not chunk.empty:
+            yield chunk
+
+
+def external_sort_csv(src, dst, key='at', descending=True, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Sorts a CSV that may not fit in memory by one column.
+    Each chunk is sorted and written to a temporary run file, then the runs
+    are merged with heapq.merge. The key is compared as text, which is
+    chronological for the ISO timestamps pandas writes.
+    """
+    run_dir = tempfile.mkdtemp(prefix='sort_runs_', dir=os.path.dirname(os.path.abspath(dst)))
+    try:
+        runs = []
+        for i, chunk in enumerate(pd.read_csv(src, chunksize=chunksize, dtype=str, keep_default_na=False)):
+            run_path = os.path.join(run_dir, f'run_{i}.csv')
+            chunk.sort_values(by=key, ascending=not descending, kind='stable').to_csv(run_path, index=False)
+            runs.append(run_path)
+
+        if not runs:
+            shutil.copyfile(src, dst)
+            return
+
+        files = [open(p, newline='', encoding='utf-8') for p in runs]
+        try:
+            readers = [csv.reader(f) for f in files]
+            header = [next(r) for r in readers][0]
+            col = header.index(key)
+            with open(dst, 'w', newline='', encoding='utf-8') as out:
+                writer = csv.writer(out)
+                writer.writerow(header)
+                writer.writerows(heapq.merge(*readers, key=lambda row: row[col], reverse=descending))
+        finally:
+            for f in files:
+                f.close()
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Shapes measured on data/raw/raw_reviews.csv: median review is 4 words, 90th
+# percentile 28, max ~100; ratings are mostly 5 or 1 stars.
+RATING_WEIGHTS = {1: 0.23, 2: 0.04, 3: 0.05, 4: 0.06, 5: 0.62}
+BANK_WEIGHTS = {'CBE': 0.45, 'BOA': 0.30, 'Dashen': 0.25}
+LENGTH_MEDIAN_WORDS = 4
+LENGTH_SIGMA = 1.2
+MAX_WORDS = 120
+
+POSITIVE_WORDS = ['good', 'nice', 'great', 'best', 'excellent', 'love', 'amazing', 'easy', 'fast', 'thanks', 'wow']
+NEGATIVE_WORDS = ['bad', 'worst', 'poor', 'terrible', 'useless', 'slow', 'failed', 'crash', 'error', 'waste', 'not']
+THEME_WORDS = ['login', 'otp', 'password', 'account', 'loading', 'stuck', 'connect', 'crash', 'bug', 'update',
+               'transfer', 'payment', 'send', 'telebirr', 'balance', 'interface', 'design', 'screen', 'option']
+FILLER_WORDS = ['the', 'app', 'is', 'very', 'and', 'it', 'to', 'my', 'i', 'this', 'for', 'of', 'a', 'bank',
+                'please', 'money', 'when', 'always', 'time', 'but', 'use', 'can', 'with', 'service', 'mobile']
+# Reviews the English pipeline sees as empty after clean_text
+OTHER_SCRIPT = ['👍', '👌👌', '🔥🔥🔥', '❤️', '🙏', 'በጣም ጥሩ ነው', 'አሪፍ', 'በጣም ምቹ ነው', 'ዳሺን ባንክ']
+
+# Filler beyond FILLER_WORDS: made-up lowercase words drawn with a Zipf
+# distribution, so long reviews are mostly unique but short ones repeat
+TAIL_WORDS = 5_000
+ZIPF_EXPONENT = 1.3
+
+OTHER_SCRIPT_SHARE = 0.08
+DUPLICATE_SHARE = 0.03
+MISSING_SHARE = 0.003
+
+
+def make_reviews(rows, seed=0, bank_weights=BANK_WEIGHTS, end='2025-12-01', days=730):
+    """
+    Synthetic raw reviews with the same columns as scraper.py writes.
+    Word counts are log-normal, words are drawn from rating-dependent
+    vocabularies (so sentiment and themes have something to find), and a
+    share of rows are emoji/Amharic, exact duplicates or missing text.
+    """
+    rng = np.random.default_rng(seed)
+    banks = rng.choice(list(bank_weights), size=rows, p=np.array(list(bank_weights.values())) / sum(bank_weights.values()))
+    ratings = rng.choice(list(RATING_WEIGHTS), size=rows, p=list(RATING_WEIGHTS.values()))
+
+    lengths = np.clip(np.rint(rng.lognormal(np.log(LENGTH_MEDIAN_WORDS), LENGTH_SIGMA, rows)), 1, MAX_WORDS).astype(np.int64)
+    row_of_word = np.repeat(np.arange(rows), lengths)
+    word_ratings = ratings[row_of_word]
+
+    # Each word is a sentiment word matching the rating (30%), a theme keyword (15%) or filler
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    tail = [''.join(rng.choice(letters, rng.integers(3, 9))) for _ in range(TAIL_WORDS)]
+    vocab = np.array(POSITIVE_WORDS + NEGATIVE_WORDS + THEME_WORDS + FILLER_WORDS + tail, dtype=object)
+    offsets = np.cumsum([0, len(POSITIVE_WORDS), len(NEGATIVE_WORDS), len(THEME_WORDS)])
+    kind = rng.random(len(row_of_word))
+    polar_positive = (word_ratings >= 4) | ((word_ratings == 3) & (rng.random(len(row_of_word)) < 0.5))
+    sentiment_idx = np.where(polar_positive,
+                             rng.integers(0, len(POSITIVE_WORDS), len(row_of_word)),
+                             offsets[1] + rng.integers(0, len(NEGATIVE_WORDS), len(row_of_word)))
+    theme_idx = offsets[2] + rng.integers(0, len(THEME_WORDS), len(row_of_word))
+    filler_rank = np.minimum(rng.zipf(ZIPF_EXPONENT, len(row_of_word)), len(FILLER_WORDS) + TAIL_WORDS) - 1
+    filler_idx = offsets[3] + filler_rank
+    words = vocab[np.select([kind < 0.30, kind < 0.45], [sentiment_idx, theme_idx], default=filler_idx)]
+
+    starts = np.cumsum(lengths) - lengths
+    content = np.add.reduceat(words + ' ', starts)
+    content = np.array([t[:-1].capitalize() for t in content], dtype=object)
+
+    other = rng.random(rows) < OTHER_SCRIPT_SHARE
+    content[other] = np.array(OTHER_SCRIPT, dtype=object)[rng.integers(0, len(OTHER_SCRIPT), other.sum())]
+    duplicate = rng.random(rows) < DUPLICATE_SHARE
+    duplicate[0] = False
+    sources = (rng.random(duplicate.sum()) * np.flatnonzero(duplicate)).astype(np.int64)
+    content[duplicate] = content[sources]
+    banks[duplicate] = banks[sources]
+    content[rng.random(rows) < MISSING_SHARE] = None
+
+    seconds = rng.integers(0, days * 86_400, rows)
+    at = pd.Timestamp(end) - pd.to_timedelta(seconds, unit='s')
+    thumbs = (rng.pareto(1.5, rows) * (rng.random(rows) < 0.3)).astype(np.int64)
+
+    return pd.DataFrame({
+        'content': content,
+        'score': ratings,
+        'at': at.strftime('%Y-%m-%d %H:%M:%S'),
+        'thumbsUpCount': thumbs,
+        'bank_name': banks,
+        'source': 'Google Play',
+        'review_id': pd.Series(banks).str.cat(pd.Series(np.arange(rows)).astype(str), sep='_').to_numpy(),
+    })
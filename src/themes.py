@@ -0,0 +1,55 @@
+import json
+import os
+import re
+from functools import lru_cache
+import numpy as np
+
+THEMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'themes.json')
+
+
+@lru_cache(maxsize=None)
+def load_themes(path=THEMES_FILE):
+    """
+    Loads the keyword clusters and compiles one alternation regex per theme.
+    Returns (compiled themes in priority order, default theme).
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    themes = []
+    for theme in config['themes']:
+        # Plain substring matching, same as the old `any(w in t for w in [...])`
+        pattern = re.compile('|'.join(re.escape(w.lower()) for w in theme['keywords']))
+        themes.append((theme['name'], pattern))
+    return tuple(themes), config.get('default', 'General')
+
+
+def match_matrix(texts, path=THEMES_FILE):
+    """Boolean (rows x themes) matrix of keyword hits, one vectorized scan per theme."""
+    themes, _ = load_themes(path)
+    lowered = texts.astype(str).str.lower()
+    return np.column_stack([
+        lowered.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        for _, pattern in themes
+    ])
+
+
+def assign_themes(texts, path=THEMES_FILE, multi_label=False):
+    """
+    Assigns each text the first matching theme in priority order.
+    With multi_label=True, returns every matching theme joined by '; ' instead.
+    """
+    themes, default = load_themes(path)
+    names = [name for name, _ in themes]
+    if len(texts) == 0:
+        return np.array([], dtype=object)
+
+    hits = match_matrix(texts, path)
+    if not multi_label:
+        return np.select(list(hits.T), names, default=default).astype(object)
+
+    labels = np.full(len(texts), '', dtype=object)
+    for name, column in zip(names, hits.T):
+        labels[column] = np.where(labels[column] == '', name, labels[column] + '; ' + name)
+    labels[labels == ''] = default
+    return labels
@@ -0,0 +1,92 @@
+import json
+import os
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+from preprocess import clean_text_series
+import metrics
+
+LEXICON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'sentiment_lexicon.json')
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(path=LEXICON_FILE):
+    """
+    Loads the fast-path lexicon and builds one whole-word regex per word list
+    (kept as pattern strings so pandas can run them on pyarrow strings).
+    Returns (positive, negative, negators, max_words, confidence, rating_only,
+    rating_only_confidence).
+    """
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    def words(key):
+        return r'\b(?:' + '|'.join(re.escape(w.lower()) for w in config[key]) + r')\b'
+
+    return (words('positive'), words('negative'), words('negators'),
+            config.get('max_words', 3), config.get('confidence', 0.99), config.get('rating_only', False),
+            config.get('rating_only_confidence', 0.5))
+
+
+def fast_path(texts, ratings, path=LEXICON_FILE):
+    """
+    Labels the reviews that are decisive without the model; everything else is None.
+    - Short reviews (<= max_words, no negator) whose lexicon hits all point
+      one way and whose star rating agrees ("nice" / 5 stars, "worst app" / 1 star).
+    - With rating_only (off by default), reviews with no Latin-letter text
+      left (emoji only, Amharic) and a clearly positive (4-5) or negative (1-2)
+      rating. The English model can't read these, so its labels for them are
+      mostly noise, but the rating alone is no sure thing either: these rows
+      get rating_only_confidence (0.5), not the lexicon tier's confidence, so
+      confidence filters and --neutral-band treat them as uncertain.
+    Returns (labels with None for undecided rows, scores).
+    """
+    positive, negative, negators, max_words, confidence, rating_only, rating_only_confidence = load_lexicon(path)
+    clean = clean_text_series(pd.Series(texts, dtype=object).reset_index(drop=True))
+    ratings = pd.to_numeric(pd.Series(ratings).reset_index(drop=True), errors='coerce').to_numpy()
+
+    empty = (clean == '').to_numpy() & rating_only
+    short = (clean != '').to_numpy() & (clean.str.count(' ') + 1 <= max_words).to_numpy() & \
+        ~clean.str.contains(negators, regex=True).to_numpy(dtype=bool)
+    has_pos = clean.str.contains(positive, regex=True).to_numpy(dtype=bool)
+    has_neg = clean.str.contains(negative, regex=True).to_numpy(dtype=bool)
+
+    is_positive = (short & has_pos & ~has_neg | empty) & (ratings >= 4)
+    is_negative = (short & has_neg & ~has_pos | empty) & (ratings <= 2)
+
+    labels = np.select([is_positive, is_negative], ['POSITIVE', 'NEGATIVE'], default=None).astype(object)
+    scores = np.where(is_positive | is_negative, np.where(empty, rating_only_confidence, confidence), np.nan)
+    return labels, scores
+
+
+def score_tiered(texts, ratings, model_scorer, path=LEXICON_FILE):
+    """
+    Fast path first; only the undecided reviews go to model_scorer(texts) -> (labels, scores).
+    Returns (labels, scores, routed) where routed marks the rows the model scored.
+    """
+    labels, scores = fast_path(texts, ratings, path)
+    routed = pd.isna(labels)
+    metrics.count('sentiment.fast_path_rows', (~routed).sum())
+    if routed.any():
+        texts = np.asarray(texts, dtype=object)
+        labels[routed], scores[routed] = model_scorer(texts[routed].tolist())
+    return labels, scores.astype(np.float64), routed
+
+
+def agreement_report(labels, reference, routed):
+    """
+    How often the tiered labels match a full-model run (`reference`), overall
+    and on the fast-path rows alone, plus the share of rows that needed the model.
+    """
+    labels, reference = np.asarray(labels, dtype=object), np.asarray(reference, dtype=object)
+    fast = ~np.asarray(routed, dtype=bool)
+    same = labels == reference
+    return {
+        'rows': len(labels),
+        'model_fraction': float((~fast).mean()) if len(labels) else 0.0,
+        'agreement': float(same.mean()) if len(labels) else 1.0,
+        'fast_path_agreement': float(same[fast].mean()) if fast.any() else 1.0,
+        'confusion': pd.crosstab(pd.Series(reference, name='model'), pd.Series(labels, name='tiered')),
+    }
@@ -0,0 +1,316 @@
+import argparse
+import os
+import pickle
+from collections import Counter, deque
+import numpy as np
+import pandas as pd
+
+from registry import name_terms, shard_key, shard_path
+from storage import dataset_path, iter_reviews
+from themes import load_themes, THEMES_FILE
+import metrics
+
+INPUT_FILE = dataset_path('processed')
+# Model, term counts and the hashes of the reviews already fitted
+STATE_FILE = 'data/cache/topics/state.pkl'
+REPORT_FILE = 'reports/topics.csv'
+SUGGESTIONS_FILE = 'reports/theme_suggestions.csv'
+
+MODELS = ('nmf', 'lda')
+N_TOPICS = 10
+N_FEATURES = 2 ** 17  # hashed unigram + bigram buckets
+CHUNKSIZE = 20_000  # reviews per partial_fit call
+TOP_TERMS = 10
+# Terms kept for naming hash buckets; pruned back to this when it doubles
+MAX_TERMS = 200_000
+# Words in nearly every review that would dominate every topic; the bank and app
+# names of config/apps.json are added to these (see make_vectorizer)
+TOPIC_STOPWORDS = ['app', 'application', 'bank', 'banking', 'mobile']
+# A topic is suggested as a new theme when this share of its weight sits in the default theme
+NEW_THEME_SHARE = 0.5
+
+
+def make_vectorizer(kind='nmf'):
+    """
+    Stateless hashing vectorizer over lemmatized_content: no vocabulary to fit
+    or store, so chunks can be vectorized in any process and in any order.
+    NMF gets l2-normalized rows, LDA raw counts.
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(n_features=N_FEATURES, ngram_range=(1, 2), alternate_sign=False,
+                             stop_words=sorted(set(TOPIC_STOPWORDS) | set(name_terms())), norm='l2' if kind == 'nmf' else None)
+
+
+def _vectorize_chunk(args):
+    """(kind, texts) -> (sparse matrix, term counts); runs in worker processes."""
+    kind, texts = args
+    vectorizer = make_vectorizer(kind)
+    analyzer = vectorizer.build_analyzer()
+    counts = Counter()
+    for text in texts:
+        counts.update(analyzer(text))
+    return vectorizer.transform(texts), counts
+
+
+def _imap_bounded(fn, items, workers, ahead=2):
+    """fn over items in order; with workers > 1 in a process pool, at most workers * ahead items in flight."""
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= workers * ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def review_hashes(ids):
+    return pd.util.hash_array(np.asarray(ids, dtype=object).astype(str).astype(object))
+
+
+class TopicModel:
+    """
+    Online topic model (MiniBatchNMF or online LDA) over hashed features.
+    partial_fit() only learns from reviews whose review_id it hasn't seen, so
+    the model can be saved after every chunk and resumed, or updated as new
+    reviews arrive.
+    """
+
+    def __init__(self, kind='nmf', n_topics=N_TOPICS, seed=0):
+        if kind not in MODELS:
+            raise ValueError(f"Unknown topic model '{kind}'. Choose from: {', '.join(MODELS)}")
+        from sklearn.decomposition import LatentDirichletAllocation, MiniBatchNMF
+
+        self.kind = kind
+        if kind == 'nmf':
+            self.model = MiniBatchNMF(n_components=n_topics, batch_size=1024, random_state=seed)
+        else:
+            self.model = LatentDirichletAllocation(n_components=n_topics, learning_method='online',
+                                                   batch_size=1024, random_state=seed)
+        self.term_counts = Counter()
+        self.seen = np.zeros(0, dtype=np.uint64)
+
+    @property
+    def fitted(self):
+        return hasattr(self.model, 'components_')
+
+    def is_new(self, ids):
+        return ~np.isin(review_hashes(ids), self.seen)
+
+    def partial_fit(self, X, counts, ids):
+        """One online update from an already vectorized chunk."""
+        self.model.partial_fit(X)
+        self.term_counts.update(counts)
+        if len(self.term_counts) > 2 * MAX_TERMS:
+            self.term_counts = Counter(dict(self.term_counts.most_common(MAX_TERMS)))
+        self.seen = np.union1d(self.seen, review_hashes(ids))
+
+    def fit_chunks(self, chunks, workers=1, path=None):
+        """
+        partial_fit over (texts, ids) chunks, skipping reviews already fitted.
+        Vectorizing runs ahead in `workers` processes while the main process
+        updates the model. With a path, the state is saved after every chunk.
+        Returns the number of reviews fitted.
+        """
+        def new_chunks():
+            for texts, ids in chunks:
+                new = self.is_new(ids)
+                if new.any():
+                    yield np.asarray(texts, dtype=object)[new].tolist(), np.asarray(ids, dtype=object)[new]
+
+        fitted = 0
+        pending = deque()
+
+        def jobs():
+            for texts, ids in new_chunks():
+                pending.append(ids)
+                yield self.kind, texts
+
+        for X, counts in _imap_bounded(_vectorize_chunk, jobs(), workers):
+            ids = pending.popleft()
+            self.partial_fit(X, counts, ids)
+            fitted += len(ids)
+            metrics.count('topics.fitted', len(ids))
+            print(f"    fitted {fitted} reviews")
+            if path:
+                self.save(path)
+        return fitted
+
+    def feature_names(self):
+        """Name of each hash bucket: its most frequent term ('' for unseen buckets)."""
+        from sklearn.feature_extraction import FeatureHasher
+
+        names = np.full(N_FEATURES, '', dtype=object)
+        if not self.term_counts:
+            return names
+        terms, counts = zip(*self.term_counts.most_common())
+        hasher = FeatureHasher(n_features=N_FEATURES, input_type='string', alternate_sign=False)
+        buckets = hasher.transform([[t] for t in terms]).indices
+        # Most frequent first, so the first term claiming a bucket names it
+        first = pd.Series(buckets).drop_duplicates(keep='first')
+        names[first.to_numpy()] = np.asarray(terms, dtype=object)[first.index]
+        return names
+
+    def top_terms(self, n=TOP_TERMS, weights=None):
+        """Top n terms per topic, optionally re-weighted per bucket (e.g. by a bank's term frequencies)."""
+        names = self.feature_names()
+        scores = self.model.components_ * (weights if weights is not None else 1.0)
+        scores[:, names == ''] = 0
+        top = np.argsort(-scores, axis=1)[:, :n]
+        return [[names[f] for f in row if scores[k, f] > 0] for k, row in enumerate(top)]
+
+    def save(self, path=STATE_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path=STATE_FILE):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def read_chunks(input_file, chunksize=CHUNKSIZE, columns=('lemmatized_content', 'review_id')):
+    """Yields the dataset in chunks of the given columns, empty texts as ''."""
+    for df in iter_reviews(input_file, chunksize):
+        df['lemmatized_content'] = df['lemmatized_content'].fillna('').astype(str)
+        yield tuple(df[c].to_numpy(dtype=object) for c in columns)
+
+
+def topic_report(topic_model, chunks, workers=1, n=TOP_TERMS):
+    """
+    One pass over (texts, banks, themes) chunks with the fitted model.
+    Returns (per-bank table: topic, bank_name, share, top_terms;
+             theme x topic weight table).
+    A bank's top terms for a topic weight the topic's terms by how often the
+    bank's reviews use them.
+    """
+    n_topics = topic_model.model.n_components
+    bank_topics, bank_terms, theme_topics = {}, {}, {}
+
+    meta = deque()
+
+    def jobs():
+        for texts, banks, themes in chunks:
+            meta.append((banks, themes))
+            yield topic_model.kind, texts.tolist()
+
+    for X, _ in _imap_bounded(_vectorize_chunk, jobs(), workers):
+        banks, themes = meta.popleft()
+        W = topic_model.model.transform(X)
+        for bank in pd.unique(banks):
+            rows = banks == bank
+            bank_topics[bank] = bank_topics.get(bank, np.zeros(n_topics)) + W[rows].sum(axis=0)
+            bank_terms[bank] = bank_terms.get(bank, np.zeros(N_FEATURES, dtype=np.float32)) + \
+                np.asarray(X[rows].sum(axis=0)).ravel().astype(np.float32)
+        for theme in pd.unique(themes):
+            theme_topics[theme] = theme_topics.get(theme, np.zeros(n_topics)) + W[themes == theme].sum(axis=0)
+
+    rows = []
+    for bank in sorted(bank_topics):
+        share = bank_topics[bank] / max(bank_topics[bank].sum(), 1e-12)
+        for k, terms in enumerate(topic_model.top_terms(n, bank_terms[bank])):
+            rows.append({'topic': k, 'bank_name': bank, 'share': round(float(share[k]), 3),
+                         'top_terms': ', '.join(terms)})
+    report = pd.DataFrame(rows, columns=['topic', 'bank_name', 'share', 'top_terms'])
+    theme_table = pd.DataFrame(theme_topics).T.reindex(columns=range(n_topics)).fillna(0.0)
+    return report, theme_table
+
+
+def suggest_keywords(topic_model, theme_table, path=THEMES_FILE, n=TOP_TERMS):
+    """
+    Keyword candidates for config/themes.json. Each topic is attributed to the
+    theme holding most of its weight; its top terms that no existing keyword
+    already matches are suggested for that theme. Topics that mostly land in
+    the default theme ('General') are suggested as new clusters instead.
+    """
+    themes, default = load_themes(path)
+    if theme_table.empty:
+        return pd.DataFrame(columns=['topic', 'theme', 'share', 'suggested_keywords', 'top_terms'])
+    shares = theme_table / theme_table.sum(axis=0).replace(0, 1)
+    rows = []
+    for k, terms in enumerate(topic_model.top_terms(n)):
+        theme = shares[k].idxmax()
+        uncovered = [t for t in terms if not any(pattern.search(t) for _, pattern in themes)]
+        if theme == default and shares.loc[theme, k] < NEW_THEME_SHARE:
+            continue
+        rows.append({'topic': k, 'theme': f"new cluster ({default})" if theme == default else theme,
+                     'share': round(float(shares.loc[theme, k]), 3),
+                     'suggested_keywords': ', '.join(uncovered), 'top_terms': ', '.join(terms)})
+    return pd.DataFrame(rows, columns=['topic', 'theme', 'share', 'suggested_keywords', 'top_terms'])
+
+
+def discover_topics(input_file=INPUT_FILE, state_file=STATE_FILE, kind='nmf', n_topics=N_TOPICS,
+                    chunksize=CHUNKSIZE, workers=1, rebuild=False):
+    """
+    Resumes (or starts) the topic model, fits the reviews it hasn't seen,
+    then writes the per-bank topic report and the theme keyword suggestions.
+    """
+    topic_model = TopicModel.load(state_file) if os.path.exists(state_file) and not rebuild else None
+    if topic_model is not None and (topic_model.kind, topic_model.model.n_components) != (kind, n_topics):
+        print(f"Saved model is {topic_model.kind} with {topic_model.model.n_components} topics; starting a new one.")
+        topic_model = None
+    if topic_model is None:
+        topic_model = TopicModel(kind, n_topics)
+    else:
+        print(f"Resuming {kind} topic model ({len(topic_model.seen)} reviews already fitted).")
+
+    with metrics.stage('topics_fit'):
+        fitted = topic_model.fit_chunks(read_chunks(input_file, chunksize), workers, state_file)
+    print(f"Fitted {fitted} new reviews.")
+    if not topic_model.fitted:
+        print("No reviews to fit; nothing to report.")
+        return None, None
+
+    with metrics.stage('topics_report'):
+        chunks = read_chunks(input_file, chunksize, ('lemmatized_content', 'bank_name', 'theme'))
+        report, theme_table = topic_report(topic_model, chunks, workers)
+        suggestions = suggest_keywords(topic_model, theme_table)
+    return report, suggestions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discover review topics and suggest theme keywords.")
+    parser.add_argument('--input', default=INPUT_FILE, help="Processed reviews dataset")
+    parser.add_argument('--model', choices=MODELS, default='nmf', help="MiniBatchNMF or online LDA")
+    parser.add_argument('--topics', type=int, default=N_TOPICS)
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="Reviews per partial_fit")
+    parser.add_argument('--workers', type=int, default=1, help="Processes vectorizing chunks")
+    parser.add_argument('--rebuild', action='store_true', help="Start a new model instead of resuming")
+    parser.add_argument('--app', default=None,
+                        help="Only this app, reading and writing its own shard (see registry.py)")
+    args = parser.parse_args()
+    try:
+        app = shard_key(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    input_file = shard_path(args.input, app)
+    report_file, suggestions_file = shard_path(REPORT_FILE, app), shard_path(SUGGESTIONS_FILE, app)
+
+    if not os.path.exists(input_file):
+        print(f"ERROR: {input_file} not found. Please run 'python src/analysis.py' first.")
+        raise SystemExit(1)
+
+    with metrics.run('topics'):
+        report, suggestions = discover_topics(input_file, shard_path(STATE_FILE, app), kind=args.model,
+                                              n_topics=args.topics,
+                                              chunksize=args.chunksize, workers=args.workers,
+                                              rebuild=args.rebuild)
+        if report is not None:
+            os.makedirs(os.path.dirname(report_file), exist_ok=True)
+            report.to_csv(report_file, index=False)
+            suggestions.to_csv(suggestions_file, index=False)
+            with pd.option_context('display.max_colwidth', 90, 'display.width', 200):
+                print("\n>>> Topics per bank")
+                print(report.to_string(index=False))
+                print("\n>>> Theme keyword suggestions")
+                print(suggestions.to_string(index=False))
+            print(f"\nSaved {report_file} and {suggestions_file}")
@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from registry import shard_key, shard_path
+from storage import dataset_path, read_reviews
+import metrics
+
+INPUT_FILE = dataset_path('processed')
+# Daily count cube and the cells each counted review_id contributes to it
+TREND_DIR = 'data/cache/trends'
+ALERTS_FILE = 'reports/trend_alerts.csv'
+FIGURE_FILE = 'reports/figures/sentiment_trend.png'
+TREND_COLUMNS = ['review_id', 'at', 'bank_name', 'sentiment_label', 'theme', 'score']
+
+# Spike detection: a day is flagged when its count is Z_THRESHOLD standard
+# deviations above the EWMA of the days before it
+EWMA_SPAN = 28  # days
+Z_THRESHOLD = 3.0
+MIN_COUNT = 5  # ignore spikes smaller than this many reviews
+WARMUP_DAYS = 14  # no alerts until a bank has this much history
+ALERT_SERIES = ('sentiment:NEGATIVE', 'theme:')
+EPOCH = pd.Timestamp('1970-01-01')
+
+
+def rolling(counts, window):
+    """Sums over the last `window` days along axis 1 (days), via one cumulative sum."""
+    cs = np.cumsum(counts, axis=1, dtype=np.int64)
+    cs[:, window:] -= cs[:, :-window].copy()
+    return cs
+
+
+def ewma_zscores(counts, span=EWMA_SPAN):
+    """
+    For counts shaped (..., days): the EWMA of the previous days (expected
+    value) and how many EW standard deviations each day is above it.
+    The standard deviation is floored at the Poisson noise of the EWMA
+    (sqrt of it, and at least 1 review), so neither quiet nor busy series alert
+    on ordinary day-to-day variation. Vectorized over everything but the day axis.
+    """
+    alpha = 2 / (span + 1)
+    counts = counts.astype(np.float64)
+    expected = np.zeros_like(counts)
+    z = np.zeros_like(counts)
+    mean = counts[..., 0].copy()
+    var = np.zeros_like(mean)
+    for t in range(1, counts.shape[-1]):
+        x = counts[..., t]
+        expected[..., t] = mean
+        z[..., t] = (x - mean) / np.maximum(np.sqrt(np.maximum(var, mean)), 1.0)
+        diff = x - mean
+        mean = mean + alpha * diff
+        var = (1 - alpha) * (var + alpha * diff ** 2)
+    return expected, z
+
+
+class TrendCounts:
+    """
+    Review counts per (bank, day, series), where the series are
+    'sentiment:<label>', 'rating:<stars>' and 'theme:<theme>' (negative
+    reviews per theme, i.e. pain points).
+    Every counted review is remembered by a hash of its review_id, together
+    with the cube cells it was counted in, so add() counts reviews it hasn't
+    seen (whatever their date or bank) and moves reviews whose bank, date,
+    label, rating or theme changed since, e.g. after a sentiment backend switch.
+    """
+
+    def __init__(self):
+        self.banks = []
+        self.series = []
+        self.first_day = 0
+        self.counts = np.zeros((0, 0, 0), dtype=np.int32)
+        # Sorted review_id hashes and, per review: bank, day, sentiment/rating/theme series (-1 = none)
+        self.ids = np.zeros(0, dtype=np.uint64)
+        self.cells = np.zeros((0, 5), dtype=np.int32)
+
+    @property
+    def dates(self):
+        return EPOCH + pd.to_timedelta(self.first_day + np.arange(self.counts.shape[1]), unit='D')
+
+    @staticmethod
+    def _hashes(df, at):
+        # Reviews without a store id are identified by bank and timestamp
+        ids = df['review_id'] if 'review_id' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        missing = ids.isna().to_numpy()
+        keys = ids.astype(str).to_numpy(dtype=object)
+        if missing.any():
+            keys[missing] = (df['bank_name'][missing].astype(str) + '|' + at[missing].astype(str)).to_numpy(dtype=object)
+        # Ids are (nearly) all distinct, so hashing them directly beats categorizing first
+        return pd.util.hash_array(keys, categorize=False)
+
+    def _cells(self, df, at):
+        """(rows, 5) cells of each review, growing the cube for new banks, series and days."""
+        day = at.to_numpy().astype('datetime64[D]').astype(np.int64)
+        banks, bank_names = pd.factorize(df['bank_name'].astype(str))
+        labels, label_names = pd.factorize(df['sentiment_label'].astype(str))
+        ratings, rating_values = pd.factorize(pd.to_numeric(df['score'], errors='coerce'))
+        themes, theme_names = pd.factorize(df['theme'].astype(str))
+        negative = np.asarray(label_names == 'NEGATIVE', dtype=bool)[labels]
+
+        # Every review has a sentiment and a rating, negative reviews also count
+        # towards their theme. Series names are built for the few distinct values only.
+        memberships = [
+            (labels, [f"sentiment:{v}" for v in label_names]),
+            (np.where(negative, themes, -1), [f"theme:{v}" for v in theme_names]),
+            (ratings, [f"rating:{int(v)}" for v in rating_values]),
+        ]
+        self._grow(list(bank_names), [name for _, names in memberships for name in names], day.min(), day.max())
+
+        cells = np.full((len(df), 5), -1, dtype=np.int32)
+        cells[:, 0] = pd.Index(self.banks).get_indexer(bank_names)[banks]
+        cells[:, 1] = day
+        for col, (codes, names) in enumerate(memberships, start=2):
+            lookup = pd.Index(self.series).get_indexer(names) if names else np.zeros(0, dtype=np.int64)
+            cells[codes >= 0, col] = lookup[codes[codes >= 0]]
+        return cells
+
+    def _count(self, cells, sign):
+        """Adds (sign=1) or removes (sign=-1) the reviews with these cells from the cube."""
+        for col in (2, 3, 4):
+            rows = cells[cells[:, col] >= 0]
+            flat = np.ravel_multi_index((rows[:, 0], rows[:, 1] - self.first_day, rows[:, col]), self.counts.shape)
+            self.counts += sign * np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape).astype(np.int32)
+
+    def add(self, df):
+        """
+        Counts the reviews of df not seen before and recounts the ones whose
+        cells changed. Returns how many reviews were counted or recounted.
+        """
+        at = pd.to_datetime(df['at'], errors='coerce')
+        keep = at.notna().to_numpy()
+        df, at = df[keep], at[keep]
+        if df.empty:
+            return 0
+
+        hashes = self._hashes(df, at)
+        # The last row wins when a review_id repeats within df
+        last = ~pd.Series(hashes).duplicated(keep='last').to_numpy()
+        df, at, hashes = df[last], at[last], hashes[last]
+        cells = self._cells(df, at)
+
+        # Looking the hashes up in sorted order keeps searchsorted cache-friendly
+        order = np.argsort(hashes)
+        pos = np.empty(len(hashes), dtype=np.int64)
+        pos[order] = np.searchsorted(self.ids, hashes[order])
+        found = pos < len(self.ids)
+        found[found] = self.ids[pos[found]] == hashes[found]
+        changed = np.zeros(len(df), dtype=bool)
+        changed[found] = (self.cells[pos[found]] != cells[found]).any(axis=1)
+
+        self._count(self.cells[pos[changed]], -1)
+        self.cells[pos[changed]] = cells[changed]
+        new = ~found
+        self._count(cells[new | changed], 1)
+
+        if new.any():
+            ids = np.concatenate([self.ids, hashes[new]])
+            order = np.argsort(ids, kind='stable')
+            self.ids, self.cells = ids[order], np.concatenate([self.cells, cells[new]])[order]
+        return int(new.sum() + changed.sum())
+
+    def _grow(self, banks, series, first_day, last_day):
+        """Pads the cube for new banks, series and days outside the current range."""
+        self.banks += [b for b in banks if b not in self.banks]
+        self.series += sorted(s for s in series if s not in self.series)
+        if self.counts.shape[1]:
+            first_day, last_day = min(first_day, self.first_day), max(last_day, self.first_day + self.counts.shape[1] - 1)
+        grown = np.zeros((len(self.banks), last_day - first_day + 1, len(self.series)), dtype=np.int32)
+        b, d, s = self.counts.shape
+        offset = self.first_day - first_day if d else 0
+        grown[:b, offset:offset + d, :s] = self.counts
+        self.counts, self.first_day = grown, int(first_day)
+
+    def series_counts(self, name):
+        """(banks, days) counts of one series (zeros if it never occurred)."""
+        if name not in self.series:
+            return np.zeros(self.counts.shape[:2], dtype=np.int64)
+        return self.counts[:, :, self.series.index(name)].astype(np.int64)
+
+    def rolling_frame(self, window=7):
+        """Long table of rolling `window`-day counts: date, bank_name, series, count (zeros dropped)."""
+        rolled = rolling(self.counts, window)
+        b, d, s = np.nonzero(rolled)
+        return pd.DataFrame({'date': self.dates[d], 'bank_name': np.array(self.banks, dtype=object)[b],
+                             'series': np.array(self.series, dtype=object)[s], 'count': rolled[b, d, s]})
+
+    def alerts(self, window=1, z_threshold=Z_THRESHOLD, min_count=MIN_COUNT, span=EWMA_SPAN):
+        """
+        Spikes in the negative reviews of each bank, overall and per theme:
+        days whose rolling `window`-day count is at least min_count and
+        z_threshold EW standard deviations above the EWMA of the days before.
+        """
+        columns = ['date', 'bank_name', 'series', 'count', 'expected', 'z']
+        picked = [i for i, name in enumerate(self.series) if name.startswith(ALERT_SERIES)]
+        if not picked or not self.counts.size:
+            return pd.DataFrame(columns=columns)
+
+        counts = rolling(self.counts[:, :, picked], window).transpose(0, 2, 1)  # (banks, series, days)
+        expected, z = ewma_zscores(counts, span)
+
+        # Days before a bank's first review + warm-up can't alert
+        active = self.counts.sum(axis=2) > 0
+        first_active = np.where(active.any(axis=1), active.argmax(axis=1), self.counts.shape[1])
+        warm = np.arange(self.counts.shape[1])[None, :] >= (first_active + WARMUP_DAYS)[:, None]
+
+        flagged = (z >= z_threshold) & (counts >= min_count) & warm[:, None, :]
+        b, s, d = np.nonzero(flagged)
+        alerts = pd.DataFrame({
+            'date': self.dates[d],
+            'bank_name': np.array(self.banks, dtype=object)[b],
+            'series': np.array(self.series, dtype=object)[np.array(picked)[s]],
+            'count': counts[b, s, d],
+            'expected': expected[b, s, d].round(1),
+            'z': z[b, s, d].round(1),
+        }, columns=columns)
+        return alerts.sort_values(['date', 'z'], ascending=[False, False]).reset_index(drop=True)
+
+    def save(self, path=TREND_DIR):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'counts.npy'), self.counts)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        np.save(os.path.join(path, 'cells.npy'), self.cells)
+        meta = {'banks': self.banks, 'series': self.series, 'first_day': self.first_day}
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    @classmethod
+    def load(cls, path=TREND_DIR):
+        trends = cls()
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path) or not os.path.exists(os.path.join(path, 'ids.npy')):
+            # Nothing saved yet, or a cube from before review ids were kept: count from scratch
+            return trends
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        trends.counts = np.load(os.path.join(path, 'counts.npy'))
+        trends.banks, trends.series, trends.first_day = meta['banks'], meta['series'], meta['first_day']
+        trends.ids = np.load(os.path.join(path, 'ids.npy'))
+        trends.cells = np.load(os.path.join(path, 'cells.npy'))
+        return trends
+
+
+def plot_trend(trends, alerts, path=FIGURE_FILE, window=7):
+    """Rolling negative share per bank, with the negative-review alerts marked."""
+    import matplotlib.pyplot as plt
+
+    if not trends.banks:
+        return
+    total = rolling(sum(trends.series_counts(s) for s in trends.series if s.startswith('sentiment:')), window)
+    negative = rolling(trends.series_counts('sentiment:NEGATIVE'), window)
+    share = np.where(total > 0, negative / np.maximum(total, 1) * 100, np.nan)
+    dates = trends.dates
+
+    plt.figure(figsize=(12, 5))
+    for i, bank in enumerate(trends.banks):
+        line, = plt.plot(dates, share[i], label=bank)
+        flagged = alerts[(alerts['bank_name'] == bank)]
+        days = ((pd.to_datetime(flagged['date']) - dates[0]).dt.days).unique()
+        plt.scatter(dates[days], share[i, days], color=line.get_color(), marker='x', s=60, zorder=3)
+    plt.title(f'Negative Reviews ({window}-day rolling share, x = alert)')
+    plt.ylabel('Negative (%)')
+    plt.legend()
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    plt.savefig(path)
+    plt.close()
+    print(f"[SUCCESS] Saved {path}")
+
+
+def update_trends(input_file=INPUT_FILE, path=TREND_DIR, rebuild=False):
+    """Loads the saved cube (unless rebuild), adds the new reviews of input_file and saves it."""
+    trends = TrendCounts() if rebuild else TrendCounts.load(path)
+    with metrics.stage('trends_read'):
+        df = read_reviews(input_file, columns=TREND_COLUMNS)
+    with metrics.stage('trends_count'):
+        added = trends.add(df)
+    trends.save(path)
+    metrics.count('trends.added', added)
+    print(f"Counted {added} new or changed reviews; {len(trends.banks)} banks over {trends.counts.shape[1]} days.")
+    return trends
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily sentiment/theme trends and spike alerts per bank.")
+    parser.add_argument('--input', default=INPUT_FILE, help="Processed reviews dataset")
+    parser.add_argument('--rebuild', action='store_true', help="Recount every review instead of only new ones")
+    parser.add_argument('--window', type=int, default=1, help="Days summed before detection (1 = daily, 7 = weekly)")
+    parser.add_argument('--z', type=float, default=Z_THRESHOLD, help="Alert threshold in standard deviations")
+    parser.add_argument('--min-count', type=int, default=MIN_COUNT)
+    parser.add_argument('--alerts', default=ALERTS_FILE, help="Where to write the alert table")
+    parser.add_argument('--app', default=None,
+                        help="Only this app, reading and writing its own shard (see registry.py)")
+    args = parser.parse_args()
+    try:
+        app = shard_key(args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    input_file, alerts_file = shard_path(args.input, app), shard_path(args.alerts, app)
+
+    if not os.path.exists(input_file):
+        print(f"ERROR: {input_file} not found. Please run 'python src/analysis.py' first.")
+        raise SystemExit(1)
+
+    with metrics.run('trends'):
+        trends = update_trends(input_file, shard_path(TREND_DIR, app), rebuild=args.rebuild)
+        with metrics.stage('trends_detect'):
+            alerts = trends.alerts(args.window, args.z, args.min_count)
+        os.makedirs(os.path.dirname(alerts_file) or '.', exist_ok=True)
+        alerts.to_csv(alerts_file, index=False)
+        print(f"\n{len(alerts)} alerts written to {alerts_file}")
+        if not alerts.empty:
+            print(alerts.head(20).to_string(index=False))
+        with metrics.stage('trends_plot'):
+            plot_trend(trends, alerts, shard_path(FIGURE_FILE, app))
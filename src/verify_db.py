@@ -1,52 +1,71 @@
-python
-import pandas as pd
-from sqlalchemy import create_engine
+import argparse
 from sqlalchemy import text
-import os
-from dotenv import load_dotenv
-
-# Load Config
-load_dotenv()
-DB_USER = os.getenv('DB_USER')
-DB_PASS = os.getenv('DB_PASS')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-
-def verify_data():
-    """Runs a suite of SQL checks to verify data integrity."""
+
+from db import get_engine
+
+VALID_SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+
+# All integrity checks in one round trip
+CHECKS_SQL = f"""
+SELECT
+    (SELECT COUNT(*) FROM reviews) AS review_count,
+    (SELECT COUNT(*) FROM reviews WHERE bank_id NOT IN (SELECT bank_id FROM banks)) AS orphan_count,
+    (SELECT COUNT(*) FROM reviews
+     WHERE sentiment_label NOT IN ({', '.join(f"'{s}'" for s in VALID_SENTIMENTS)})) AS invalid_sentiment_count
+"""
+
+
+def run_checks(conn):
+    """Returns the integrity counts: review_count, orphan_count, invalid_sentiment_count."""
+    return dict(conn.execute(text(CHECKS_SQL)).mappings().one())
+
+
+def verify_data(engine=None):
+    """Runs a suite of SQL checks to verify data integrity. Returns True if all pass."""
     print("🕵️ Starting Database Verification...")
-    
+
     try:
-        engine = create_engine(f'postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
-        conn = engine.connect()
+        engine = engine or get_engine()
+        with engine.connect() as conn:
+            results = run_checks(conn)
     except Exception as e:
         print(f"❌ Connection Failed: {e}")
-        return
+        return False
 
     # TEST 1: Check Row Counts
-    count = conn.execute(text("SELECT COUNT(*) FROM reviews;")).scalar()
+    count = results['review_count']
     if count > 0:
         print(f"✅ PASS: Data exists ({count} reviews found).")
     else:
         print("❌ FAIL: Reviews table is empty.")
 
     # TEST 2: Check Referential Integrity (Orphans)
-    orphans = conn.execute(text("SELECT COUNT(*) FROM reviews WHERE bank_id NOT IN (SELECT bank_id FROM banks);")).scalar()
+    orphans = results['orphan_count']
     if orphans == 0:
         print("✅ PASS: Referential Integrity maintained (No orphan reviews).")
     else:
         print(f"❌ FAIL: Found {orphans} reviews with invalid bank_ids.")
 
     # TEST 3: Check Sentiment Validity
-    invalid_sentiments = conn.execute(text("SELECT COUNT(*) FROM reviews WHERE sentiment_label NOT IN ('POSITIVE', 'NEGATIVE', 'NEUTRAL');")).scalar()
+    invalid_sentiments = results['invalid_sentiment_count']
     if invalid_sentiments == 0:
         print("✅ PASS: All sentiment labels are valid.")
     else:
         print(f"❌ FAIL: Found {invalid_sentiments} rows with invalid sentiment labels.")
 
-    conn.close()
     print("🏁 Verification Complete.")
+    return count > 0 and orphans == 0 and invalid_sentiments == 0
+
 
 if __name__ == "__main__":
-    verify_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Verify the integrity of the reviews database.")
+    parser.add_argument('--db-url', default=None,
+                        help="SQLAlchemy URL (default: DATABASE_URL, then the DB_* settings in .env)")
+    args = parser.parse_args()
+
+    try:
+        engine = get_engine(args.db_url)
+    except RuntimeError as e:
+        print(f"❌ Connection Failed: {e}")
+        exit(1)
+    exit(0 if verify_data(engine) else 1)
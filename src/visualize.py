@@ -1,69 +1,142 @@
+import argparse
+import os
+from collections import Counter
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sqlalchemy import create_engine
-from wordcloud import WordCloud
-import os
-from dotenv import load_dotenv
-
-# Load Config
-load_dotenv()
-DB_USER = os.getenv('DB_USER')
-DB_PASS = os.getenv('DB_PASS')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-
-if not DB_PASS:
-    print("[ERROR] DB_PASS not found in .env file.")
-    exit()
-
-# Connect
-engine = create_engine(f'postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
-
-print("[INFO] Fetching data...")
-query = """
-SELECT r.review_text, r.rating, r.sentiment_label, b.bank_name
-FROM reviews r
-JOIN banks b ON r.bank_id = b.bank_id
+from sqlalchemy import text
+
+from db import get_engine
+
+OUTPUT_DIR = 'reports/figures'
+TEXT_CHUNK_ROWS = 5_000
+SENTIMENT_ORDER = ['NEGATIVE', 'NEUTRAL', 'POSITIVE']
+
+# Aggregations read the daily rollups that database.py maintains, not the reviews
+# table; only one row per bank (x sentiment) comes back
+SENTIMENT_COUNTS_SQL = """
+SELECT b.bank_name, d.sentiment_label, SUM(d.review_count) AS count
+FROM daily_sentiment d
+JOIN banks b ON d.bank_id = b.bank_id
+GROUP BY b.bank_name, d.sentiment_label
+ORDER BY b.bank_name, d.sentiment_label
+"""
+
+AVG_RATING_SQL = """
+SELECT b.bank_name, 1.0 * SUM(d.rating * d.review_count) / SUM(d.review_count) AS rating
+FROM daily_rating d
+JOIN banks b ON d.bank_id = b.bank_id
+WHERE d.rating > 0
+GROUP BY b.bank_name
+ORDER BY b.bank_name
+"""
+
+NEGATIVE_TEXT_SQL = """
+SELECT review_text
+FROM reviews
+WHERE sentiment_label = 'NEGATIVE' AND review_text IS NOT NULL
 """
-df = pd.read_sql(query, engine)
-
-if not os.path.exists('reports/figures'):
-    os.makedirs('reports/figures')
-
-sns.set_theme(style="whitegrid")
-
-# 1. Sentiment Distribution
-plt.figure(figsize=(10, 6))
-order = ['NEGATIVE', 'NEUTRAL', 'POSITIVE']
-sns.countplot(data=df, x='bank_name', hue='sentiment_label', hue_order=order, palette='viridis')
-plt.title('Sentiment Distribution per Bank', fontsize=14)
-plt.tight_layout()
-plt.savefig('reports/figures/sentiment_distribution.png')
-print("[SUCCESS] Saved sentiment_distribution.png")
-
-# 2. Avg Rating
-plt.figure(figsize=(8, 5))
-avg_rating = df.groupby('bank_name')['rating'].mean().reset_index()
-sns.barplot(data=avg_rating, x='bank_name', y='rating', palette='Blues_d')
-plt.axhline(y=4.0, color='r', linestyle='--', label='Target (4.0)')
-plt.title('Average User Rating', fontsize=14)
-plt.legend()
-plt.tight_layout()
-plt.savefig('reports/figures/avg_rating.png')
-print("[SUCCESS] Saved avg_rating.png")
-
-# 3. Pain Points
-neg_text = " ".join(review for review in df[df['sentiment_label'] == 'NEGATIVE']['review_text'].dropna())
-if len(neg_text) > 0:
-    wc = WordCloud(width=800, height=400, background_color='white', colormap='Reds').generate(neg_text)
+
+
+def fetch_sentiment_counts(conn):
+    """Reviews per (bank, sentiment label)."""
+    return pd.read_sql(text(SENTIMENT_COUNTS_SQL), conn)
+
+
+def fetch_avg_rating(conn):
+    """Mean star rating per bank."""
+    return pd.read_sql(text(AVG_RATING_SQL), conn)
+
+
+def iter_negative_texts(conn, chunksize=TEXT_CHUNK_ROWS):
+    """
+    Yields lists of NEGATIVE review texts, `chunksize` at a time.
+    stream_results uses a server-side cursor on PostgreSQL, so the full result never sits in memory.
+    """
+    result = conn.execution_options(stream_results=True).execute(text(NEGATIVE_TEXT_SQL))
+    for rows in result.partitions(chunksize):
+        yield [row[0] for row in rows]
+
+
+def word_frequencies(text_chunks, wordcloud):
+    """
+    Word counts accumulated chunk by chunk with the word cloud's own tokenizer
+    (stopwords, plurals), instead of joining every review into one string.
+    """
+    freqs = Counter()
+    for chunk in text_chunks:
+        freqs.update(wordcloud.process_text(" ".join(chunk)))
+    return freqs
+
+
+def plot_sentiment_distribution(counts, path):
+    plt.figure(figsize=(10, 6))
+    sns.barplot(data=counts, x='bank_name', y='count', hue='sentiment_label',
+                hue_order=SENTIMENT_ORDER, palette='viridis')
+    plt.title('Sentiment Distribution per Bank', fontsize=14)
+    plt.tight_layout()
+    plt.savefig(path)
+    print(f"[SUCCESS] Saved {os.path.basename(path)}")
+
+
+def plot_avg_rating(avg_rating, path):
+    plt.figure(figsize=(8, 5))
+    sns.barplot(data=avg_rating, x='bank_name', y='rating', palette='Blues_d')
+    plt.axhline(y=4.0, color='r', linestyle='--', label='Target (4.0)')
+    plt.title('Average User Rating', fontsize=14)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(path)
+    print(f"[SUCCESS] Saved {os.path.basename(path)}")
+
+
+def plot_pain_points(freqs, wordcloud, path):
+    wc = wordcloud.generate_from_frequencies(freqs)
     plt.figure(figsize=(10, 5))
     plt.imshow(wc, interpolation='bilinear')
     plt.axis('off')
     plt.title('Common Pain Points', fontsize=14)
     plt.tight_layout()
-    plt.savefig('reports/figures/pain_points_cloud.png')
-    print("[SUCCESS] Saved pain_points_cloud.png")
+    plt.savefig(path)
+    print(f"[SUCCESS] Saved {os.path.basename(path)}")
+
+
+def generate_charts(engine, output_dir=OUTPUT_DIR, chunksize=TEXT_CHUNK_ROWS):
+    from wordcloud import WordCloud
+
+    os.makedirs(output_dir, exist_ok=True)
+    sns.set_theme(style="whitegrid")
+
+    print("[INFO] Fetching aggregates...")
+    with engine.connect() as conn:
+        # 1. Sentiment Distribution
+        plot_sentiment_distribution(fetch_sentiment_counts(conn),
+                                    os.path.join(output_dir, 'sentiment_distribution.png'))
+
+        # 2. Avg Rating
+        plot_avg_rating(fetch_avg_rating(conn), os.path.join(output_dir, 'avg_rating.png'))
+
+        # 3. Pain Points
+        wordcloud = WordCloud(width=800, height=400, background_color='white', colormap='Reds')
+        freqs = word_frequencies(iter_negative_texts(conn, chunksize), wordcloud)
+        if freqs:
+            plot_pain_points(freqs, wordcloud, os.path.join(output_dir, 'pain_points_cloud.png'))
+
+    print("\n[DONE] Charts generated successfully.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate charts from the reviews database.")
+    parser.add_argument('--db-url', default=None,
+                        help="SQLAlchemy URL (default: DATABASE_URL, then the DB_* settings in .env)")
+    parser.add_argument('--chunksize', type=int, default=TEXT_CHUNK_ROWS,
+                        help="Negative review texts fetched per round trip")
+    args = parser.parse_args()
+
+    try:
+        engine = get_engine(args.db_url)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        exit(1)
 
-print("\n[DONE] Charts generated successfully.")
\ No newline at end of file
+    generate_charts(engine, chunksize=args.chunksize)
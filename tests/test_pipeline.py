@@ -1,6 +1,13 @@
+import os
+import subprocess
+import sys
 import pytest
 import pandas as pd
 
+# The pipeline scripts import each other as top-level modules
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
 def mock_get_bank_id(row_val):
     custom_map = {
         'CBE': 1,
@@ -29,4 +36,935 @@ def test_dataframe_columns():
     
     expected_cols = ['review_text', 'rating']
     for col in expected_cols:
-        assert col in df.columns
\ No newline at end of file
+        assert col in df.columns
+
+def test_sentiment_cache_lru(tmp_path):
+    """Ensure cached sentiment survives reopening and the size cap evicts the oldest entry"""
+    from sentiment_cache import SentimentCache, cache_key
+
+    path = str(tmp_path / 'cache.sqlite')
+    cache = SentimentCache(path, max_entries=2)
+    key_a = cache_key("Good app", "model", "rev")
+    assert key_a == cache_key("  good   APP ", "model", "rev")
+    assert key_a != cache_key("Good app", "model", "other-rev")
+
+    cache.put_many([(key_a, 'POSITIVE', 0.99)])
+    cache.put_many([("b", 'NEGATIVE', 0.9)])
+    cache.get_many([key_a])  # a is now more recently used than b
+    cache.put_many([("c", 'NEGATIVE', 0.8)])
+    cache.close()
+
+    reopened = SentimentCache(path, max_entries=2)
+    found = reopened.get_many([key_a, "b", "c"])
+    assert found[key_a] == ('POSITIVE', 0.99)
+    assert "b" not in found
+    assert (reopened.hits, reopened.misses) == (2, 1)
+
+def test_sentiment_cache_shared_by_concurrent_writers(tmp_path):
+    """Ensure shard workers can write to one cache file at the same time"""
+    import threading
+    from sentiment_cache import SentimentCache
+
+    path = str(tmp_path / 'cache.sqlite')
+    assert SentimentCache(path).conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+    def worker(shard):
+        cache = SentimentCache(path)
+        for i in range(50):
+            cache.put_many([(f"{shard}-{i}-{j}", 'POSITIVE', 0.9) for j in range(20)])
+            cache.get_many([f"{shard}-{i}-0"])
+        cache.close()
+
+    threads = [threading.Thread(target=worker, args=(shard,)) for shard in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(SentimentCache(path)) == 4 * 50 * 20
+
+def test_theme_priority_and_multi_label():
+    """Ensure compiled themes keep the old priority order and substring matching"""
+    from themes import assign_themes
+
+    texts = pd.Series(['slow login', 'app crash when i pay', 'nice screen', 'great', None, 'blogger'])
+    assert list(assign_themes(texts)) == [
+        'Authentication', 'Stability', 'User Experience', 'General', 'General', 'Authentication'
+    ]
+    multi = assign_themes(texts, multi_label=True)
+    assert multi[0] == 'Authentication; Performance'
+    assert multi[1] == 'Stability; Transactions'
+    assert multi[3] == 'General'
+
+def test_streaming_clean_matches_in_memory(tmp_path):
+    """Ensure chunked cleaning drops the same rows as clean_dataframe, even across chunks"""
+    from preprocess import clean_dataframe
+    from streaming import iter_clean_chunks, external_sort_csv
+
+    raw = pd.DataFrame({
+        'content': ['good', 'bad', 'good', None, 'good', 'slow'],
+        'score': [5, 1, 5, 3, 4, 2],
+        'at': ['2025-01-02', '2025-01-05', '2025-01-03', '2025-01-01', '2025-01-04', 'not a date'],
+        'bank_name': ['CBE', 'CBE', 'CBE', 'BOA', 'BOA', 'BOA'],
+    })
+    path = tmp_path / 'raw.csv'
+    raw.to_csv(path, index=False)
+
+    expected = clean_dataframe(pd.read_csv(path))
+    streamed = pd.concat(iter_clean_chunks(path, chunksize=2))
+    assert sorted(streamed.index) == sorted(expected.index)
+
+    streamed.to_csv(tmp_path / 'unsorted.csv', index=False)
+    external_sort_csv(tmp_path / 'unsorted.csv', tmp_path / 'sorted.csv', chunksize=1)
+    result = pd.read_csv(tmp_path / 'sorted.csv', parse_dates=['at'])
+    assert list(result['at']) == list(expected['at'])
+
+def test_clean_text_series_matches_clean_text():
+    """Ensure the vectorized cleaner gives the same output as the per-row one"""
+    from preprocess import clean_text, clean_text_series
+
+    texts = pd.Series(['Great App!!', None, '  OTP not\tworking  ', 'ምንም የማይ ሰራ', 42, ''], dtype=object)
+    assert clean_text_series(texts).tolist() == [clean_text(t) for t in texts]
+
+
+def test_analysis_import_is_lazy():
+    """Ensure importing analysis does not pull in NLTK, transformers or torch"""
+    code = (
+        "import sys, analysis; "
+        "print(sorted(m for m in ('nltk', 'transformers', 'torch', 'sklearn') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+def test_bulk_load_is_idempotent(tmp_path):
+    """Ensure reruns of the loader skip known reviews and only update changed ones"""
+    from sqlalchemy import create_engine, text
+    from database import load_reviews
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'reviews.db'}")
+    df = pd.DataFrame({
+        'bank_name': ['CBE', 'Amole', 'BOA', 'Unknown'],
+        'content': ['Great app', 'OTP never arrives', 'Great app', 'Hello'],
+        'score': [5, 1, 4, 3],
+        'at': ['2025-01-01 10:00:00', '2025-01-02 11:00:00', '2025-01-01 10:00:00', '2025-01-03 09:00:00'],
+        'sentiment_label': ['POSITIVE', 'NEGATIVE', 'POSITIVE', 'NEUTRAL'],
+        'sentiment_score': [0.99, 0.98, 0.97, 0.5],
+        'source': 'Google Play',
+    })
+
+    first = load_reviews(engine, df.copy())
+    assert (first['inserted'], first['updated'], first['skipped']) == (3, 0, 0)
+
+    second = load_reviews(engine, df.copy())
+    assert (second['inserted'], second['updated'], second['skipped']) == (0, 0, 3)
+
+    df.loc[1, 'sentiment_label'] = 'NEUTRAL'
+    third = load_reviews(engine, df.copy())
+    assert (third['inserted'], third['updated'], third['skipped']) == (0, 1, 2)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM reviews")).scalar() == 3
+        assert conn.execute(text("SELECT COUNT(*) FROM banks")).scalar() == 3
+
+def test_load_marker_notices_a_wiped_database(tmp_path):
+    """Ensure the load marker only matches while the database still holds the loaded reviews"""
+    from sqlalchemy import create_engine, text
+    from database import load_reviews, write_load_marker, load_is_current, BANKS_DATA
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'reviews.db'}")
+    marker = str(tmp_path / 'db_load.json')
+    banks = BANKS_DATA['bank_name']
+    assert not load_is_current(engine, banks, marker)
+
+    df = pd.DataFrame({'bank_name': ['CBE', 'BOA'], 'content': ['Great app', 'Slow login'], 'score': [5, 2],
+                       'at': ['2025-01-01 10:00:00', '2025-01-02 08:00:00']})
+    load_reviews(engine, df)
+    assert write_load_marker(engine, banks, marker) == 2
+    assert load_is_current(engine, banks, marker)
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM reviews"))
+    assert not load_is_current(engine, banks, marker)
+
+def test_bulk_load_rerun_skips_undated_reviews(tmp_path):
+    """Ensure reviews without a date are left out instead of piling up on every rerun"""
+    from sqlalchemy import create_engine, text
+    from database import load_reviews
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'reviews.db'}")
+    df = pd.DataFrame({
+        'bank_name': ['CBE', 'CBE', 'BOA'],
+        'content': ['Great app', 'No date here', 'Slow login'],
+        'score': [5, 3, 2],
+        'at': ['2025-01-01 10:00:00', None, '2025-01-02 08:00:00'],
+        'sentiment_label': ['POSITIVE', 'NEUTRAL', 'NEGATIVE'],
+    })
+
+    for _ in range(2):
+        stats = load_reviews(engine, df.copy())
+    assert (stats['inserted'], stats['skipped']) == (0, 2)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM reviews")).scalar() == 2
+        assert conn.execute(text("SELECT COUNT(*) FROM reviews WHERE review_date IS NULL")).scalar() == 0
+        assert conn.execute(text("SELECT SUM(review_count) FROM daily_sentiment")).scalar() == 2
+
+def test_incremental_scrape_stops_at_high_water_mark():
+    """Ensure incremental paging keeps only reviews newer than the last run"""
+    from datetime import datetime
+    from scraper import split_new_reviews, new_high_water_mark
+
+    previous = pd.DataFrame({
+        'review_id': ['r1', 'r2', 'r3'],
+        'at': [datetime(2025, 1, 3), datetime(2025, 1, 3), datetime(2025, 1, 1)],
+    })
+    mark = new_high_water_mark(previous)
+    assert mark['last_at'] == '2025-01-03T00:00:00'
+    assert sorted(mark['boundary_ids']) == ['r1', 'r2']
+
+    page = [
+        {'reviewId': 'r5', 'at': datetime(2025, 1, 4)},
+        {'reviewId': 'r4', 'at': datetime(2025, 1, 3)},
+        {'reviewId': 'r2', 'at': datetime(2025, 1, 3)},
+        {'reviewId': 'r1', 'at': datetime(2025, 1, 3)},
+    ]
+    fresh, reached_known = split_new_reviews(page, mark)
+    assert [r['reviewId'] for r in fresh] == ['r5', 'r4']
+    assert reached_known
+    assert split_new_reviews(page, None) == (page, False)
+
+def test_incremental_scrape_pages_past_target_count_to_last_run():
+    """Ensure an incremental scrape keeps paging until the old high-water mark, not just target_count reviews"""
+    from datetime import datetime, timedelta
+    from scraper import scrape_reviews, new_high_water_mark
+
+    store = [{'reviewId': f"r{i}", 'content': f"review {i}", 'score': 4,
+              'at': datetime(2025, 3, 1) - timedelta(hours=i), 'thumbsUpCount': 0}
+             for i in range(1000)]
+
+    def fake_fetch(app_id, continuation_token=None, count=200, **kwargs):
+        offset = continuation_token or 0
+        page = store[offset:offset + count]
+        return page, offset + len(page)
+
+    mark = new_high_water_mark(pd.DataFrame({'review_id': ['r700'], 'at': [store[700]['at']]}))
+    df, complete = scrape_reviews('CBE', 'cbe.app', target_count=100, since=mark, fetch=fake_fetch)
+    assert complete
+    assert len(df) == 700 and df['review_id'].is_unique
+    assert new_high_water_mark(df, mark)['last_at'] == store[0]['at'].isoformat()
+
+def test_concurrent_scrape_resumes_from_checkpoint(tmp_path):
+    """Ensure a scrape that fails after retries resumes from its checkpoint instead of starting over"""
+    from datetime import datetime, timedelta
+    from scraper import ScrapeCheckpoint, scrape_all
+
+    calls = []
+
+    def fake_fetch(app_id, continuation_token=None, count=200, fail_after=None, **kwargs):
+        offset = continuation_token or 0
+        calls.append((app_id, offset))
+        if fail_after is not None and offset >= fail_after:
+            raise ConnectionError("store unavailable")
+        page = [{'reviewId': f"{app_id}-{i}", 'content': f"review {i}", 'score': 5,
+                 'at': datetime(2025, 1, 1) - timedelta(minutes=i), 'thumbsUpCount': 0}
+                for i in range(offset, min(offset + count, 500))]
+        return page, offset + len(page)
+
+    apps = {'CBE': 'cbe.app', 'BOA': 'boa.app'}
+    checkpoint = ScrapeCheckpoint(str(tmp_path / 'checkpoint.pkl'))
+
+    def flaky(app_id, **kwargs):
+        return fake_fetch(app_id, fail_after=200 if app_id == 'boa.app' else None, **kwargs)
+
+    first = scrape_all(apps, target_count=500, fetch=flaky, rate=1000, checkpoint=checkpoint,
+                       max_retries=2, base_delay=0)
+    assert first['CBE'][1] and not first['BOA'][1]
+    assert calls.count(('boa.app', 200)) == 3  # first try + 2 retries
+
+    calls.clear()
+    resumed = ScrapeCheckpoint(str(tmp_path / 'checkpoint.pkl'))
+    second = scrape_all(apps, target_count=500, fetch=fake_fetch, rate=1000, checkpoint=resumed)
+    assert all(complete for _, complete in second.values())
+    assert len(second['BOA'][0]) == 500 and second['BOA'][0]['review_id'].is_unique
+    assert sorted(calls) == [('boa.app', 200), ('boa.app', 400)]
+
+    # The checkpoint log holds every review once (one record per page), not a copy per page,
+    # and a record cut short by a crash loses only its own page
+    import pickle
+    path = str(tmp_path / 'checkpoint.pkl')
+    with open(path, 'rb') as f:
+        records = []
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+    assert sum(len(r['reviews']) for r in records if r['app_id'] == 'boa.app') == 500
+    with open(path, 'ab') as f:
+        f.write(pickle.dumps({'app_id': 'boa.app', 'token': 600, 'reviews': [{}] * 50, 'done': False})[:-10])
+    assert len(ScrapeCheckpoint(path).get('boa.app')['reviews']) == 500
+
+def test_parquet_storage_roundtrip_and_pushdown(tmp_path):
+    """Ensure Parquet datasets keep types and support column/predicate pushdown"""
+    pytest.importorskip('pyarrow')
+    from storage import read_reviews, write_reviews, iter_reviews
+
+    df = pd.DataFrame({
+        'content': ['good', 'otp fails', 'slow', 'nice'],
+        'score': [5, 1, 2, 4],
+        'at': ['2025-01-05 10:00:00', '2025-02-01 09:00:00', '2025-02-03 08:00:00', '2025-01-20 12:00:00'],
+        'bank_name': ['CBE', 'CBE', 'BOA', 'Dashen'],
+        'sentiment_label': ['POSITIVE', 'NEGATIVE', 'NEGATIVE', 'POSITIVE'],
+    })
+    path = tmp_path / 'reviews_parquet'
+    write_reviews(df.iloc[:2], path)
+    write_reviews(df.iloc[2:], path, append=True)
+
+    loaded = read_reviews(path)
+    assert len(loaded) == 4 and 'month' not in loaded.columns
+    assert str(loaded['at'].dtype).startswith('datetime64')
+    assert loaded['sentiment_label'].dtype.name == 'category'
+
+    neg = read_reviews(path, columns=['bank_name', 'content'], filters=[('sentiment_label', '==', 'NEGATIVE')])
+    assert list(neg.columns) == ['bank_name', 'content']
+    assert sorted(neg['content']) == ['otp fails', 'slow']
+    assert sum(len(c) for c in iter_reviews(path, chunksize=1)) == 4
+
+    # CSV keeps working, with the same projection/filter API applied after parsing
+    df.to_csv(tmp_path / 'reviews.csv', index=False)
+    csv_neg = read_reviews(tmp_path / 'reviews.csv', columns=['content'],
+                           filters=[('sentiment_label', '==', 'NEGATIVE')])
+    assert sorted(csv_neg['content']) == ['otp fails', 'slow']
+
+
+def test_report_cube_matches_raw_aggregations(tmp_path):
+    """Ensure tables derived from the cached cube match the direct pandas aggregations"""
+    from aggregates import load_cube, sentiment_pct_table, pain_point_table
+
+    df = pd.DataFrame({
+        'bank_name': ['CBE', 'CBE', 'CBE', 'BOA', 'BOA', 'Dashen'],
+        'sentiment_label': ['NEGATIVE', 'NEGATIVE', 'POSITIVE', 'NEGATIVE', 'NEUTRAL', 'POSITIVE'],
+        'theme': ['Authentication', 'Performance', 'General', 'Performance', None, 'General'],
+        'score': [1, 2, 5, 1, 3, 4],
+    })
+    path = tmp_path / 'reviews.csv'
+    df.to_csv(path, index=False)
+    cache_dir = tmp_path / 'cache'
+
+    cube = load_cube(path, cache_dir=cache_dir)
+    assert cube['count'].sum() == len(df)
+    expected = pd.crosstab(df['bank_name'], df['sentiment_label'], normalize='index') * 100
+    pd.testing.assert_frame_equal(sentiment_pct_table(cube), expected, check_names=False)
+    neg = df[df['sentiment_label'] == 'NEGATIVE']
+    expected = neg.groupby(['bank_name', 'theme']).size().unstack(fill_value=0)
+    pd.testing.assert_frame_equal(pain_point_table(cube), expected, check_names=False, check_dtype=False)
+
+    # Second load is served from the cache; touching the dataset invalidates it
+    assert len(os.listdir(cache_dir)) == 1
+    pd.testing.assert_frame_equal(load_cube(path, cache_dir=cache_dir), cube, check_dtype=False)
+    df.iloc[:3].to_csv(path, index=False)
+    assert load_cube(path, cache_dir=cache_dir)['count'].sum() == 3
+    assert len(os.listdir(cache_dir)) == 1
+
+    # Another dataset (e.g. an app shard) sharing the cache dir keeps both cubes cached
+    other = tmp_path / 'other.csv'
+    df.to_csv(other, index=False)
+    assert load_cube(other, cache_dir=cache_dir)['count'].sum() == len(df)
+    assert len(os.listdir(cache_dir)) == 2
+    assert load_cube(path, cache_dir=cache_dir)['count'].sum() == 3
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_visualize_query_layer_aggregates_in_sql(tmp_path):
+    """Ensure chart inputs come back pre-aggregated and negative text streams in chunks"""
+    from sqlalchemy import create_engine
+    from database import load_reviews
+    from visualize import fetch_sentiment_counts, fetch_avg_rating, iter_negative_texts
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'reviews.db'}")
+    load_reviews(engine, pd.DataFrame({
+        'bank_name': ['CBE', 'CBE', 'CBE', 'BOA'],
+        'content': ['OTP never arrives', 'App crashes', 'Great app', 'Slow login'],
+        'score': [1, 2, 5, 2],
+        'at': ['2025-01-01', '2025-01-02', '2025-01-03', '2025-01-04'],
+        'sentiment_label': ['NEGATIVE', 'NEGATIVE', 'POSITIVE', 'NEGATIVE'],
+        'sentiment_score': [0.9, 0.8, 0.99, 0.7],
+        'source': 'Google Play',
+    }))
+
+    with engine.connect() as conn:
+        counts = fetch_sentiment_counts(conn)
+        assert counts.set_index(['bank_name', 'sentiment_label'])['count'].to_dict() == {
+            ('Bank of Abyssinia', 'NEGATIVE'): 1,
+            ('Commercial Bank of Ethiopia', 'NEGATIVE'): 2,
+            ('Commercial Bank of Ethiopia', 'POSITIVE'): 1,
+        }
+        avg = fetch_avg_rating(conn).set_index('bank_name')['rating']
+        assert avg['Commercial Bank of Ethiopia'] == pytest.approx(8 / 3)
+
+        chunks = list(iter_negative_texts(conn, chunksize=2))
+        assert [len(c) for c in chunks] == [2, 1]
+        assert sorted(t for c in chunks for t in c) == ['App crashes', 'OTP never arrives', 'Slow login']
+
+
+def test_daily_rollups_refresh_only_touched_days(tmp_path):
+    """Ensure incremental rollup refreshes match a full rebuild from reviews"""
+    from sqlalchemy import create_engine, text
+    from database import load_reviews, refresh_rollups
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'reviews.db'}")
+    df = pd.DataFrame({
+        'bank_name': ['CBE', 'CBE', 'BOA', 'BOA'],
+        'content': ['OTP fails', 'Great', 'Slow', 'Crash'],
+        'score': [1, 5, 2, 1],
+        'at': ['2025-01-01 08:00:00', '2025-01-01 23:59:59', '2025-01-02 10:00:00', '2025-01-03 10:00:00'],
+        'sentiment_label': ['NEGATIVE', 'POSITIVE', 'NEGATIVE', 'NEGATIVE'],
+        'sentiment_score': 0.9,
+        'theme': ['Authentication', 'General', 'Performance', None],
+        'source': 'Google Play',
+    })
+    assert load_reviews(engine, df.copy())['days_refreshed'] == 3
+
+    # A later load with one changed review and one new one only touches their days
+    update = df.iloc[[0]].assign(sentiment_label='NEUTRAL')
+    new = df.iloc[[2]].assign(content='Login loops')
+    assert load_reviews(engine, pd.concat([update, new]))['days_refreshed'] == 2
+    # Reloading the whole (now unchanged) file touches no day at all
+    current = pd.concat([df.assign(sentiment_label=['NEUTRAL'] + df['sentiment_label'].tolist()[1:]), new])
+    assert load_reviews(engine, current)['days_refreshed'] == 0
+
+    def snapshot(conn):
+        return {t: sorted(conn.execute(text(f"SELECT * FROM {t}")).fetchall())
+                for t in ('daily_sentiment', 'daily_theme', 'daily_rating')}
+
+    with engine.begin() as conn:
+        incremental = snapshot(conn)
+        refresh_rollups(conn)
+        assert snapshot(conn) == incremental
+
+    sentiment = {(r[1], r[2]): r[3] for r in incremental['daily_sentiment']}
+    assert sentiment[('2025-01-01', 'NEUTRAL')] == 1 and ('2025-01-01', 'NEGATIVE') not in sentiment
+    assert sum(r[3] for r in incremental['daily_sentiment']) == 5
+    assert ('2025-01-03', 'NEGATIVE', 'Unknown') in {r[1:4] for r in incremental['daily_theme']}
+
+def test_rollup_totals_match_reviews_after_legacy_undated_rows(tmp_path):
+    """Ensure undated reviews from older loads are removed so rollups add up to the reviews table"""
+    from sqlalchemy import create_engine, text
+    from database import load_reviews
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'reviews.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE banks (bank_id INTEGER PRIMARY KEY, bank_name VARCHAR(100) UNIQUE NOT NULL, "
+                          "app_name VARCHAR(100))"))
+        conn.execute(text("CREATE TABLE reviews (review_id INTEGER PRIMARY KEY, bank_id INTEGER, review_text TEXT, "
+                          "rating INTEGER, review_date TIMESTAMP, sentiment_label VARCHAR(50), sentiment_score FLOAT, "
+                          "theme VARCHAR(100), source VARCHAR(50), content_hash CHAR(32))"))
+        conn.execute(text("INSERT INTO banks (bank_id, bank_name) VALUES (1, 'Commercial Bank of Ethiopia')"))
+        conn.execute(text("INSERT INTO reviews (bank_id, review_text, rating, sentiment_label, content_hash) "
+                          "VALUES (1, 'No date', 3, 'NEUTRAL', 'a'), (1, 'No date', 3, 'NEUTRAL', 'a')"))
+
+    df = pd.DataFrame({
+        'bank_name': ['CBE', 'BOA'],
+        'content': ['Great app', 'Slow login'],
+        'score': [5, 2],
+        'at': ['2025-01-01 10:00:00', '2025-01-02 08:00:00'],
+        'sentiment_label': ['POSITIVE', 'NEGATIVE'],
+    })
+    load_reviews(engine, df)
+
+    with engine.connect() as conn:
+        reviews = conn.execute(text("SELECT COUNT(*) FROM reviews")).scalar()
+        for table in ('daily_sentiment', 'daily_theme', 'daily_rating'):
+            assert conn.execute(text(f"SELECT SUM(review_count) FROM {table}")).scalar() == reviews == 2
+
+
+def test_shared_engine_and_batched_integrity_checks(tmp_path):
+    """Ensure stages share one lazily built engine and verify_db checks in a single query"""
+    from sqlalchemy import text
+    from db import get_engine, engine_options, dispose_engines
+    from database import load_reviews
+    from verify_db import run_checks, verify_data
+
+    url = f"sqlite:///{tmp_path / 'reviews.db'}"
+    engine = get_engine(url)
+    assert get_engine(url) is engine
+    assert engine_options('postgresql://u:p@h/db')['pool_size'] > 0
+
+    load_reviews(engine, pd.DataFrame({
+        'bank_name': ['CBE', 'BOA'], 'content': ['Good', 'Bad'], 'score': [5, 1],
+        'at': ['2025-01-01', '2025-01-02'], 'sentiment_label': ['POSITIVE', 'NEGATIVE'],
+    }))
+    with engine.connect() as conn:
+        assert run_checks(conn) == {'review_count': 2, 'orphan_count': 0, 'invalid_sentiment_count': 0}
+    assert verify_data(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE reviews SET sentiment_label = 'MIXED'"))
+    assert not verify_data(engine)
+    dispose_engines()
+
+
+def test_near_duplicates_collapse_per_bank():
+    """Ensure near-identical reviews of the same bank collapse to one representative"""
+    from preprocess import clean_dataframe
+    from near_duplicates import near_duplicate_mask
+
+    df = pd.DataFrame({
+        'content': ['good app', 'Good app!!', 'GOOD APP', 'good app',
+                    'The transfer failed twice today', 'the transfer failed twice today!!!',
+                    'Worst update ever, login broken', '👍'],
+        'bank_name': ['CBE', 'CBE', 'CBE', 'BOA', 'CBE', 'CBE', 'CBE', 'CBE'],
+        'thumbsUpCount': [0, 7, 1, 0, 3, 0, 0, 0],
+        'score': [5, 5, 5, 5, 1, 1, 1, 5],
+        'at': '2025-01-01',
+    })
+
+    keep, clusters = near_duplicate_mask(df, threshold=0.8)
+    assert keep.tolist() == [True, False, False, True, True, False, True, True]
+    assert sorted(clusters['size']) == [2, 3]
+
+    keep, _ = near_duplicate_mask(df, threshold=0.8, keep_most_upvoted=True)
+    assert keep.tolist() == [False, True, False, True, True, False, True, True]
+
+    assert len(clean_dataframe(df.copy(), near_dup_threshold=0.8)) == 5
+    assert len(clean_dataframe(df.copy())) == 8
+
+def test_near_duplicates_do_not_chain():
+    """Ensure A~B and B~C do not drop C when C is not a near-duplicate of the kept A"""
+    from near_duplicates import near_duplicate_mask
+
+    base = "the app keeps crashing every time i try to transfer money to another account"
+    a, b, c = "honestly now " + base, base, base + " please fix it"
+    df = pd.DataFrame({'content': [a, b, c], 'bank_name': 'CBE'})
+    keep, _ = near_duplicate_mask(df, threshold=0.8)
+    assert keep.tolist() == [True, False, True]
+
+    # With B kept, A and C are both near-duplicates of the representative
+    keep, _ = near_duplicate_mask(df.iloc[[1, 0, 2]].reset_index(drop=True), threshold=0.8)
+    assert keep.tolist() == [True, False, False]
+
+def test_lsh_banding_finds_pairs_at_the_threshold():
+    """Ensure the LSH banding finds pairs at the similarity threshold with high recall"""
+    from near_duplicates import lsh_bands, MIN_RECALL
+
+    for threshold in (0.5, 0.8, 0.9):
+        bands, rows = lsh_bands(threshold, 64)
+        assert bands * rows == 64
+        assert 1 - (1 - threshold ** rows) ** bands >= MIN_RECALL
+    assert lsh_bands(0.8, 64) == (16, 4)
+
+
+def test_tiered_sentiment_routes_only_ambiguous_reviews(tmp_path):
+    """Ensure short decisive reviews skip the model and NEUTRAL comes from the score band"""
+    import json
+    import numpy as np
+    from sentiment import apply_neutral_band
+    from tiered_sentiment import score_tiered, agreement_report, LEXICON_FILE
+
+    texts = ['Nice', 'worst app', 'good 👍', '👍👍', 'not good', 'good but slow',
+             'The app keeps logging me out after the update', 'Great']
+    ratings = [5, 1, 4, 5, 2, 3, 2, 1]
+    calls = []
+
+    def model(batch):
+        calls.extend(batch)
+        return np.array(['NEGATIVE'] * len(batch), dtype=object), np.full(len(batch), 0.6)
+
+    labels, scores, routed = score_tiered(texts, ratings, model)
+    assert calls == ['👍👍', 'not good', 'good but slow', 'The app keeps logging me out after the update', 'Great']
+    assert labels.tolist()[:3] == ['POSITIVE', 'NEGATIVE', 'POSITIVE']
+    assert routed.tolist() == [False] * 3 + [True] * 5
+
+    # Rating-only labels (emoji/Amharic) are opt-in and carry a low confidence
+    with open(LEXICON_FILE, encoding='utf-8') as f:
+        lexicon = dict(json.load(f), rating_only=True)
+    lexicon_path = str(tmp_path / 'lexicon.json')
+    with open(lexicon_path, 'w', encoding='utf-8') as f:
+        json.dump(lexicon, f)
+    calls.clear()
+    labels, scores, routed = score_tiered(texts, ratings, model, lexicon_path)
+    assert labels.tolist()[:4] == ['POSITIVE', 'NEGATIVE', 'POSITIVE', 'POSITIVE']
+    assert scores[3] == 0.5 and scores[0] == 0.99
+    assert routed.tolist() == [False] * 4 + [True] * 4
+
+    assert apply_neutral_band(labels, scores, 0.75).tolist()[4:] == ['NEUTRAL'] * 4
+    assert apply_neutral_band(labels, scores).tolist() == labels.tolist()
+
+    report = agreement_report(labels, ['POSITIVE', 'NEGATIVE', 'POSITIVE', 'NEGATIVE'] + ['NEGATIVE'] * 4, routed)
+    assert report['model_fraction'] == 0.5 and report['fast_path_agreement'] == 0.75
+
+
+def test_sentiment_backend_selection(monkeypatch):
+    """Ensure the backend comes from config and each non-baseline backend caches separately"""
+    from sentiment import sentiment_backend, cache_model_id, MODEL_NAME
+
+    monkeypatch.delenv('SENTIMENT_BACKEND', raising=False)
+    assert sentiment_backend() == 'torch'
+    monkeypatch.setenv('SENTIMENT_BACKEND', 'ONNX')
+    assert sentiment_backend() == 'onnx'
+    assert sentiment_backend('quantized') == 'quantized'
+    with pytest.raises(ValueError):
+        sentiment_backend('tensorrt')
+
+    assert cache_model_id(MODEL_NAME, 'torch') == MODEL_NAME
+    assert cache_model_id(MODEL_NAME) != cache_model_id(MODEL_NAME, 'quantized') != MODEL_NAME
+
+
+def test_synthetic_corpus_and_regression_check():
+    """Ensure synthetic corpora are reproducible and slower stages are flagged"""
+    from synthetic import make_reviews
+    from benchmark import compare_results
+
+    df = make_reviews(2000, seed=1)
+    assert len(df) == 2000 and list(df.columns) == ['content', 'score', 'at', 'thumbsUpCount',
+                                                    'bank_name', 'source', 'review_id']
+    pd.testing.assert_frame_equal(df, make_reviews(2000, seed=1))
+    assert set(df['bank_name']) == {'CBE', 'BOA', 'Dashen'} and df['content'].isna().any()
+
+    baseline = {'results': {'1k': {'clean_text': {'seconds': 1.0}, 'db_load': {'seconds': 0.01},
+                                   'lemmatize': {'seconds': 1.0}}}}
+    current = {'results': {'1k': {'clean_text': {'seconds': 1.5}, 'db_load': {'seconds': 0.03},
+                                  'lemmatize': {'skipped': 'no NLTK data'}}}}
+    assert compare_results(current, baseline, threshold=0.2) == [('1k', 'clean_text', 1.0, 1.5)]
+    assert compare_results(current, baseline, threshold=0.6) == []
+
+
+def test_metrics_run_record(tmp_path, capsys):
+    """Ensure stage timers and counters end up in one JSON-lines record per run"""
+    import metrics
+    from preprocess import clean_dataframe
+
+    path = str(tmp_path / 'runs.jsonl')
+    df = pd.DataFrame({'content': ['Good', 'Good', None], 'score': [5, 5, 1],
+                       'at': ['2025-01-01'] * 3, 'bank_name': ['CBE'] * 3})
+
+    @metrics.timed_stage('clean')
+    def clean(frame):
+        return clean_dataframe(frame)
+
+    clean(df)  # no active run: a no-op
+    with metrics.run('test', path=path):
+        clean(df)
+        with metrics.stage('load', bank='CBE'):
+            metrics.count('db.rows_inserted', 1)
+    with pytest.raises(ZeroDivisionError):
+        with metrics.run('test', path=path, report=False):
+            1 / 0
+
+    runs = metrics.load_runs(path, last=5)
+    assert [r['status'] for r in runs] == ['ok', 'failed']
+    assert runs[0]['stages']['clean']['calls'] == 1 and 'load{bank=CBE}' in runs[0]['stages']
+    assert runs[0]['counters'] == {'clean.dropped_missing': 1, 'clean.dropped_duplicates': 1,
+                                   'db.rows_inserted': 1}
+    metrics.print_breakdown(runs)
+    assert 'clean.dropped_duplicates' in capsys.readouterr().out
+
+
+def test_pipeline_runner_skips_unchanged_stages(tmp_path):
+    """Ensure only stages downstream of a changed input rerun, and independent ones both run"""
+    from run_pipeline import run_pipeline, select_stages
+
+    raw = tmp_path / 'raw.csv'
+    raw.write_text('content\nGood app\n')
+    stages = {
+        'analyze': {'script': 'analysis.py', 'deps': [], 'inputs': [str(raw)]},
+        'load': {'script': 'database.py', 'deps': ['analyze']},
+        'evidence': {'script': 'generate_evidence.py', 'deps': ['analyze']},
+        'charts': {'script': 'visualize.py', 'deps': ['load']},
+    }
+    calls = []
+
+    def runner(name, spec):
+        calls.append(name)
+        return 1 if name == 'load' and fail else 0
+
+    state = str(tmp_path / 'state.json')
+    fail = False
+    assert set(run_pipeline(stages, list(stages), state, runner=runner).values()) == {'ran'}
+    assert calls[0] == 'analyze' and sorted(calls[1:3]) == ['evidence', 'load'] and calls[3] == 'charts'
+
+    calls.clear()
+    assert set(run_pipeline(stages, list(stages), state, runner=runner).values()) == {'skipped'}
+    assert calls == []
+
+    raw.write_text('content\nGood app\nBad app\n')
+    fail = True
+    results = run_pipeline(stages, list(stages), state, runner=runner)
+    assert results == {'analyze': 'ran', 'load': 'failed', 'evidence': 'ran', 'charts': 'blocked'}
+
+    fail = False
+    calls.clear()
+    run_pipeline(stages, list(stages), state, runner=runner)
+    assert calls == ['load', 'charts']
+
+    assert select_stages(stages, start='load') == ['load', 'charts']
+    assert select_stages(stages, only=['evidence']) == ['evidence']
+
+    # A stage with a probe reruns when its output outside the repo is gone (e.g. a wiped database)
+    stages['load']['probe'] = ['--check']
+    calls.clear()
+    run_pipeline(stages, list(stages), state, runner=runner, prober=lambda name, spec: 0)
+    assert calls == []
+    run_pipeline(stages, list(stages), state, runner=runner, prober=lambda name, spec: 1)
+    assert calls == ['load']
+
+
+def test_review_index_queries_and_incremental_add(tmp_path, monkeypatch):
+    """Ensure index queries match a brute-force scan, also after an incremental add and reload"""
+    import numpy as np
+    import review_index
+    from review_index import ReviewIndex, vbyte_encode, vbyte_decode
+
+    values = np.array([0, 1, 127, 128, 300, 2**21, 2**35])
+    assert (vbyte_decode(vbyte_encode(values)[0]) == values).all()
+    monkeypatch.setattr(review_index, 'normalize_terms', lambda words: [w.lower() for w in words])
+
+    df = pd.DataFrame({
+        'review_id': ['r0', 'r1', 'r2', 'r3', 'r4'],
+        'lemmatized_content': ['otp code never arrives', 'money transfer failed otp', 'great app',
+                               'transfer money later', None],
+        'bank_name': ['CBE', 'CBE', 'BOA', 'CBE', 'BOA'],
+        'sentiment_label': ['NEGATIVE', 'NEGATIVE', 'POSITIVE', 'NEGATIVE', 'POSITIVE'],
+        'theme': ['Authentication', 'Transactions', 'General', 'Transactions', 'General'],
+        'at': ['2025-01-01', '2025-02-01', '2025-02-02', '2025-03-01', '2025-03-02'],
+        'score': [1, 1, 5, 2, 5],
+    })
+    index = ReviewIndex()
+    assert index.add(df.iloc[:3]) == (3, 0)
+    assert index.add(df.iloc[2:]) == (2, 1)
+
+    def ids(docs):
+        return index.frame(docs)['review_id'].tolist()
+
+    assert ids(index.search('otp')) == ['r0', 'r1']
+    assert ids(index.search('"money transfer"')) == ['r1']
+    assert ids(index.search('money transfer')) == ['r1', 'r3']
+    assert ids(index.search('(otp OR great) -failed', bank=['CBE', 'BOA'])) == ['r0', 'r2']
+    assert ids(index.search('', sentiment='NEGATIVE', since='2025-02-01')) == ['r1', 'r3']
+    assert ids(index.search('transfer', bank='Dashen')) == []
+    with pytest.raises(ValueError):
+        index.search('(otp')
+
+    index.save(str(tmp_path / 'index'))
+    index = ReviewIndex.load(str(tmp_path / 'index'))
+    assert index.add(pd.DataFrame({'review_id': ['r5'], 'lemmatized_content': ['otp again'],
+                                   'bank_name': ['Dashen'], 'at': ['2025-04-01'], 'score': [1]})) == (1, 0)
+    assert ids(index.search('otp')) == ['r0', 'r1', 'r5']
+    assert index.frame([5])['bank_name'].tolist() == ['Dashen']
+
+
+def test_trend_counts_incremental_and_spike_alerts(tmp_path):
+    """Ensure incremental daily counts match a full recount and a login spike is flagged"""
+    import numpy as np
+    from trends import TrendCounts, rolling
+
+    days = pd.date_range('2025-01-01', periods=60, freq='D')
+    rows = []
+    for i, day in enumerate(days):
+        # Two negative Performance reviews a day; a burst of login complaints on day 50
+        rows += [{'at': day, 'bank_name': 'CBE', 'sentiment_label': 'NEGATIVE', 'theme': 'Performance', 'score': 1}] * 2
+        rows += [{'at': day, 'bank_name': 'BOA', 'sentiment_label': 'POSITIVE', 'theme': 'General', 'score': 5}]
+        if i == 50:
+            rows += [{'at': day, 'bank_name': 'CBE', 'sentiment_label': 'NEGATIVE', 'theme': 'Authentication', 'score': 1}] * 12
+    df = pd.DataFrame(rows)
+    df['review_id'] = [f"r{i}" for i in range(len(df))]
+
+    full = TrendCounts()
+    assert full.add(df) == len(df)
+    incremental = TrendCounts()
+    incremental.add(df.iloc[:100])
+    incremental.save(str(tmp_path))
+    incremental = TrendCounts.load(str(tmp_path))
+    assert incremental.add(df) == len(df) - 100
+    assert incremental.add(df) == 0
+    cbe = incremental.banks.index('CBE')
+    for name in full.series:
+        assert (incremental.series_counts(name) == full.series_counts(name)).all()
+    assert incremental.series_counts('theme:Performance')[cbe].sum() == 120
+
+    assert (rolling(np.array([[1, 2, 3, 4]]), 2) == [[1, 3, 5, 7]]).all()
+    assert (rolling(np.array([[1, 2, 3, 4]]), 1) == [[1, 2, 3, 4]]).all()
+    alerts = full.alerts()
+    assert set(zip(alerts['bank_name'], alerts['series'])) == {('CBE', 'sentiment:NEGATIVE'),
+                                                                ('CBE', 'theme:Authentication')}
+    assert (alerts['date'] == days[50]).all()
+
+
+def test_topic_model_resumes_and_suggests_keywords(tmp_path):
+    """Ensure the online topic model separates two complaint topics, resumes and suggests keywords"""
+    from topics import TopicModel, suggest_keywords, topic_report
+
+    fee = ['hidden fee charge deducted', 'service charge fee too high', 'fee charge every transfer'] * 10
+    login = ['login otp never arrive', 'cannot login otp expired', 'otp code login fail'] * 10
+    # Interleaved, as an online model only finds topics present in its first chunks
+    df = pd.DataFrame({'lemmatized_content': [t for pair in zip(fee, login) for t in pair],
+                       'review_id': [f"r{i}" for i in range(60)], 'bank_name': ['CBE', 'CBE', 'BOA', 'BOA'] * 15,
+                       'theme': ['General', 'Authentication'] * 30})
+    chunks = [(df['lemmatized_content'].to_numpy(dtype=object)[i:i + 20], df['review_id'].to_numpy(dtype=object)[i:i + 20])
+              for i in range(0, 60, 20)]
+    state = str(tmp_path / 'state.pkl')
+
+    model = TopicModel('nmf', n_topics=2)
+    assert model.fit_chunks(chunks[:2], path=state) == 40
+    model = TopicModel.load(state)
+    assert model.fit_chunks(chunks, path=state) == 20
+    assert model.fit_chunks(chunks) == 0
+
+    topics = [set(terms[:3]) for terms in model.top_terms(5)]
+    assert any('fee' in t and 'otp' not in t for t in topics)
+    assert any('otp' in t and 'fee' not in t for t in topics)
+
+    report, theme_table = topic_report(model, [(df['lemmatized_content'].to_numpy(dtype=object),
+                                                df['bank_name'].to_numpy(dtype=object),
+                                                df['theme'].to_numpy(dtype=object))])
+    assert set(report['bank_name']) == {'CBE', 'BOA'} and len(report) == 4
+    suggestions = suggest_keywords(model, theme_table)
+    assert list(suggestions.columns) == ['topic', 'theme', 'share', 'suggested_keywords', 'top_terms']
+    assert 'new cluster (General)' in set(suggestions['theme'])
+    with pytest.raises(ValueError):
+        TopicModel('kmeans')
+
+
+def test_app_registry_resolves_aliases_and_shards(tmp_path):
+    """Ensure the app registry maps aliases to banks in one pass and shards stages per app"""
+    import json
+    from registry import app_packages, banks_frame, canonical_banks, resolve, select_apps, shard_path
+    from run_pipeline import STAGES, shard_stages
+
+    apps = [
+        {'key': 'CBE', 'app_id': 'cbe.app', 'bank': 'Commercial Bank of Ethiopia', 'app_name': 'CBE Mobile'},
+        {'key': 'Tele', 'app_id': 'tele.app', 'bank': 'Ethio Telecom', 'app_name': 'telebirr',
+         'aliases': ['Telebirr SuperApp']},
+    ]
+    path = str(tmp_path / 'apps.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'apps': apps}, f)
+
+    names = pd.Series(['CBE', 'telebirr superapp', 'Unknown', None, 'cbe mobile'], dtype='category')
+    assert canonical_banks(names, path).tolist()[:3] == ['Commercial Bank of Ethiopia', 'Ethio Telecom', 'Unknown']
+    assert resolve(names, 'key', path).tolist()[4] == 'CBE'
+    assert app_packages(['telebirr'], path) == {'Tele': 'tele.app'}
+    assert banks_frame(path=path)['bank_name'].tolist() == ['Commercial Bank of Ethiopia', 'Ethio Telecom']
+    with pytest.raises(ValueError):
+        select_apps(['Dashen'], path)
+
+    # Bank and app names are kept out of the topics, whichever apps are registered
+    from registry import name_terms
+    from topics import make_vectorizer
+    assert {'ethio', 'telecom', 'telebirr', 'superapp', 'cbe'} <= set(name_terms(path))
+    assert {'cbe', 'dashen', 'amole', 'abyssinia'} <= set(make_vectorizer().stop_words)
+
+    # The default registry still covers the names the loader used to map by hand
+    assert canonical_banks(['Amole', 'BoA', 'Dashen Bank Sc']).tolist() == [
+        'Dashen Bank', 'Bank of Abyssinia', 'Dashen Bank']
+
+    assert shard_path('data/raw/raw_reviews.csv', 'CBE') == os.path.join('data/raw', 'apps', 'CBE', 'raw_reviews.csv')
+    stages = shard_stages(STAGES, 'CBE')
+    assert 'charts' not in stages and 'verify' not in stages
+    assert stages['index']['args'] == ['--app', 'CBE', 'build']
+    assert stages['load']['deps'] == ['analyze']
+    assert stages['trends']['inputs'][0].startswith(os.path.join('data/processed', 'apps', 'CBE'))
+    assert 'config/themes.json' in stages['analyze']['inputs']
+
+
+def test_trend_counts_late_reviews_and_label_changes():
+    """Ensure a second bank's older reviews are counted after newer ones and relabeled reviews move"""
+    from trends import TrendCounts
+
+    trends = TrendCounts()
+    newer = pd.DataFrame({'review_id': ['c1'], 'at': ['2025-03-01'], 'bank_name': ['CBE'],
+                          'sentiment_label': ['POSITIVE'], 'theme': ['General'], 'score': [5]})
+    older = pd.DataFrame({'review_id': ['t1', 't2'], 'at': ['2025-01-01', '2025-01-02'], 'bank_name': ['Tele'] * 2,
+                          'sentiment_label': ['NEGATIVE'] * 2, 'theme': ['Transactions'] * 2, 'score': [1, 1]})
+    assert trends.add(newer) == 1
+    assert trends.add(pd.concat([newer, older])) == 2
+    tele = trends.banks.index('Tele')
+    assert trends.series_counts('sentiment:NEGATIVE')[tele].sum() == 2
+    assert trends.dates[0] == pd.Timestamp('2025-01-01')
+
+    relabeled = older.assign(sentiment_label=['NEGATIVE', 'POSITIVE'])
+    assert trends.add(relabeled) == 1
+    assert trends.add(relabeled) == 0
+    assert trends.series_counts('sentiment:NEGATIVE')[tele].sum() == 1
+    assert trends.series_counts('sentiment:POSITIVE')[tele].sum() == 1
+    assert trends.series_counts('theme:Transactions')[tele].sum() == 1
+    assert trends.counts.sum() == 3 * 2 + 1  # 3 reviews x (sentiment, rating) + 1 negative theme
+
+
+class FakeTokenizer:
+    """Word-count tokenizer standing in for the transformers one in sentiment tests."""
+
+    def __call__(self, texts, truncation=True, max_length=512):
+        return {'input_ids': [[99 if w == 'boom' else len(w) for w in t.split()][:max_length] for t in texts]}
+
+    def pad(self, features, return_tensors='pt'):
+        import torch
+
+        width = max(len(f['input_ids']) for f in features)
+        ids = [f['input_ids'] + [0] * (width - len(f['input_ids'])) for f in features]
+        mask = [[1] * len(f['input_ids']) + [0] * (width - len(f['input_ids'])) for f in features]
+        return {'input_ids': torch.tensor(ids), 'attention_mask': torch.tensor(mask)}
+
+
+class FakeModel:
+    """Scores a review from its word lengths; padding doesn't change the result. 'boom' fails the batch."""
+
+    class config:
+        id2label = {0: 'NEGATIVE', 1: 'POSITIVE'}
+
+    def __call__(self, input_ids, attention_mask):
+        import torch
+        from types import SimpleNamespace
+
+        if (input_ids == 99).any():
+            raise RuntimeError("boom")
+        # Mean word length above or below 4.5 letters
+        signal = (input_ids * attention_mask).sum(dim=1).float() / attention_mask.sum(dim=1) - 4.5
+        return SimpleNamespace(logits=torch.stack([torch.zeros_like(signal), signal], dim=1))
+
+
+def fake_loader(model_name, revision, backend, threads=None):
+    return FakeTokenizer(), FakeModel()
+
+
+@pytest.fixture
+def fake_sentiment_model(monkeypatch):
+    import sentiment
+
+    monkeypatch.setitem(sentiment._TOKENIZERS, ('fake', 'main'), FakeTokenizer())
+    monkeypatch.setitem(sentiment._MODELS, ('fake', 'main', 'torch'), FakeModel())
+    return sentiment
+
+
+def test_batched_sentiment_matches_per_text_scoring(fake_sentiment_model):
+    """Ensure length-bucketed batches score like one text at a time, in input order, and fail per batch"""
+    sentiment = fake_sentiment_model
+    texts = ['ok', 'the app keeps crashing after every single update', 'good', 'slow login today',
+             'transfer failed twice', 'I love the new design a lot', 'fine']
+    labels, scores = sentiment.score_texts(texts, model_name='fake', batch_size=2, backend='torch')
+    for i, text in enumerate(texts):
+        label, score = sentiment.score_texts([text], model_name='fake', backend='torch')
+        assert labels[i] == label[0] and abs(scores[i] - score[0]) < 1e-6
+    assert len(set(labels)) == 2
+
+    # A failing batch falls back to NEUTRAL/0.5; the other batches are unaffected
+    labels_with_failure, scores_with_failure = sentiment.score_texts(
+        texts + ['boom boom'], model_name='fake', batch_size=2, backend='torch')
+    failed = labels_with_failure == 'NEUTRAL'
+    assert failed[-1] and scores_with_failure[-1] == 0.5 and failed.sum() == 2
+    assert (labels_with_failure[:-1][~failed[:-1]] == labels[~failed[:-1]]).all()
+
+
+def test_parallel_sentiment_matches_serial(fake_sentiment_model, monkeypatch):
+    """Ensure scoring in worker processes gives the serial labels and (near-)identical scores"""
+    import functools
+    import numpy as np
+
+    sentiment = fake_sentiment_model
+    # Spawned workers can't see the fixture's caches, so they load the fake model themselves
+    monkeypatch.setattr(sentiment, '_score_parallel',
+                        functools.partial(sentiment._score_parallel, loader=fake_loader))
+    texts = [f"review {'word ' * (i % 7)}number {i}" for i in range(40)] + ['ok', 'terrible terrible app']
+    serial = sentiment.score_texts(texts, model_name='fake', batch_size=4, backend='torch')
+    parallel = sentiment.score_texts(texts, model_name='fake', batch_size=4, workers=2, backend='torch')
+    assert (parallel[0] == serial[0]).all()
+    assert np.allclose(parallel[1], serial[1], rtol=0, atol=1e-6)